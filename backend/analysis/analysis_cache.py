@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+class AnalysisResultCache:
+    """
+    LRU cache of /get-analysis-data results keyed by (file_id, start_date, end_date, dimension filters).
+    Each entry only depends on the rows inside its date window, so when new months are appended
+    to a file only the entries whose window covers an appended date are dropped.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # (file_id, start, end, filters) -> result dict
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_key(file_id, start_date=None, end_date=None, filters=None):
+        """
+        start_date/end_date bound the window as [start, end); None means unbounded.
+        filters ({column: [values]}) narrow the rows further and only affect the key.
+        """
+        return (file_id,
+                pd.Timestamp(start_date).isoformat() if start_date is not None else None,
+                pd.Timestamp(end_date).isoformat() if end_date is not None else None,
+                tuple(sorted((column, tuple(sorted(map(str, values)))) for column, values in (filters or {}).items())))
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def set(self, key, result):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_dates(self, file_id, dates):
+        """Drops the file's entries whose window contains any of the given dates. Returns how many were dropped."""
+        dates = [pd.Timestamp(d) for d in dates]
+        with self._lock:
+            stale_keys = []
+            for key in self._entries:
+                if key[0] != file_id:
+                    continue
+                start = pd.Timestamp(key[1]) if key[1] is not None else None
+                end = pd.Timestamp(key[2]) if key[2] is not None else None
+                if any((start is None or d >= start) and (end is None or d < end) for d in dates):
+                    stale_keys.append(key)
+            for key in stale_keys:
+                del self._entries[key]
+            self.invalidations += len(stale_keys)
+            return len(stale_keys)
+
+    def invalidate_file(self, file_id):
+        with self._lock:
+            stale_keys = [key for key in self._entries if key[0] == file_id]
+            for key in stale_keys:
+                del self._entries[key]
+            self.invalidations += len(stale_keys)
+            return len(stale_keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,129 @@
+"""
+Anomaly detection over every partner and every country monthly series of a metric at once.
+
+The rows are summed into a dense series x month matrix (a partner-month without a row counts as
+zero, like everywhere else), and each series is scored with numpy along the month axis:
+  outliers: robust z-score of each month against the series' median, scaled by its MAD
+            (1.4826 * MAD, or 1.2533 * mean absolute deviation when the MAD is zero, as for
+            series that are zero most months)
+  jumps:    the same robust z-score applied to the month-over-month changes
+A cell is anomalous when the absolute score reaches the threshold (3.5 is the usual cut-off for
+the modified z-score).
+"""
+import numpy as np
+import pandas as pd
+
+from backend.utils.metrics import time_stage
+from backend.utils.metric_dtypes import widen_metric_dtypes
+
+SERIES_LEVELS = {'partner': ['Partner ID', 'Country', 'Region'], 'country': ['Country']}
+MAD_SCALE = 1.4826 # MAD -> standard deviation for normal data
+MEAN_AD_SCALE = 1.2533 # Mean absolute deviation -> standard deviation for normal data
+
+
+def monthly_matrix(df, keys, metric, month_codes, month_count):
+    """
+    (series keys DataFrame, values array of series x months) with the metric summed per series
+    and month; months without rows are zero. month_codes maps each row to its month's column.
+    """
+    series_codes = df.groupby(keys, sort=True, observed=True).ngroup().to_numpy()
+    keep = series_codes >= 0 # rows with a missing key belong to no series
+    series_codes, month_codes = series_codes[keep], month_codes[keep]
+    series_count = int(series_codes.max()) + 1 if len(series_codes) else 0
+    _, first_rows = np.unique(series_codes, return_index=True)
+    values = np.nan_to_num(df[metric].to_numpy(dtype=np.float64, na_value=np.nan)[keep])
+    matrix = np.bincount(series_codes * month_count + month_codes, weights=values,
+                         minlength=series_count * month_count).reshape(series_count, month_count)
+    return df[keys][keep].iloc[first_rows].reset_index(drop=True), matrix
+
+
+def robust_scores(matrix):
+    """Robust z-scores of every value against its row, and the row medians."""
+    median = np.median(matrix, axis=1, keepdims=True)
+    deviation = np.abs(matrix - median)
+    mad = np.median(deviation, axis=1, keepdims=True)
+    scale = np.where(mad > 0, MAD_SCALE * mad, MEAN_AD_SCALE * deviation.mean(axis=1, keepdims=True))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(scale > 0, (matrix - median) / scale, 0.0)
+    return scores, median[:, 0]
+
+
+def _top_cells(scores, flagged, top_n):
+    """(row, column) of the top_n flagged cells by absolute score."""
+    rows, columns = np.nonzero(flagged)
+    order = np.argsort(-np.abs(scores[rows, columns]), kind='stable')[:top_n]
+    return rows[order], columns[order]
+
+
+def score_series(keys_frame, months, matrix, z_threshold=3.5, jump_threshold=3.5, min_active_months=3, top_n=20):
+    """
+    Outliers and month-over-month jumps of the rows of matrix. Rows active (non-zero) in fewer
+    than min_active_months months are not scored: a single active month would always stand out.
+    Returns counts plus the top_n anomalies of each kind as records.
+    """
+    scored = (matrix != 0).sum(axis=1) >= min_active_months
+    scores, medians = robust_scores(matrix)
+    outliers = (np.abs(scores) >= z_threshold) & scored[:, None]
+
+    changes = np.diff(matrix, axis=1)
+    if changes.shape[1] >= 2:
+        change_scores, _ = robust_scores(changes)
+    else:
+        change_scores = np.zeros_like(changes)
+    jumps = (np.abs(change_scores) >= jump_threshold) & (changes != 0) & scored[:, None]
+
+    outlier_cells = _top_cells(scores, outliers, top_n)
+    jump_cells = _top_cells(change_scores, jumps, top_n)
+    rows = np.concatenate([outlier_cells[0], jump_cells[0]])
+    keys = dict(zip(rows.tolist(), keys_frame.iloc[rows].to_dict(orient='records')))
+    outlier_records = []
+    for row, column in zip(*outlier_cells):
+        outlier_records.append({**keys[row], 'Month': months[column], 'Value': float(matrix[row, column]),
+                                'Expected': float(medians[row]), 'Score': round(float(scores[row, column]), 2),
+                                'Direction': 'spike' if scores[row, column] > 0 else 'drop'})
+    jump_records = []
+    for row, column in zip(*jump_cells):
+        jump_records.append({**keys[row], 'Month': months[column + 1], 'Previous': float(matrix[row, column]),
+                             'Value': float(matrix[row, column + 1]), 'Change': float(changes[row, column]),
+                             'Score': round(float(change_scores[row, column]), 2),
+                             'Direction': 'increase' if changes[row, column] > 0 else 'decrease'})
+    return {
+        'series': int(len(matrix)),
+        'scored_series': int(scored.sum()),
+        'outlier_count': int(outliers.sum()),
+        'jump_count': int(jumps.sum()),
+        'outliers': outlier_records,
+        'jumps': jump_records,
+    }
+
+
+@time_stage("anomalies")
+def detect_anomalies(df, metric='Deriv Revenue', levels=('partner', 'country'), z_threshold=3.5,
+                     jump_threshold=3.5, min_active_months=3, top_n=20):
+    """
+    Scores the monthly series of metric per partner (Partner ID / Country / Region) and per
+    country. Returns {'metric', 'months', 'thresholds', <level>: score_series result} or
+    {'error': ...}; fewer than 3 months of data give no scores.
+    """
+    required = ['Date', metric, *{key for level in levels for key in SERIES_LEVELS[level]}]
+    missing = [col for col in required if col not in df.columns]
+    if missing:
+        return {"error": f"Missing columns for anomaly detection: {missing}"}
+    df = widen_metric_dtypes(df[required])
+    month_codes, month_values = pd.factorize(pd.to_datetime(df['Date']).dt.to_period('M'), sort=True)
+    months = [str(month) for month in month_values]
+    result = {
+        'metric': metric,
+        'months': months,
+        'thresholds': {'z': z_threshold, 'jump': jump_threshold, 'min_active_months': min_active_months},
+    }
+    if len(months) < 3:
+        result['note'] = "At least 3 months of data are needed to score anomalies."
+        return result
+    valid = month_codes >= 0
+    if not valid.all():
+        df, month_codes = df[valid], month_codes[valid]
+    for level in levels:
+        keys_frame, matrix = monthly_matrix(df, SERIES_LEVELS[level], metric, month_codes, len(months))
+        result[level] = score_series(keys_frame, months, matrix, z_threshold, jump_threshold, min_active_months, top_n)
+    return result
@@ -1,53 +1,243 @@
 import os
+import functools
 import pandas as pd
 import json
-import traceback # Added for more detailed error logging
+import time
+import logging
+import queue
+import threading
 import numpy as np
 from datetime import datetime
-from langchain_openai import ChatOpenAI
-from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import tool
 from typing import Optional, List # Corrected List import
 from pydantic.v1 import BaseModel, Field
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.callbacks import BaseCallbackHandler
 
 from backend.utils.dotenv_loader import load_env, get_env_variable
+from backend.utils.lazy_loader import LazyResource
+from backend.utils.metrics import tool_duration_seconds, llm_round_duration_seconds
+from backend.utils.tracing import Trace, TraceStore
 from backend.analysis.performance_analyzer import get_top_partner_for_metric_month, get_partner_counts_by_country, convert_numpy_types
+from backend.analysis.tool_cache import ToolResultCache, make_tool_cache_key
+from backend.analysis.response_cache import ResponseCache, FileResponseCache
+from backend.analysis.conversation_store import ConversationStore, extractive_summarizer
+from backend.analysis.sql_engine import run_sql_template
+from backend.analysis.leaderboards import ALL_PERIODS, read_leaderboards, lookup_leaderboard, rank_partners, month_period, top_partner_result
+from backend.utils.ingest_artifacts import artifact_path, LEADERBOARDS_KIND
+from backend.utils.metric_dtypes import widen_metric_dtypes
+from backend.analysis.fast_path_router import route_query, render_answer, MIN_CONFIDENCE_DEFAULT
+from backend.analysis.anomaly_detector import detect_anomalies
 
 # Load environment variables for API keys, etc.
 load_env()
 
-# --- LLM Initialization ---
-llm = None
-try:
-    openai_api_key = get_env_variable("OPENAI_API_KEY")
-    openai_model_name = get_env_variable("OPENAI_MODEL_NAME", "gpt-4.1") # Using gpt-4.1 instead of turbo
-    openai_api_base = get_env_variable("API_BASE_URL")
+logger = logging.getLogger(__name__)
 
-    if openai_api_key:
-        llm = ChatOpenAI(
-            model_name=openai_model_name,
-            openai_api_key=openai_api_key,
-            openai_api_base=openai_api_base,
-            temperature=0 # For more deterministic tool usage
-        )
-        print("[ChatbotService] LLM initialized.")
-    else:
-        print("[ChatbotService] OPENAI_API_KEY not found. LLM not initialized.")
-except Exception as e:
-    print(f"[ChatbotService] Error initializing LLM: {e}")
+# --- LLM Configuration ---
+# langchain_openai and the agent executor are slow to import and build, so they are created on
+# first chat use (see chat_agent_loader below) rather than when this module is imported.
+openai_api_key = get_env_variable("OPENAI_API_KEY")
+openai_model_name = get_env_variable("OPENAI_MODEL_NAME", "gpt-4.1") # Using gpt-4.1 instead of turbo
+openai_api_base = get_env_variable("API_BASE_URL")
 
 # --- Global variables for context management ---
 current_df_for_tools = None
 current_file_id_for_tools = None
+current_data_context = None # (file_id, row count, min/max Date, date window, dimension filters) used to key cached results
+current_manifest_for_tools = None # Manifest of the current file (dates, months, metric stats, dimension values)
+
+# --- Tool result memoization ---
+tool_result_cache = ToolResultCache(max_entries=int(get_env_variable("TOOL_CACHE_MAX_ENTRIES", "256")))
+
+def memoize_tool(func):
+    """
+    Caches a tool's string output keyed by (data context, tool name, normalized args).
+    Error outputs are not cached so a transient failure is retried on the next call.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if current_data_context is None:
+            with tool_duration_seconds.time(tool=func.__name__):
+                return func(*args, **kwargs)
+        key = make_tool_cache_key(current_data_context, func, args, kwargs)
+        hit, cached_result = tool_result_cache.get(key)
+        if hit:
+            logger.debug("Tool cache hit for '%s'", func.__name__)
+            return cached_result
+        with tool_duration_seconds.time(tool=func.__name__):
+            result = func(*args, **kwargs)
+        if isinstance(result, str) and not result.startswith("Error"):
+            tool_result_cache.set(key, result)
+        return result
+    return wrapper
+
+def build_data_context(df, file_id, window_start=None, window_end=None, filters=None):
+    """
+    Builds a cheap fingerprint of the data the tools operate on: the file, the requested date
+    window and region/country/partner filters ({column: [values]}), plus the rows' shape. The
+    filters must be part of it: e.g. every single-partner frame has one row per file date.
+    """
+    if df is None:
+        return None
+    min_date, max_date = None, None
+    if 'Date' in df.columns and not df.empty:
+        min_date, max_date = str(df['Date'].min()), str(df['Date'].max())
+    window = tuple(pd.Timestamp(bound).isoformat() if bound is not None else None for bound in (window_start, window_end))
+    normalized_filters = tuple(sorted((column, tuple(sorted(map(str, values)))) for column, values in (filters or {}).items()))
+    return (file_id, len(df), min_date, max_date, window, normalized_filters)
+
+def get_data_cutoff_date(df):
+    """End of the latest month in the current file, from its manifest when available."""
+    if current_manifest_for_tools and current_manifest_for_tools.get('date_max'):
+        latest = pd.Timestamp(current_manifest_for_tools['date_max'])
+    else:
+        latest = pd.to_datetime(df['Date']).max()
+    return latest + pd.offsets.MonthEnd(0)
+
+def whole_file_loaded():
+    """True when the tools see the whole current file: it was loaded without a date window or dimension filters."""
+    return current_data_context is not None and current_data_context[4] == (None, None) and current_data_context[5] == ()
+
+def get_current_leaderboards():
+    """
+    The stored leaderboards of the current file, or None when they are missing or do not describe
+    the loaded data (a date window or dimension filter is applied).
+    """
+    if not current_manifest_for_tools or not whole_file_loaded():
+        return None
+    return read_leaderboards(artifact_path(get_env_variable("PROCESSED_DATA_FOLDER", "processed_data"),
+                                           current_file_id_for_tools, LEADERBOARDS_KIND))
+
+def fill_missing_partner_months(partner_monthly, months, metric):
+    """
+    Adds a zero row for each month a partner has no row in (months without activity are not
+    stored), so per-partner monthly series cover every month analyzed. Ordered by partner, then month.
+    """
+    keys = ['Partner ID', 'Country', 'Region']
+    wide = partner_monthly.pivot_table(index=keys, columns='Year-Month', values=metric, aggfunc='sum', fill_value=0)
+    wide = wide.reindex(columns=months, fill_value=0)
+    return wide.stack().rename(metric).reset_index()[['Partner ID', 'Year-Month', 'Country', 'Region', metric]]
+
+def invalidate_tool_cache(file_id):
+    """Drops cached tool results for a file whose processed data has changed."""
+    removed = tool_result_cache.invalidate_file(file_id)
+    logger.info("Invalidated %d cached tool results for file_id: %s", removed, file_id)
+    return removed
+
+def get_tool_cache_stats():
+    """Returns hit/miss counters and the hit rate of the tool result cache."""
+    return tool_result_cache.stats()
+
+# --- Chat response cache ---
+# CHAT_RESPONSE_CACHE_BACKEND: 'file' (default), 'memory' or 'off'
+def create_response_cache():
+    backend_name = get_env_variable("CHAT_RESPONSE_CACHE_BACKEND", "file").lower()
+    ttl_seconds = int(get_env_variable("CHAT_RESPONSE_CACHE_TTL_SECONDS", "3600"))
+    max_entries = int(get_env_variable("CHAT_RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    try:
+        if backend_name == "off":
+            return None
+        if backend_name == "memory":
+            return ResponseCache(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        cache_dir = get_env_variable("CHAT_RESPONSE_CACHE_DIR",
+                                     os.path.join(get_env_variable("PROCESSED_DATA_FOLDER", "processed_data"), "chat_cache"))
+        return FileResponseCache(cache_dir, ttl_seconds=ttl_seconds, max_entries=max_entries)
+    except Exception as e:
+        logger.error("Error initializing response cache, continuing without it: %s", e)
+        return None
+
+response_cache = create_response_cache()
+
+def get_response_cache_stats():
+    """Returns hit/miss counters and the hit rate of the chat response cache."""
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **response_cache.stats()}
+
+# --- Server-side conversation history ---
+def summarize_with_llm(previous_summary, folded_messages, token_budget):
+    """Folds older chat turns into the rolling conversation summary using the LLM."""
+    llm = get_chat_component("llm")
+    if llm is None:
+        return extractive_summarizer(previous_summary, folded_messages, token_budget)
+    transcript = "\n".join(f"{'User' if m['sender'] == 'user' else 'Assistant'}: {m['text']}" for m in folded_messages)
+    summary_prompt = (
+        f"Update the running summary of a conversation about partner performance data. "
+        f"Keep the partner IDs, countries, metrics, months and figures that later questions may refer to. "
+        f"Answer with the updated summary only, in at most {token_budget * 3 // 4} words.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\nNew turns to fold in:\n{transcript}"
+    )
+    return llm.invoke(summary_prompt).content
+
+conversation_store = ConversationStore(
+    max_recent_messages=int(get_env_variable("CHAT_MAX_RECENT_MESSAGES", "8")),
+    history_token_budget=int(get_env_variable("CHAT_HISTORY_TOKEN_BUDGET", "1500")),
+    summary_token_budget=int(get_env_variable("CHAT_SUMMARY_TOKEN_BUDGET", "400")),
+    summarizer=summarize_with_llm if get_env_variable("CHAT_HISTORY_SUMMARIZER", "llm") == "llm" else extractive_summarizer
+)
+
+# --- Chat tracing ---
+# CHAT_TRACING: 'on' (default) or 'off'. Finished traces are kept in memory (CHAT_TRACE_MAX_TRACES)
+# and appended to CHAT_TRACE_FILE (JSONL; set it empty to keep traces in memory only), which is rotated
+# to CHAT_TRACE_FILE.1 at CHAT_TRACE_FILE_MAX_MB; retention deletes an old rotated file.
+def create_trace_store():
+    if get_env_variable("CHAT_TRACING", "on").lower() == "off":
+        return None
+    export_path = get_env_variable("CHAT_TRACE_FILE",
+                                   os.path.join(get_env_variable("PROCESSED_DATA_FOLDER", "processed_data"), "chat_traces.jsonl"))
+    try:
+        return TraceStore(max_traces=int(get_env_variable("CHAT_TRACE_MAX_TRACES", "200")), export_path=export_path or None,
+                          max_file_bytes=int(float(get_env_variable("CHAT_TRACE_FILE_MAX_MB", "10")) * 1024 * 1024))
+    except Exception as e:
+        logger.error("Error initializing chat trace store, continuing without tracing: %s", e)
+        return None
+
+trace_store = create_trace_store()
+
+def start_chat_trace(name, user_query, chat_history):
+    if trace_store is None:
+        return None
+    return Trace(name, {"file_id": current_file_id_for_tools, "query": user_query,
+                        "history_messages": len(chat_history or []), "model": openai_model_name})
+
+def finish_chat_trace(trace, route, answer=None, error=None):
+    """Closes the root span, records how the answer was produced and exports the trace."""
+    if trace is None:
+        return
+    trace.set_attributes(route=route, answer_chars=len(answer or ""))
+    trace.finish(error=error)
+    trace_store.record(trace)
+    totals = trace.summary()
+    logger.info("Chat answered via %s in %.0fms (llm %.0fms, tools %.0fms, trace %s)", route, trace.root["duration_ms"],
+                totals.get("llm", {}).get("duration_ms", 0.0), totals.get("tool", {}).get("duration_ms", 0.0), trace.trace_id)
+
+def get_recent_traces(limit=50):
+    if trace_store is None:
+        return {"enabled": False, "traces": []}
+    return {"enabled": True, "traces": trace_store.list(limit)}
+
+def get_trace(trace_id):
+    return trace_store.get(trace_id) if trace_store is not None else None
+
+def get_rotated_trace_files():
+    """The rotated chat trace export, for retention to delete once it is old."""
+    return [trace_store.rotated_path] if trace_store is not None and trace_store.rotated_path else []
+
+def invalidate_chat_caches(file_id):
+    """Drops cached tool results and cached chat answers for a file whose data has changed."""
+    removed = invalidate_tool_cache(file_id)
+    if response_cache is not None:
+        removed += response_cache.invalidate_file(file_id)
+    return removed
 
 def set_current_df_for_chatbot(df, file_id):
     """Sets the current dataframe and file_id for use in the chatbot tools."""
     global current_df_for_tools, current_file_id_for_tools
     current_df_for_tools = df
     current_file_id_for_tools = file_id
-    print(f"[ChatbotService] Set current DataFrame for file_id: {file_id}")
+    logger.debug("Set current DataFrame for file_id: %s", file_id)
     return True
 
 # --- Pydantic Schemas for Tool Arguments ---
@@ -71,19 +261,49 @@ class PartnersWithTrendSchema(BaseModel):
     months: int = Field(description="Number of most recent months to analyze, default is 3", default=3)
     min_rate: float = Field(description="Minimum rate of change to consider (percentage), default is 10", default=10.0)
 
+class AggregateAcrossFilesSchema(BaseModel):
+    metric: str = Field(description="The metric to aggregate, e.g., 'Deriv Revenue', 'FTT'")
+    group_by: str = Field(description="What to group by: 'Region', 'Country', 'Partner ID', 'DataSource', 'FileId', 'month', 'quarter' or 'year'", default="Region")
+    source: Optional[str] = Field(description="Only files of this source: 'myAffiliate' or 'dynamicWorks'", default=None)
+    uploaded_since: Optional[str] = Field(description="Only files uploaded on or after this date (YYYY-MM-DD)", default=None)
+    start_date: Optional[str] = Field(description="Only data dated on or after this date (YYYY-MM-DD)", default=None)
+    end_date: Optional[str] = Field(description="Only data dated on or before this date (YYYY-MM-DD)", default=None)
+    limit: int = Field(description="Maximum number of groups to return", default=10)
+
+class GetPartnerLeaderboardSchema(BaseModel):
+    metric: str = Field(description="The metric to rank partners by, e.g., 'Deriv Revenue', 'FTT'")
+    n: int = Field(description="Number of partners to return", default=10)
+    direction: str = Field(description="'top' for the highest values or 'bottom' for the lowest", default="top")
+    year: Optional[int] = Field(description="Year of the month to rank; omit year and month to rank over the whole file", default=None)
+    month: Optional[int] = Field(description="Month (1-12) to rank; omit year and month to rank over the whole file", default=None)
+    region: Optional[str] = Field(description="Only rank partners of this GP Team Region", default=None)
+
+class DetectMetricAnomaliesSchema(BaseModel):
+    metric: str = Field(description="The metric whose monthly series are scored, e.g., 'Deriv Revenue', 'FTT'", default="Deriv Revenue")
+    level: str = Field(description="'partner', 'country' or 'both'", default="both")
+    months: Optional[int] = Field(description="Only score the most recent N months; omit to use every month", default=None)
+    top_n: int = Field(description="Number of anomalies of each kind to return per level", default=10)
+
 # --- Tools Definition ---
 @tool(args_schema=GetTopPartnerToolSchema)
+@memoize_tool
 def get_top_partner_tool(metric: str, year: int, month: int) -> str:
     """
     Finds the top performing partner for a specific metric in a given month. 
     Returns details including Partner ID, value for the metric, Country, and Region.
     """
-    print(f"[ChatbotService] Tool 'get_top_partner_tool' called with args: metric={metric}, year={year}, month={month}")
+    logger.info("Tool 'get_top_partner_tool' called with args: metric=%s, year=%s, month=%s", metric, year, month)
     if current_df_for_tools is None or current_df_for_tools.empty:
         return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
     
-    df_copy = current_df_for_tools.copy()
-    result = get_top_partner_for_metric_month(df_copy, metric, year, month)
+    entries = lookup_leaderboard(get_current_leaderboards(), metric, month_period(year, month), n=1)
+    if entries == []:
+        return f"No data found for {month}/{year}"
+    if entries:
+        result = convert_numpy_types(top_partner_result(entries[0], metric, year, month))
+    else:
+        df_copy = widen_metric_dtypes(current_df_for_tools).copy()
+        result = get_top_partner_for_metric_month(df_copy, metric, year, month)
     
     if isinstance(result, dict) and "error" in result:
         return f"Error from analysis function: {result['error']}"
@@ -100,13 +320,14 @@ Region: {result['Region']}"""
 
 # ---> ADDED: New tool for counting partners by country <---
 @tool(args_schema=GetPartnerCountsByCountryToolSchema)
+@memoize_tool
 def get_partner_counts_by_country_tool() -> str:
     """Counts the number of unique partners for each country in the dataset."""
-    print(f"[ChatbotService] Tool 'get_partner_counts_by_country_tool' called for file_id: {current_file_id_for_tools}")
+    logger.info("Tool 'get_partner_counts_by_country_tool' called for file_id: %s", current_file_id_for_tools)
     if current_df_for_tools is None or current_df_for_tools.empty:
         return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
     
-    df_copy = current_df_for_tools.copy()
+    df_copy = widen_metric_dtypes(current_df_for_tools).copy()
     result = get_partner_counts_by_country(df_copy)
     
     if isinstance(result, dict) and "error" in result:
@@ -125,13 +346,14 @@ def get_partner_counts_by_country_tool() -> str:
 
 # ---> ADDED: New tool to get countries by revenue <---
 @tool
+@memoize_tool
 def get_countries_by_revenue() -> str:
     """Gets a list of countries ordered by total Deriv Revenue."""
-    print(f"[ChatbotService] Tool 'get_countries_by_revenue' called for file_id: {current_file_id_for_tools}")
+    logger.info("Tool 'get_countries_by_revenue' called for file_id: %s", current_file_id_for_tools)
     if current_df_for_tools is None or current_df_for_tools.empty:
         return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
     
-    df_copy = current_df_for_tools.copy()
+    df_copy = widen_metric_dtypes(current_df_for_tools).copy()
     try:
         # Check if Country and Deriv Revenue columns exist
         if 'Country' not in df_copy.columns or 'Deriv Revenue' not in df_copy.columns:
@@ -160,13 +382,14 @@ def get_countries_by_revenue() -> str:
 
 # ---> ADDED: New tool to find partners with negative revenue (actual losses) <---
 @tool
+@memoize_tool
 def get_partners_with_negative_revenue(year: Optional[int] = None, month: Optional[int] = None) -> str:
     """Find partners who are generating losses (negative Deriv Revenue) for the company."""
-    print(f"[ChatbotService] Tool 'get_partners_with_negative_revenue' called for file_id: {current_file_id_for_tools}")
+    logger.info("Tool 'get_partners_with_negative_revenue' called for file_id: %s", current_file_id_for_tools)
     if current_df_for_tools is None or current_df_for_tools.empty:
         return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
     
-    df_copy = current_df_for_tools.copy()
+    df_copy = widen_metric_dtypes(current_df_for_tools).copy()
     try:
         # Check if necessary columns exist
         if 'Partner ID' not in df_copy.columns or 'Deriv Revenue' not in df_copy.columns:
@@ -209,13 +432,14 @@ def get_partners_with_negative_revenue(year: Optional[int] = None, month: Option
 
 # ---> NEW TOOL: Compare countries by monthly metrics <---
 @tool(args_schema=CompareCountriesByMonthSchema)
+@memoize_tool
 def compare_countries_by_month(countries: List[str], metric: str, months: int = 4) -> str:
     """Compare specified countries based on a metric with month-by-month breakdown."""
-    print(f"[ChatbotService] Tool 'compare_countries_by_month' called with countries={countries}, metric={metric}, months={months}")
+    logger.info("Tool 'compare_countries_by_month' called with countries=%s, metric=%s, months=%s", countries, metric, months)
     if current_df_for_tools is None or current_df_for_tools.empty:
         return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
     
-    df_copy = current_df_for_tools.copy()
+    df_copy = widen_metric_dtypes(current_df_for_tools).copy()
     try:
         # Check if necessary columns exist
         if 'Country' not in df_copy.columns or metric not in df_copy.columns:
@@ -228,9 +452,8 @@ def compare_countries_by_month(countries: List[str], metric: str, months: int =
         if not pd.api.types.is_datetime64_any_dtype(df_copy['Date']):
             df_copy['Date'] = pd.to_datetime(df_copy['Date'])
         
-        # For this dataset, we know data is available until April 2025
-        # Hard-code cutoff date to April 30, 2025 instead of using current date
-        cutoff_date = pd.Timestamp('2025-04-30')
+        # Recent months are counted back from the end of the file's latest month (from its manifest)
+        cutoff_date = get_data_cutoff_date(df_copy)
         # Filter to dates on or before the cutoff
         df_copy = df_copy[df_copy['Date'] <= cutoff_date]
         
@@ -320,21 +543,22 @@ def compare_countries_by_month(countries: List[str], metric: str, months: int =
         return response
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Error comparing countries by month: %s", e)
         return f"Error comparing countries by month: {str(e)}"
 
 # ---> NEW TOOL: Identify partners with growth or decline trends <---
 @tool(args_schema=PartnersWithTrendSchema)
+@memoize_tool
 def identify_partners_with_trends(trend_type: str, metric: str, months: int = 3, min_rate: float = 10.0) -> str:
     """Identify partners showing significant growth or decline trends in specified metric."""
-    print(f"[ChatbotService] Tool 'identify_partners_with_trends' called with trend_type={trend_type}, metric={metric}, months={months}")
+    logger.info("Tool 'identify_partners_with_trends' called with trend_type=%s, metric=%s, months=%s", trend_type, metric, months)
     if current_df_for_tools is None or current_df_for_tools.empty:
         return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
     
     if trend_type not in ['growth', 'decline']:
         return "Error: trend_type must be either 'growth' or 'decline'."
     
-    df_copy = current_df_for_tools.copy()
+    df_copy = widen_metric_dtypes(current_df_for_tools).copy()
     try:
         # Check if necessary columns exist
         if 'Partner ID' not in df_copy.columns or metric not in df_copy.columns:
@@ -347,9 +571,8 @@ def identify_partners_with_trends(trend_type: str, metric: str, months: int = 3,
         if not pd.api.types.is_datetime64_any_dtype(df_copy['Date']):
             df_copy['Date'] = pd.to_datetime(df_copy['Date'])
         
-        # For this dataset, we know data is available until April 2025
-        # Hard-code cutoff date to April 30, 2025 instead of using current date
-        cutoff_date = pd.Timestamp('2025-04-30')
+        # Recent months are counted back from the end of the file's latest month (from its manifest)
+        cutoff_date = get_data_cutoff_date(df_copy)
         # Filter to dates on or before the cutoff
         df_copy = df_copy[df_copy['Date'] <= cutoff_date]
         
@@ -381,6 +604,7 @@ def identify_partners_with_trends(trend_type: str, metric: str, months: int = 3,
         
         # Group by Partner ID and Year-Month
         partner_monthly = filtered_df.groupby(['Partner ID', 'Year-Month', 'Country', 'Region'])[metric].sum().reset_index()
+        partner_monthly = fill_missing_partner_months(partner_monthly, months_to_analyze, metric)
         
         # Get unique partner IDs
         unique_partners = partner_monthly['Partner ID'].unique()
@@ -478,22 +702,23 @@ def identify_partners_with_trends(trend_type: str, metric: str, months: int = 3,
         return response
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Error identifying trends: %s", e)
         return f"Error identifying {trend_type} trends: {str(e)}"
 
 # ---> NEW TOOL: Identify partners at risk of churning <---
 @tool
+@memoize_tool
 def identify_churn_risk_partners(months: int = 3, revenue_decline_percent: float = 20.0) -> str:
     """
     Identify partners that are at risk of churning based on significant revenue decline.
     This is a specialized version focusing specifically on churn risk indicators.
     """
-    print(f"[ChatbotService] Tool 'identify_churn_risk_partners' called with months={months}, decline_threshold={revenue_decline_percent}%")
+    logger.info("Tool 'identify_churn_risk_partners' called with months=%s, decline_threshold=%s%%", months, revenue_decline_percent)
     
     if current_df_for_tools is None or current_df_for_tools.empty:
         return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
     
-    df_copy = current_df_for_tools.copy()
+    df_copy = widen_metric_dtypes(current_df_for_tools).copy()
     try:
         # Check if necessary columns exist
         if 'Partner ID' not in df_copy.columns or 'Deriv Revenue' not in df_copy.columns:
@@ -506,9 +731,8 @@ def identify_churn_risk_partners(months: int = 3, revenue_decline_percent: float
         if not pd.api.types.is_datetime64_any_dtype(df_copy['Date']):
             df_copy['Date'] = pd.to_datetime(df_copy['Date'])
         
-        # For this dataset, we know data is available until April 2025
-        # Hard-code cutoff date to April 30, 2025 instead of using current date
-        cutoff_date = pd.Timestamp('2025-04-30')
+        # Recent months are counted back from the end of the file's latest month (from its manifest)
+        cutoff_date = get_data_cutoff_date(df_copy)
         # Filter to dates on or before the cutoff
         df_copy = df_copy[df_copy['Date'] <= cutoff_date]
         
@@ -540,6 +764,7 @@ def identify_churn_risk_partners(months: int = 3, revenue_decline_percent: float
         
         # Group by Partner ID and Year-Month
         partner_monthly = filtered_df.groupby(['Partner ID', 'Year-Month', 'Country', 'Region'])['Deriv Revenue'].sum().reset_index()
+        partner_monthly = fill_missing_partner_months(partner_monthly, months_to_analyze, 'Deriv Revenue')
         
         # Get unique partner IDs
         unique_partners = partner_monthly['Partner ID'].unique()
@@ -635,9 +860,109 @@ def identify_churn_risk_partners(months: int = 3, revenue_decline_percent: float
         return response
         
     except Exception as e:
-        traceback.print_exc()
+        logger.exception("Error identifying churn risk partners: %s", e)
         return f"Error identifying churn risk partners: {str(e)}"
 
+@tool(args_schema=AggregateAcrossFilesSchema)
+def aggregate_across_files(metric: str, group_by: str = "Region", source: Optional[str] = None,
+                           uploaded_since: Optional[str] = None, start_date: Optional[str] = None,
+                           end_date: Optional[str] = None, limit: int = 10) -> str:
+    """
+    Totals a metric across ALL stored uploaded files (not just the current one), grouped by region,
+    country, partner, source, file or period. Use for questions spanning several uploads.
+    """
+    logger.info("Tool 'aggregate_across_files' called with args: metric=%s, group_by=%s, source=%s, uploaded_since=%s",
+                metric, group_by, source, uploaded_since)
+    with tool_duration_seconds.time(tool="aggregate_across_files"):
+        result = run_sql_template('metric_by_dimension',
+                                  {'metric': metric, 'group_by': group_by, 'start_date': start_date,
+                                   'end_date': end_date, 'limit': limit},
+                                  sources=[source] if source else None, uploaded_since=uploaded_since)
+    if 'error' in result:
+        return f"Error: {result['error']}"
+    if result['rowCount'] == 0:
+        return "No data matched the selected files and dates."
+
+    groups, values, partners = result['data']
+    response = f"Total {metric} by {group_by} across {len(result['files'])} stored file(s):\n"
+    for i, (group, value, partner_count) in enumerate(zip(groups, values, partners), 1):
+        response += f"{i}. {group}: {value:,.2f} ({partner_count} partners)\n"
+    return response
+
+@tool(args_schema=GetPartnerLeaderboardSchema)
+@memoize_tool
+def get_partner_leaderboard(metric: str, n: int = 10, direction: str = "top", year: Optional[int] = None,
+                            month: Optional[int] = None, region: Optional[str] = None) -> str:
+    """
+    Ranks the top or bottom N partners by a metric, for one month or the whole file, optionally
+    within one region. Returns each partner's ID, Country, Region and metric value.
+    """
+    logger.info("Tool 'get_partner_leaderboard' called with args: metric=%s, n=%s, direction=%s, year=%s, month=%s, region=%s",
+                metric, n, direction, year, month, region)
+    if current_df_for_tools is None or current_df_for_tools.empty:
+        return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
+    if direction not in ("top", "bottom"):
+        return "Error: direction must be 'top' or 'bottom'."
+    n = max(1, int(n))
+    period = month_period(year, month) if year and month else ALL_PERIODS
+
+    entries = lookup_leaderboard(get_current_leaderboards(), metric, period, n, direction, region)
+    if entries is None:
+        entries = rank_partners(current_df_for_tools, metric, period, n, direction, region)
+    if entries is None:
+        return f"Error: Metric '{metric}' not found in data"
+    scope = f"in {month}/{year}" if period != ALL_PERIODS else "over the whole file"
+    if region:
+        scope += f" in region {region}"
+    if not entries:
+        return f"No data found {scope}."
+
+    response = f"{'Top' if direction == 'top' else 'Bottom'} {len(entries)} partners by {metric} {scope}:\n"
+    for entry in convert_numpy_types(entries):
+        response += f"{entry['Rank']}. Partner {entry['Partner ID']} ({entry['Country']}, {entry['Region']}): {entry['Value']:,.2f}\n"
+    return response
+
+@tool(args_schema=DetectMetricAnomaliesSchema)
+@memoize_tool
+def detect_metric_anomalies(metric: str = "Deriv Revenue", level: str = "both", months: Optional[int] = None,
+                            top_n: int = 10) -> str:
+    """
+    Finds unusual months (robust z-score against the series' own median) and sudden month-over-month
+    jumps in the monthly series of a metric, for every partner and/or every country at once.
+    """
+    logger.info("Tool 'detect_metric_anomalies' called with args: metric=%s, level=%s, months=%s, top_n=%s",
+                metric, level, months, top_n)
+    if current_df_for_tools is None or current_df_for_tools.empty:
+        return "Error: Data not loaded. Please ensure a file has been processed and selected for chat."
+    levels = ('partner', 'country') if level == "both" else (level,)
+    if any(value not in ('partner', 'country') for value in levels):
+        return "Error: level must be 'partner', 'country' or 'both'."
+
+    df = current_df_for_tools
+    if months:
+        recent = df['Date'].dt.to_period('M').drop_duplicates().nlargest(int(months))
+        df = df[df['Date'].dt.to_period('M').isin(recent)]
+    result = detect_anomalies(df, metric, levels=levels, top_n=max(1, int(top_n)))
+    if 'error' in result:
+        return f"Error: {result['error']}"
+    if 'note' in result:
+        return result['note']
+
+    response = f"Anomalies in monthly {metric} ({result['months'][0]} to {result['months'][-1]}):\n"
+    for level_name in levels:
+        scores = result[level_name]
+        response += (f"\n{level_name.capitalize()} series: {scores['scored_series']} of {scores['series']} scored, "
+                     f"{scores['outlier_count']} unusual months, {scores['jump_count']} month-over-month jumps.\n")
+        for entry in scores['outliers']:
+            name = f"Partner {entry['Partner ID']} ({entry['Country']}, {entry['Region']})" if level_name == 'partner' else entry['Country']
+            response += (f"- {name}, {entry['Month']}: {entry['Direction']} to {entry['Value']:,.2f} "
+                         f"(typical {entry['Expected']:,.2f}, score {entry['Score']})\n")
+        for entry in scores['jumps']:
+            name = f"Partner {entry['Partner ID']} ({entry['Country']}, {entry['Region']})" if level_name == 'partner' else entry['Country']
+            response += (f"- {name}, {entry['Month']}: {entry['Direction']} of {entry['Change']:,.2f} "
+                         f"from {entry['Previous']:,.2f} (score {entry['Score']})\n")
+    return response
+
 # Add the new tools to the tools list
 tools = [
     get_top_partner_tool, 
@@ -646,73 +971,207 @@ tools = [
     get_partners_with_negative_revenue,
     compare_countries_by_month,
     identify_partners_with_trends,
-    identify_churn_risk_partners
+    identify_churn_risk_partners,
+    aggregate_across_files,
+    get_partner_leaderboard,
+    detect_metric_anomalies
 ]
 
-# --- Agent Initialization (Simplified for now) ---
-# This agent will be re-initialized per request with the appropriate file_id context (via current_df_for_tools)
-agent_executor = None
-if llm:
-    # Basic prompt for OpenAI Tools agent
-    # More complex prompting would involve system messages, examples, etc.
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", (
-            "You are a helpful financial data analyst specializing in partner performance analytics. "
-            "You have access to a dataset of PartnerDashboard partner performance data including metrics like "
-            "Deriv Revenue, Expected Revenue, Partner Commissions, Total Deposits, Active Clients, and FTT. "
-            "\n\n"
-            "IMPORTANT TERMINOLOGY CLARIFICATION:"
-            "\n- In this business context, 'Deriv Revenue' represents client losses that benefit the company (positive values)"
-            "\n- Negative 'Deriv Revenue' values represent company losses (clients are winning)"
-            "\n- When asked about 'losses', clarify if the user means:"
-            "\n  1. Partners with negative Deriv Revenue (company loses money) or"
-            "\n  2. Partners with high positive Deriv Revenue (clients lose more money)"
-            "\n\n"
-            "DATA SOURCES EXPLANATION:"
-            "\n- The platform supports two data sources: 'MyAffiliate' and 'PartnerDashboard'"
-            "\n- MyAffiliate is a third-party tracking platform that tracks partner/affiliate performance"
-            "\n- PartnerDashboard is our internal tracking system that provides more detailed metrics"
-            "\n- The dashboard allows comparing and combining data from both sources"
-            "\n- When analyzing data, consider which source the user is currently viewing"
-            "\n- GP Team Region is a geographical organization of our partners that can be used for filtering"
-            "\n\n"
-            "When answering questions or analyzing data:"
-            "\n- First determine if your tools can provide precise answers"
-            "\n- Prefer to use specific tools over general knowledge whenever possible"
-            "\n- Maintain context from previous questions in the conversation"
-            "\n- Provide insightful analysis, not just raw numbers"
-            "\n- Be direct and concise in your answers"
-            "\n\n"
-            "Available tools:"
-            "\n1. 'get_top_partner_tool' - Finds the top performing partner for a specific metric in a specific month and year."
-            "\n2. 'get_partner_counts_by_country_tool' - Provides a count of unique partners for each country."
-            "\n3. 'get_countries_by_revenue' - Lists countries ordered by total Deriv Revenue."
-            "\n4. 'get_partners_with_negative_revenue' - Finds partners generating losses (negative Deriv Revenue) for the company."
-            "\n5. 'compare_countries_by_month' - Compares specified countries based on a metric with month-by-month breakdown."
-            "\n6. 'identify_partners_with_trends' - Identifies partners showing significant growth or decline trends in a specified metric."
-            "\n7. 'identify_churn_risk_partners' - Identifies partners at risk of churning based on significant revenue decline."
-            "\n\n"
-            "If asked about something not covered by your tools, say you don't have that specific data available rather than making up answers."
-        )),
-        MessagesPlaceholder(variable_name="chat_history", optional=True),
-        ("human", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-    ])
-    agent = create_openai_tools_agent(llm, tools, prompt)
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, handle_parsing_errors=True)
-    print("[ChatbotService] Agent executor initialized.")
-else:
-    print("[ChatbotService] LLM not initialized, cannot create agent executor.")
-
-def set_current_df_for_chatbot(df: Optional[pd.DataFrame], file_id: Optional[str]):
-    """Sets the DataFrame to be used by the tools."""
-    global current_df_for_tools, current_file_id_for_tools
+# --- Agent Initialization ---
+# Basic prompt for OpenAI Tools agent
+# More complex prompting would involve system messages, examples, etc.
+prompt = ChatPromptTemplate.from_messages([
+    ("system", (
+        "You are a helpful financial data analyst specializing in partner performance analytics. "
+        "You have access to a dataset of PartnerDashboard partner performance data including metrics like "
+        "Deriv Revenue, Expected Revenue, Partner Commissions, Total Deposits, Active Clients, and FTT. "
+        "\n\n"
+        "IMPORTANT TERMINOLOGY CLARIFICATION:"
+        "\n- In this business context, 'Deriv Revenue' represents client losses that benefit the company (positive values)"
+        "\n- Negative 'Deriv Revenue' values represent company losses (clients are winning)"
+        "\n- When asked about 'losses', clarify if the user means:"
+        "\n  1. Partners with negative Deriv Revenue (company loses money) or"
+        "\n  2. Partners with high positive Deriv Revenue (clients lose more money)"
+        "\n\n"
+        "DATA SOURCES EXPLANATION:"
+        "\n- The platform supports two data sources: 'MyAffiliate' and 'PartnerDashboard'"
+        "\n- MyAffiliate is a third-party tracking platform that tracks partner/affiliate performance"
+        "\n- PartnerDashboard is our internal tracking system that provides more detailed metrics"
+        "\n- The dashboard allows comparing and combining data from both sources"
+        "\n- When analyzing data, consider which source the user is currently viewing"
+        "\n- GP Team Region is a geographical organization of our partners that can be used for filtering"
+        "\n\n"
+        "When answering questions or analyzing data:"
+        "\n- First determine if your tools can provide precise answers"
+        "\n- Prefer to use specific tools over general knowledge whenever possible"
+        "\n- Maintain context from previous questions in the conversation"
+        "\n- Provide insightful analysis, not just raw numbers"
+        "\n- Be direct and concise in your answers"
+        "\n\n"
+        "Available tools:"
+        "\n1. 'get_top_partner_tool' - Finds the top performing partner for a specific metric in a specific month and year."
+        "\n2. 'get_partner_counts_by_country_tool' - Provides a count of unique partners for each country."
+        "\n3. 'get_countries_by_revenue' - Lists countries ordered by total Deriv Revenue."
+        "\n4. 'get_partners_with_negative_revenue' - Finds partners generating losses (negative Deriv Revenue) for the company."
+        "\n5. 'compare_countries_by_month' - Compares specified countries based on a metric with month-by-month breakdown."
+        "\n6. 'identify_partners_with_trends' - Identifies partners showing significant growth or decline trends in a specified metric."
+        "\n7. 'identify_churn_risk_partners' - Identifies partners at risk of churning based on significant revenue decline."
+        "\n8. 'aggregate_across_files' - Totals a metric across all stored uploads (optionally by source, upload date or data dates), grouped by region, country, partner, source, file or period."
+        "\n9. 'get_partner_leaderboard' - Ranks the top or bottom N partners by a metric for a month or the whole file, optionally within one region."
+        "\n10. 'detect_metric_anomalies' - Finds unusual months and sudden month-over-month jumps in the monthly series of a metric for every partner and/or country."
+        "\n\n"
+        "If asked about something not covered by your tools, say you don't have that specific data available rather than making up answers."
+    )),
+    MessagesPlaceholder(variable_name="chat_history", optional=True),
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad"),
+])
+
+class LLMTimingHandler(BaseCallbackHandler):
+    """Records the duration of every LLM call (each agent round and each summarization) in the metrics."""
+
+    def __init__(self):
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            llm_round_duration_seconds.observe(time.perf_counter() - started, model=openai_model_name)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Adds a span to the request's trace for every LLM call (with token usage) and tool run."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._spans = {}
+        self._llm_rounds = 0
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt_messages = messages[0] if messages else []
+        self._llm_rounds += 1
+        self._spans[run_id] = self.trace.start_span("llm", "llm", {
+            "round": self._llm_rounds,
+            "prompt_messages": len(prompt_messages),
+            "prompt_chars": sum(len(str(message.content)) for message in prompt_messages),
+        })
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        tool_calls = []
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        message = getattr(generation, "message", None)
+        if message is not None:
+            if not usage and getattr(message, "usage_metadata", None):
+                usage = {"prompt_tokens": message.usage_metadata.get("input_tokens"),
+                         "completion_tokens": message.usage_metadata.get("output_tokens"),
+                         "total_tokens": message.usage_metadata.get("total_tokens")}
+            tool_calls = [call["name"] for call in getattr(message, "tool_calls", None) or []]
+        self.trace.end_span(span, prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+                            total_tokens=usage.get("total_tokens"), tool_calls=tool_calls)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            self.trace.end_span(span, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, inputs=None, **kwargs):
+        tool_name = (serialized or {}).get("name", "tool")
+        self._spans[run_id] = self.trace.start_span(tool_name, "tool", {"args": inputs if inputs is not None else input_str})
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            self.trace.end_span(span, output_chars=len(str(getattr(output, "content", output))))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            self.trace.end_span(span, error=error)
+
+def _build_chat_agent():
+    """
+    Creates the LLM clients and agent executors on first chat use. Without an API key the chat is
+    off (every component None); any other failure raises, so the next chat request retries it.
+    """
+    components = {"llm": None, "streaming_llm": None, "agent_executor": None, "streaming_agent_executor": None}
+    if not openai_api_key:
+        logger.warning("OPENAI_API_KEY not found. LLM not initialized.")
+        return components
+    try:
+        from langchain_openai import ChatOpenAI
+        from langchain.agents import AgentExecutor, create_openai_tools_agent
+
+        components["llm"] = ChatOpenAI(
+            model_name=openai_model_name,
+            openai_api_key=openai_api_key,
+            openai_api_base=openai_api_base,
+            temperature=0, # For more deterministic tool usage
+            stream_usage=True, # The agent executor streams from the model; this keeps token counts for traces
+            callbacks=[LLMTimingHandler()]
+        )
+        # Same model with token streaming enabled, used by the /chat/stream endpoint
+        components["streaming_llm"] = ChatOpenAI(
+            model_name=openai_model_name,
+            openai_api_key=openai_api_key,
+            openai_api_base=openai_api_base,
+            temperature=0,
+            streaming=True,
+            stream_usage=True,
+            callbacks=[LLMTimingHandler()]
+        )
+        logger.info("LLM initialized.")
+        # The executor's verbose trace goes to stdout, so it follows the DEBUG log level
+        verbose = logger.isEnabledFor(logging.DEBUG)
+        agent = create_openai_tools_agent(components["llm"], tools, prompt)
+        components["agent_executor"] = AgentExecutor(agent=agent, tools=tools, verbose=verbose, handle_parsing_errors=True,
+                                                     return_intermediate_steps=True)
+        streaming_agent = create_openai_tools_agent(components["streaming_llm"], tools, prompt)
+        components["streaming_agent_executor"] = AgentExecutor(agent=streaming_agent, tools=tools, verbose=verbose, handle_parsing_errors=True)
+        logger.info("Agent executor initialized.")
+    except Exception as e:
+        logger.exception("Error initializing LLM or agent executor: %s", e)
+        raise
+    return components
+
+chat_agent_loader = LazyResource("agent", _build_chat_agent)
+
+def get_chat_component(name):
+    """
+    Returns 'llm', 'streaming_llm', 'agent_executor' or 'streaming_agent_executor', building them on
+    first use; None while they cannot be built (the failure is in /startup-timings' lazyInitErrors).
+    """
+    try:
+        return chat_agent_loader.get()[name]
+    except Exception:
+        return None
+
+def set_current_df_for_chatbot(df: Optional[pd.DataFrame], file_id: Optional[str], manifest: Optional[dict] = None,
+                               window_start=None, window_end=None, filters: Optional[dict] = None):
+    """
+    Sets the DataFrame (and optionally the file's manifest) to be used by the tools. window_start /
+    window_end and filters describe how df was selected from the file, and key the cached results.
+    """
+    global current_df_for_tools, current_file_id_for_tools, current_data_context, current_manifest_for_tools
     current_df_for_tools = df
     current_file_id_for_tools = file_id
+    current_manifest_for_tools = manifest
+    current_data_context = build_data_context(df, file_id, window_start, window_end, filters)
     if df is not None:
-        print(f"[ChatbotService] DataFrame for file_id '{file_id}' set for chatbot tools. Shape: {df.shape}")
+        logger.info("DataFrame for file_id '%s' set for chatbot tools. Shape: %s", file_id, df.shape)
     else:
-        print("[ChatbotService] DataFrame for chatbot tools cleared.")
+        logger.info("DataFrame for chatbot tools cleared.")
 
 def convert_chat_history_to_langchain_messages(chat_history):
     """
@@ -723,6 +1182,8 @@ def convert_chat_history_to_langchain_messages(chat_history):
         {"sender": "user", "text": "message content"},
         {"sender": "bot", "text": "response content"}
     ]
+    A leading {"sender": "summary"} entry (from the server-side conversation store)
+    is passed on as a system message.
     
     Returns a list of LangChain Message objects.
     """
@@ -738,31 +1199,230 @@ def convert_chat_history_to_langchain_messages(chat_history):
             langchain_messages.append(HumanMessage(content=message["text"]))
         elif message["sender"] == "bot":
             langchain_messages.append(AIMessage(content=message["text"]))
+        elif message["sender"] == "summary":
+            langchain_messages.append(SystemMessage(content=f"Summary of the earlier conversation:\n{message['text']}"))
     
     return langchain_messages
 
+def build_agent_input(user_query: str, chat_history: Optional[List] = None) -> dict:
+    """Builds the agent input dict, converting frontend chat history to LangChain messages."""
+    input_dict = {"input": user_query}
+    if chat_history:
+        langchain_chat_history = convert_chat_history_to_langchain_messages(chat_history)
+        logger.debug("Converted %d messages to %d LangChain messages", len(chat_history), len(langchain_chat_history))
+        if langchain_chat_history:
+            input_dict["chat_history"] = langchain_chat_history
+    return input_dict
+
+# Tools whose results depend on every stored file rather than the current one. The response cache
+# keys and invalidates answers by the current file, so answers that called them are not cached.
+CROSS_FILE_TOOLS = {"aggregate_across_files"}
+
+def get_response_cache_key(user_query: str, chat_history: Optional[List] = None):
+    if response_cache is None:
+        return None
+    return response_cache.make_key(current_data_context, user_query, chat_history, openai_model_name)
+
+# --- Deterministic fast path ---
+fast_path_min_confidence = float(get_env_variable("FAST_PATH_MIN_CONFIDENCE", str(MIN_CONFIDENCE_DEFAULT)))
+fast_path_enabled = get_env_variable("FAST_PATH_ENABLED", "true").lower() == "true"
+tools_by_name = {chat_tool.name: chat_tool for chat_tool in tools}
+available_months_by_context = {}
+
+def get_available_months():
+    """(year, month) pairs present in the current data, computed once per data context."""
+    if current_data_context not in available_months_by_context:
+        available_months_by_context.clear()
+        months = set()
+        manifest = current_manifest_for_tools
+        if manifest and whole_file_loaded():
+            # The whole file is loaded, so its manifest lists the months without scanning the dates
+            months = {(int(month[:4]), int(month[5:7])) for month in manifest['months']}
+        elif current_df_for_tools is not None and 'Date' in current_df_for_tools.columns:
+            dates = pd.to_datetime(current_df_for_tools['Date'].drop_duplicates(), errors='coerce').dropna()
+            months = set(zip(dates.dt.year.tolist(), dates.dt.month.tolist()))
+        available_months_by_context[current_data_context] = months
+    return available_months_by_context[current_data_context]
+
+dimension_names_by_context = {}
+
+def get_dimension_names():
+    """
+    {'Country': [...], 'Region': [...]} of the current file (from its manifest when available), so
+    the fast-path router can tell a question that names a place its tools would ignore.
+    """
+    if current_data_context not in dimension_names_by_context:
+        dimension_names_by_context.clear()
+        dictionaries = (current_manifest_for_tools or {}).get('dictionaries') or {}
+        names = {}
+        for column in ('Country', 'Region'):
+            if column in dictionaries:
+                names[column] = dictionaries[column]
+            elif current_df_for_tools is not None and column in current_df_for_tools.columns:
+                names[column] = current_df_for_tools[column].dropna().unique().tolist()
+        dimension_names_by_context[current_data_context] = names
+    return dimension_names_by_context[current_data_context]
+
+def try_fast_path(user_query: str, trace=None):
+    """
+    Answers common single-tool questions (top partner for a metric and month, partner counts by
+    country, countries by revenue) by calling the tool directly, without the LLM.
+    Returns (tool_name, tool_args, answer), or None when the router is not confident enough.
+    """
+    if not fast_path_enabled or current_df_for_tools is None:
+        return None
+    route = route_query(user_query, get_available_months(), get_dimension_names())
+    if route is None or route["confidence"] < fast_path_min_confidence:
+        return None
+    span = trace.start_span(route["tool"], "tool", {"args": route["args"], "fast_path": True}) if trace else None
+    tool_output = tools_by_name[route["tool"]].func(**route["args"])
+    if span is not None:
+        trace.end_span(span, output_chars=len(tool_output))
+    if tool_output.startswith("Error"):
+        return None # Let the agent handle (and explain) failures
+    logger.info("Fast path answered intent '%s' with args %s", route['intent'], route['args'])
+    return route["tool"], route["args"], render_answer(route["intent"], tool_output)
+
 def invoke_chatbot(user_query: str, chat_history: Optional[List] = None) -> str:
-    if not agent_executor:
-        return "Chatbot is not available (LLM or agent initialization failed)."
+    trace = start_chat_trace("invoke_chatbot", user_query, chat_history)
+    route, answer, error = "error", None, None
+    try:
+        route, answer, error = _answer_chat_query(user_query, chat_history, trace)
+        return answer
+    finally:
+        finish_chat_trace(trace, route, answer, error)
+
+def _answer_chat_query(user_query, chat_history, trace):
+    """Returns (route, answer, error) where route says how the answer was produced."""
     if current_df_for_tools is None:
-        return "Data has not been loaded for analysis. Please upload and process a file first."
+        return "no_data", "Data has not been loaded for analysis. Please upload and process a file first.", None
+    fast_path_result = try_fast_path(user_query, trace)
+    if fast_path_result is not None:
+        return "fast_path", fast_path_result[2], None
+    agent_executor = get_chat_component("agent_executor")
+    if not agent_executor:
+        return "unavailable", "Chatbot is not available (LLM or agent initialization failed).", None
 
-    print(f"[ChatbotService] Invoking agent for file_id '{current_file_id_for_tools}' with query: {user_query}")
+    cache_key = get_response_cache_key(user_query, chat_history)
+    if cache_key is not None:
+        cached_answer = response_cache.get(cache_key)
+        if cached_answer is not None:
+            logger.info("Response cache hit for file_id '%s'", current_file_id_for_tools)
+            return "response_cache", cached_answer, None
+
+    logger.info("Invoking agent for file_id '%s' with query: %s", current_file_id_for_tools, user_query)
     try:
-        # Convert chat history to LangChain format if provided
-        langchain_chat_history = []
-        if chat_history:
-            langchain_chat_history = convert_chat_history_to_langchain_messages(chat_history)
-            print(f"[ChatbotService] Converted {len(chat_history)} messages to {len(langchain_chat_history)} LangChain messages")
-        
-        # Prepare input for the agent with chat history if available
-        input_dict = {"input": user_query}
-        if langchain_chat_history:
-            input_dict["chat_history"] = langchain_chat_history
-        
-        response = agent_executor.invoke(input_dict)
-        return response.get("output", "Agent did not produce an output.")
+        input_dict = build_agent_input(user_query, chat_history)
+        config = {"callbacks": [TracingCallbackHandler(trace)]} if trace is not None else None
+        response = agent_executor.invoke(input_dict, config=config)
+        if "output" not in response:
+            return "agent", "Agent did not produce an output.", "Agent did not produce an output."
+        tools_used = {action.tool for action, _ in response.get("intermediate_steps", [])}
+        if cache_key is not None and not tools_used & CROSS_FILE_TOOLS:
+            response_cache.set(cache_key, response["output"], file_id=current_file_id_for_tools)
+        return "agent", response["output"], None
     except Exception as e:
-        print(f"[ChatbotService] Error during agent invocation: {e}")
-        traceback.print_exc()
-        return f"Error processing your request via chatbot: {e}" 
\ No newline at end of file
+        logger.exception("Error during agent invocation: %s", e)
+        return "agent", f"Error processing your request via chatbot: {e}", e
+
+# --- Streaming ---
+class StreamingEventHandler(BaseCallbackHandler):
+    """Forwards LLM answer tokens from a running agent into a queue consumed by stream_chatbot."""
+
+    def __init__(self, event_queue):
+        self.event_queue = event_queue
+
+    def on_llm_new_token(self, token, **kwargs):
+        # Tool-calling rounds stream empty content tokens; only forward actual answer text
+        if token:
+            self.event_queue.put({"event": "token", "data": {"token": token}})
+
+def _run_streaming_agent(input_dict, event_queue, trace=None):
+    """Runs the agent via the executor's stream interface, translating chunks into events."""
+    try:
+        final_output = None
+        callbacks = [StreamingEventHandler(event_queue)]
+        if trace is not None:
+            callbacks.append(TracingCallbackHandler(trace))
+        config = {"callbacks": callbacks}
+        for chunk in get_chat_component("streaming_agent_executor").stream(input_dict, config=config):
+            for action in chunk.get("actions", []):
+                event_queue.put({"event": "tool_start", "data": {"tool": action.tool, "input": action.tool_input}})
+            for step in chunk.get("steps", []):
+                event_queue.put({"event": "tool_end", "data": {"tool": step.action.tool, "output": str(step.observation)}})
+            if "output" in chunk:
+                final_output = chunk["output"]
+        event_queue.put({"event": "done", "data": {"answer": final_output}})
+    except Exception as e:
+        logger.exception("Error during streaming agent invocation: %s", e)
+        event_queue.put({"event": "error", "data": {"error": f"Error processing your request via chatbot: {e}"}})
+
+def stream_chatbot(user_query: str, chat_history: Optional[List] = None):
+    """
+    Generator of chat events for the streaming endpoint: 'tool_start' / 'tool_end' as the agent
+    runs tools, 'token' for each answer token, then 'done' with the full answer (or 'error').
+    """
+    trace = start_chat_trace("stream_chatbot", user_query, chat_history)
+    outcome = {"route": "error", "answer": None, "error": None}
+    try:
+        for event in _stream_chat_events(user_query, chat_history, trace, outcome):
+            if event["event"] == "done":
+                outcome["answer"] = event["data"]["answer"]
+            elif event["event"] == "error":
+                outcome["error"] = event["data"]["error"]
+            yield event
+    finally:
+        # Also runs when the client disconnects mid-stream and the generator is closed
+        finish_chat_trace(trace, outcome["route"], outcome["answer"], outcome["error"])
+
+def _stream_chat_events(user_query, chat_history, trace, outcome):
+    if current_df_for_tools is None:
+        outcome["route"] = "no_data"
+        yield {"event": "error", "data": {"error": "Data has not been loaded for analysis. Please upload and process a file first."}}
+        return
+    fast_path_result = try_fast_path(user_query, trace)
+    if fast_path_result is not None:
+        outcome["route"] = "fast_path"
+        tool_name, tool_args, answer = fast_path_result
+        yield {"event": "tool_start", "data": {"tool": tool_name, "input": tool_args}}
+        yield {"event": "tool_end", "data": {"tool": tool_name, "output": answer}}
+        yield {"event": "token", "data": {"token": answer}}
+        yield {"event": "done", "data": {"answer": answer, "fastPath": True}}
+        return
+    if not get_chat_component("streaming_agent_executor"):
+        outcome["route"] = "unavailable"
+        yield {"event": "error", "data": {"error": "Chatbot is not available (LLM or agent initialization failed)."}}
+        return
+
+    cache_key = get_response_cache_key(user_query, chat_history)
+    if cache_key is not None:
+        cached_answer = response_cache.get(cache_key)
+        if cached_answer is not None:
+            outcome["route"] = "response_cache"
+            logger.info("Response cache hit for file_id '%s'", current_file_id_for_tools)
+            yield {"event": "token", "data": {"token": cached_answer}}
+            yield {"event": "done", "data": {"answer": cached_answer, "cached": True}}
+            return
+
+    outcome["route"] = "agent"
+    logger.info("Streaming agent for file_id '%s' with query: %s", current_file_id_for_tools, user_query)
+    file_id = current_file_id_for_tools
+    event_queue = queue.Queue()
+    input_dict = build_agent_input(user_query, chat_history)
+    worker = threading.Thread(target=_run_streaming_agent, args=(input_dict, event_queue, trace), daemon=True)
+    worker.start()
+
+    tools_used = set()
+    while True:
+        event = event_queue.get()
+        if event["event"] == "tool_start":
+            tools_used.add(event["data"]["tool"])
+        elif event["event"] == "done":
+            answer = event["data"]["answer"]
+            if answer is None:
+                event = {"event": "error", "data": {"error": "Agent did not produce an output."}}
+            elif cache_key is not None and not tools_used & CROSS_FILE_TOOLS:
+                response_cache.set(cache_key, answer, file_id=file_id)
+        yield event
+        if event["event"] in ("done", "error"):
+            break
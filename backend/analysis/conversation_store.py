@@ -0,0 +1,166 @@
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text):
+    """Rough token estimate (~4 characters per token), good enough for history budgeting."""
+    return max(1, len(text or "") // 4)
+
+
+def _trim_to_token_budget(text, token_budget):
+    """Keeps the most recent part of a summary when it grows past its token budget."""
+    max_chars = token_budget * 4
+    if len(text) <= max_chars:
+        return text
+    return "..." + text[-(max_chars - 3):]
+
+
+def _first_sentence(text, max_chars=200):
+    sentence = re.split(r"(?<=[.!?])\s", (text or "").strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 3] + "..."
+
+
+def extractive_summarizer(previous_summary, folded_messages, token_budget):
+    """
+    Default summarizer used when no LLM summarizer is configured (or it fails):
+    appends one line per folded turn and trims the result to the token budget.
+    """
+    lines = [previous_summary] if previous_summary else []
+    for message in folded_messages:
+        prefix = "User asked" if message["sender"] == "user" else "Assistant answered"
+        lines.append(f"{prefix}: {_first_sentence(message['text'])}")
+    return _trim_to_token_budget("\n".join(lines), token_budget)
+
+
+class ConversationStore:
+    """
+    Server-side chat history keyed by conversation id.
+    The most recent turns are kept verbatim; older turns are folded into a rolling summary so
+    the history sent to the model stays under a fixed token budget however long the session runs.
+
+    Summarizing may call the LLM, so folds run on a background executor instead of in the request
+    that appended the turn. A conversation has at most one fold in flight; its messages stay in the
+    history until the new summary replaces them, so the history briefly runs over budget instead of
+    losing turns.
+    """
+
+    def __init__(self, max_recent_messages=8, history_token_budget=1500, summary_token_budget=400,
+                 max_conversations=1000, idle_ttl_seconds=24 * 3600, summarizer=None, summary_workers=2):
+        self.max_recent_messages = max_recent_messages
+        self.history_token_budget = history_token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_conversations = max_conversations
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.summarizer = summarizer or extractive_summarizer
+        self._conversations = OrderedDict() # conversation_id -> {"summary", "messages", "updated_at", "folding"}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=summary_workers, thread_name_prefix="conversation-summary")
+
+    def _expire_idle(self):
+        now = time.time()
+        for conversation_id in [cid for cid, conv in self._conversations.items()
+                                if now - conv["updated_at"] > self.idle_ttl_seconds]:
+            del self._conversations[conversation_id]
+
+    def get_or_create(self, conversation_id=None, seed_history=None):
+        """
+        Returns the id of an existing conversation, or creates one (reusing the given id if it is
+        unknown, e.g. after a restart). A new conversation can be seeded from a client-side history.
+        """
+        with self._lock:
+            self._expire_idle()
+            if conversation_id and conversation_id in self._conversations:
+                self._conversations.move_to_end(conversation_id)
+                return conversation_id
+            conversation_id = conversation_id or str(uuid.uuid4())
+            self._conversations[conversation_id] = {"summary": "", "messages": [], "updated_at": time.time(), "folding": False}
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+        if seed_history:
+            messages = [m for m in seed_history
+                        if isinstance(m, dict) and m.get("sender") in ("user", "bot") and "text" in m]
+            self._append_messages(conversation_id, messages)
+        return conversation_id
+
+    def exists(self, conversation_id):
+        with self._lock:
+            return conversation_id in self._conversations
+
+    def get_history(self, conversation_id):
+        """
+        Returns the history to send to the model in the frontend message format:
+        a leading {"sender": "summary"} entry when older turns were folded, then the recent turns.
+        """
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return []
+            history = [{"sender": "summary", "text": conversation["summary"]}] if conversation["summary"] else []
+            return history + list(conversation["messages"])
+
+    def append_turn(self, conversation_id, user_text, bot_text):
+        """Records a question/answer pair and folds older turns into the summary if over budget."""
+        self._append_messages(conversation_id, [{"sender": "user", "text": user_text},
+                                                {"sender": "bot", "text": bot_text}])
+
+    def _append_messages(self, conversation_id, messages):
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return
+            conversation["messages"].extend({"sender": m["sender"], "text": m["text"]} for m in messages)
+            conversation["updated_at"] = time.time()
+            self._schedule_fold(conversation_id, conversation)
+
+    def _schedule_fold(self, conversation_id, conversation):
+        """Starts a background fold of the messages over budget, unless one is running (called under the lock)."""
+        if conversation["folding"]:
+            return
+        folded = self._messages_over_budget(conversation["messages"])
+        if not folded:
+            return
+        conversation["folding"] = True
+        self._executor.submit(self._fold, conversation_id, folded, conversation["summary"])
+
+    def _fold(self, conversation_id, folded, previous_summary):
+        try:
+            summary = self.summarizer(previous_summary, folded, self.summary_token_budget)
+        except Exception as e:
+            logger.warning("Summarizer failed, using extractive summary: %s", e)
+            summary = extractive_summarizer(previous_summary, folded, self.summary_token_budget)
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return
+            # Only this fold changes the summary or removes messages while the flag is set, so the
+            # folded messages are still the oldest ones and previous_summary is still current
+            del conversation["messages"][:len(folded)]
+            conversation["summary"] = _trim_to_token_budget(summary, self.summary_token_budget)
+            conversation["folding"] = False
+            # Turns appended while summarizing may have pushed the history over budget again
+            self._schedule_fold(conversation_id, conversation)
+
+    def _messages_over_budget(self, messages):
+        """The oldest messages to fold while over the message count or token budget (keeps the last turn)."""
+        recent_budget = self.history_token_budget - self.summary_token_budget
+        count = 0
+        tokens = sum(estimate_tokens(m["text"]) for m in messages)
+        while len(messages) - count > 2 and (len(messages) - count > self.max_recent_messages or tokens > recent_budget):
+            tokens -= estimate_tokens(messages[count]["text"])
+            count += 1
+        return messages[:count]
+
+    def delete(self, conversation_id):
+        with self._lock:
+            return self._conversations.pop(conversation_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {"conversations": len(self._conversations)}
@@ -0,0 +1,194 @@
+import re
+
+# Metric aliases, matched longest-first so 'expected revenue' wins over 'revenue'
+METRIC_ALIASES = {
+    'expected revenue': 'Expected Revenue',
+    'deriv revenue': 'Deriv Revenue',
+    'net revenue': 'Deriv Revenue',
+    'revenue': 'Deriv Revenue',
+    "partners' commissions": 'Partner Commissions',
+    'partners commissions': 'Partner Commissions',
+    'partner commissions': 'Partner Commissions',
+    'commissions': 'Partner Commissions',
+    'commission': 'Partner Commissions',
+    'total deposits': 'Total Deposits',
+    'deposits': 'Total Deposits',
+    'active clients': 'Active Clients',
+    'first time traders': 'FTT',
+    'first-time traders': 'FTT',
+    'ftt': 'FTT',
+}
+
+MONTH_NAMES = {
+    'january': 1, 'jan': 1, 'february': 2, 'feb': 2, 'march': 3, 'mar': 3, 'april': 4, 'apr': 4,
+    'may': 5, 'june': 6, 'jun': 6, 'july': 7, 'jul': 7, 'august': 8, 'aug': 8,
+    'september': 9, 'sept': 9, 'sep': 9, 'october': 10, 'oct': 10, 'november': 11, 'nov': 11,
+    'december': 12, 'dec': 12,
+}
+
+# Words suggesting the question depends on earlier turns or asks for more than one tool can answer
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|that|those|them|these|same|also|instead|previous|above|again|why|explain|what about|how about|"
+    r"compare|compared|vs|versus|trend|trends|growth|decline|churn|and|but)\b")
+# Constraints the templated answers cannot honour (top-N lists, filters, ranges, reversed order)
+UNSUPPORTED_CONSTRAINT_PATTERN = re.compile(
+    r"\b(top \d+|\d+ (partners|countries)|bottom|lowest|worst|least|region|regions|last \d+|past \d+|"
+    r"between|from|since|until|excluding|except|average|mean|per partner)\b")
+
+# Constraints none of the fast-path tools take: a data source, or a period other than the one
+# month (and year) the top-partner tool is given
+SOURCE_PATTERN = re.compile(r"\b(my ?affiliates?|dynamic ?works|partner ?dashboard|sources?)\b")
+YEAR_PATTERN = re.compile(r"\b(?:19|20)\d{2}\b")
+MONTH_NAME_PATTERN = re.compile(
+    r"\b(?:" + "|".join(name for name in MONTH_NAMES if name != 'may') + r")\b|\bmay\b\.?,?\s*(?:19|20)\d{2}\b")
+PERIOD_WORD_PATTERN = re.compile(
+    r"\b(q[1-4]|quarter|quarterly|ytd|week|weekly|today|yesterday|(this|last|previous|current) (month|year))\b")
+# Endings of demonyms built on the name ('Kenyan', 'Nigerian', 'Asian'), so they count as the place
+DEMONYM_SUFFIX = r"(?:n|ns|an|ans|ian|ians|ese|i|is|ish)?"
+
+TOP_PARTNER_PATTERN = re.compile(
+    r"\b(top|best|highest|leading|biggest|largest)\b.*\bpartner\b|\bpartner\b.*\b(most|highest|top|best)\b")
+PARTNER_COUNTS_PATTERN = re.compile(
+    r"\b(how many|number of|count|counts)\b.*\bpartners?\b.*\b(by|per|each|every|in each|across)\b.*\bcountr(y|ies)\b"
+    r"|\bpartner counts?\b.*\bcountr(y|ies)\b")
+COUNTRIES_BY_REVENUE_PATTERN = re.compile(
+    r"\bcountries\b.*\b(by|ranked by|ordered by|sorted by|most|highest|top)\b.*\b(deriv revenue|revenue)\b"
+    r"|\b(rank|ranking|list|order)\b.*\bcountries\b.*\brevenue\b"
+    r"|\bwhich countr(y|ies)\b.*\b(most|highest|top)\b.*\brevenue\b")
+
+MIN_CONFIDENCE_DEFAULT = 0.8
+
+
+def _normalize(query):
+    return re.sub(r"\s+", " ", query.lower().replace("’", "'")).strip()
+
+
+def extract_metric(text):
+    for alias in sorted(METRIC_ALIASES, key=len, reverse=True):
+        if re.search(rf"(?<![\w']){re.escape(alias)}(?![\w'])", text):
+            return METRIC_ALIASES[alias]
+    return None
+
+
+def extract_month_year(text):
+    """Returns (month, year) found in the text; either may be None."""
+    month, year = None, None
+    numeric = re.search(r"\b(\d{4})-(\d{1,2})\b|\b(\d{1,2})/(\d{4})\b", text)
+    if numeric:
+        if numeric.group(1):
+            year, month = int(numeric.group(1)), int(numeric.group(2))
+        else:
+            month, year = int(numeric.group(3)), int(numeric.group(4))
+        return (month if 1 <= month <= 12 else None), year
+    for name, number in MONTH_NAMES.items():
+        # 'may' is also a verb, so it only counts when followed by a year
+        pattern = rf"\b{name}\b\.?,?\s*(\d{{4}})" if name == 'may' else rf"\b{name}\b\.?,?\s*(\d{{4}})?"
+        match = re.search(pattern, text)
+        if match:
+            month = number
+            year = int(match.group(1)) if match.group(1) else None
+            break
+    if year is None:
+        year_match = re.search(r"\b(20\d{2})\b", text)
+        year = int(year_match.group(1)) if year_match else None
+    return month, year
+
+
+def find_dimension_values(text, dimension_values):
+    """
+    The country or region names (or their demonyms) of dimension_values ({column: [names]}, e.g.
+    the manifest's dictionaries) mentioned in the normalized text.
+    """
+    found = []
+    for column in ('Country', 'Region'):
+        for name in (dimension_values or {}).get(column, []):
+            name = _normalize(str(name))
+            if name and re.search(rf"(?<![\w']){re.escape(name)}{DEMONYM_SUFFIX}(?![\w'])", text):
+                found.append(name)
+    return found
+
+
+def unconsumed_constraints(text, dimension_values, period_slots=0):
+    """
+    Constraints in the text that the routed tool call would ignore: country or region names, data
+    sources, and periods beyond the period_slots (0, or 1 for the month-and-year of the top-partner
+    tool). A non-empty result means the templated answer would answer a different question.
+    """
+    constraints = find_dimension_values(text, dimension_values)
+    constraints += [match.group(0) for match in SOURCE_PATTERN.finditer(text)]
+    constraints += [match.group(0) for match in PERIOD_WORD_PATTERN.finditer(text)]
+    years = set(YEAR_PATTERN.findall(text))
+    months = {MONTH_NAMES.get(match.group(0).split()[0].rstrip('.,'), match.group(0)) for match in MONTH_NAME_PATTERN.finditer(text)}
+    if len(years) > period_slots or len(months) > period_slots:
+        constraints += sorted(years) + sorted(map(str, months))
+    return constraints
+
+
+def resolve_year(month, available_months):
+    """Picks the most recent year in the data that has the given month."""
+    years = [year for (year, month_number) in available_months if month_number == month]
+    return max(years) if years else None
+
+
+def route_query(query, available_months=None, dimension_values=None):
+    """
+    Parses a chat query into a single tool call.
+    Returns {"intent", "tool", "args", "confidence"} or None when no pattern matches.
+    available_months is an iterable of (year, month) pairs present in the data, used to fill a missing year.
+    dimension_values ({'Country': [...], 'Region': [...]}) lists the place names in the data: a query
+    naming one, a data source or an extra period is not fully covered by the tool's arguments, and
+    gets confidence 0 so the agent answers it.
+    """
+    if not isinstance(query, str) or not query.strip():
+        return None
+    text = _normalize(query)
+    available_months = set(available_months or [])
+
+    confidence = 1.0
+    if FOLLOW_UP_PATTERN.search(text):
+        confidence -= 0.5
+    if UNSUPPORTED_CONSTRAINT_PATTERN.search(text):
+        confidence -= 0.5
+
+    if PARTNER_COUNTS_PATTERN.search(text):
+        if extract_metric(text) is not None or unconsumed_constraints(text, dimension_values):
+            confidence = 0.0
+        return {"intent": "partner_counts_by_country", "tool": "get_partner_counts_by_country_tool",
+                "args": {}, "confidence": confidence}
+
+    if COUNTRIES_BY_REVENUE_PATTERN.search(text):
+        metric = extract_metric(text)
+        if metric not in (None, 'Deriv Revenue'):
+            confidence -= 0.5
+        if unconsumed_constraints(text, dimension_values):
+            confidence = 0.0
+        return {"intent": "countries_by_revenue", "tool": "get_countries_by_revenue",
+                "args": {}, "confidence": confidence}
+
+    if TOP_PARTNER_PATTERN.search(text):
+        metric = extract_metric(text)
+        month, year = extract_month_year(text)
+        if re.search(r"\b(each|every|per|by) (country|countries|region)\b", text):
+            confidence -= 0.5
+        if metric is None or month is None or unconsumed_constraints(text, dimension_values, period_slots=1):
+            return {"intent": "top_partner", "tool": "get_top_partner_tool", "args": {}, "confidence": 0.0}
+        if year is None:
+            year = resolve_year(month, available_months)
+            if year is None:
+                return {"intent": "top_partner", "tool": "get_top_partner_tool", "args": {}, "confidence": 0.0}
+            confidence -= 0.1
+        return {"intent": "top_partner", "tool": "get_top_partner_tool",
+                "args": {"metric": metric, "year": year, "month": month}, "confidence": confidence}
+
+    return None
+
+
+ANSWER_TEMPLATES = {
+    "top_partner": "{output}",
+    "partner_counts_by_country": "Here is the number of unique partners in each country:\n\n{output}",
+    "countries_by_revenue": "Here are the countries ranked by total Deriv Revenue:\n\n{output}",
+}
+
+
+def render_answer(intent, tool_output):
+    return ANSWER_TEMPLATES.get(intent, "{output}").format(output=tool_output.strip())
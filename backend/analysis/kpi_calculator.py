@@ -1,5 +1,13 @@
+import logging
+
 import pandas as pd
 
+from backend.utils.metrics import time_stage
+from backend.utils.metric_dtypes import widen_metric_dtypes
+
+logger = logging.getLogger(__name__)
+
+@time_stage("kpi")
 def calculate_kpis(df):
     """
     Calculates KPIs from the DataFrame.
@@ -18,6 +26,7 @@ def calculate_kpis(df):
     missing_cols = [col for col in required_columns if col not in df.columns]
     if missing_cols:
         return {"error": f"Missing required columns: {missing_cols}"}
+    df = widen_metric_dtypes(df)
 
     try:
         # Convert 'Date' column to datetime if it's not already
@@ -48,7 +57,7 @@ def calculate_kpis(df):
             all_months_in_df = df['Date'].dt.to_period('M').unique()
             monthly_active_partners_series = pd.Series(0, index=all_months_in_df)
     else:
-        print("[KPI Calculator] Warning: 'Partner ID' column not found, cannot calculate monthly active partners.")
+        logger.warning("'Partner ID' column not found, cannot calculate monthly active partners.")
         # Create a series with 0s for all months present in the original df if 'Partner ID' is missing
         all_months_in_df = df['Date'].dt.to_period('M').unique()
         monthly_active_partners_series = pd.Series(0, index=all_months_in_df)
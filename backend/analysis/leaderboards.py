@@ -0,0 +1,141 @@
+import os
+import threading
+
+import pandas as pd
+
+from backend.utils.metrics import time_stage
+from backend.utils.metric_dtypes import widen_metric_dtypes
+
+PARTNER_KEYS = ['Partner ID', 'Country', 'Region']
+NON_METRIC_COLUMNS = {'Partner ID', 'Country', 'Region', 'Date', 'DataSource'}
+ALL_PERIODS = 'all' # Period of the whole-file totals
+ALL_REGIONS = '' # Scope of the unscoped rankings
+
+
+def build_leaderboards(df, k=25):
+    """
+    Top-k and bottom-k partners (with Country and Region) for every metric, per month ('YYYY-MM')
+    and over the whole file ('all'), overall and within each Region. Partners are ranked by the sum
+    of the metric over their rows, ties broken by Partner ID / Country / Region like
+    get_top_partner_for_metric_month. One row per entry:
+    Metric, Period, Region scope, Direction ('top'/'bottom'), Rank (1-based), Partner ID, Country, Region, Value.
+    """
+    metrics = [col for col in df.columns
+               if col not in NON_METRIC_COLUMNS and pd.api.types.is_numeric_dtype(df[col])]
+    if df.empty or not metrics or any(col not in df.columns for col in [*PARTNER_KEYS, 'Date']):
+        return pd.DataFrame(columns=['Metric', 'Period', 'Scope', 'Direction', 'Rank', *PARTNER_KEYS, 'Value'])
+
+    df = widen_metric_dtypes(df)
+    periods = pd.to_datetime(df['Date']).dt.strftime('%Y-%m').rename('Period')
+    monthly = df.groupby([periods, *[df[key] for key in PARTNER_KEYS]], observed=True)[metrics].sum().reset_index()
+    totals = monthly.groupby(PARTNER_KEYS, observed=True)[metrics].sum().reset_index()
+    zeros = _missing_partner_months(monthly, totals[PARTNER_KEYS], metrics, k)
+    if not zeros.empty:
+        monthly = pd.concat([monthly, zeros], ignore_index=True).sort_values(['Period', *PARTNER_KEYS], kind='stable')
+    totals.insert(0, 'Period', ALL_PERIODS)
+    partner_values = pd.concat([monthly, totals], ignore_index=True)
+
+    boards = []
+    for metric in metrics:
+        values = partner_values[['Period', *PARTNER_KEYS, metric]].rename(columns={metric: 'Value'})
+        for direction, ascending in (('top', False), ('bottom', True)):
+            ranked = values.sort_values('Value', ascending=ascending, kind='stable')
+            for scope_keys in (['Period'], ['Period', 'Region']):
+                board = ranked.groupby(scope_keys, sort=False, observed=True).head(k).copy()
+                board['Rank'] = board.groupby(scope_keys, sort=False, observed=True).cumcount() + 1
+                board['Scope'] = board['Region'].astype(str) if 'Region' in scope_keys else ALL_REGIONS
+                board['Metric'] = metric
+                board['Direction'] = direction
+                boards.append(board)
+    leaderboards = pd.concat(boards, ignore_index=True)
+    # The label columns repeat heavily, so they are stored as dictionary-encoded categoricals
+    for column in ('Metric', 'Period', 'Scope', 'Direction'):
+        leaderboards[column] = leaderboards[column].astype('category')
+    leaderboards['Rank'] = leaderboards['Rank'].astype('int32')
+    return leaderboards[['Metric', 'Period', 'Scope', 'Direction', 'Rank', *PARTNER_KEYS, 'Value']]
+
+
+def _missing_partner_months(monthly, roster, metrics, k):
+    """
+    Zero-valued rows for partners without a row in a month (months without activity are not
+    stored), so they rank as zero. Only the first k missing partners per month and region (in
+    Partner ID / Country / Region order, the tie order at zero) can enter a board, so no more are added.
+    """
+    roster_index = pd.MultiIndex.from_frame(roster)
+    fills = []
+    for period, rows in monthly.groupby('Period', sort=False):
+        missing = roster[~roster_index.isin(pd.MultiIndex.from_frame(rows[PARTNER_KEYS]))]
+        missing = missing.groupby('Region', sort=False).head(k)
+        if not missing.empty:
+            fills.append(missing.assign(Period=period))
+    if not fills:
+        return pd.DataFrame(columns=monthly.columns)
+    zeros = pd.concat(fills, ignore_index=True)
+    zeros[metrics] = 0.0
+    return zeros[monthly.columns]
+
+
+def lookup_leaderboard(leaderboards, metric, period=ALL_PERIODS, n=10, direction='top', region=None):
+    """
+    The first n entries of one leaderboard as records (Rank, Partner ID, Country, Region, Value).
+    Returns None when the leaderboards cannot answer: an unknown metric, or n above the k they were
+    built with while the leaderboard holds k entries (more partners may exist). A period or region
+    without data gives an empty list.
+    """
+    if leaderboards is None or leaderboards.empty or metric not in set(leaderboards['Metric']):
+        return None
+    board = leaderboards[(leaderboards['Metric'] == metric) & (leaderboards['Period'] == period)
+                         & (leaderboards['Scope'] == (str(region) if region else ALL_REGIONS))
+                         & (leaderboards['Direction'] == direction)]
+    k = int(leaderboards['Rank'].max())
+    if n > k and len(board) >= k:
+        return None
+    board = board.sort_values('Rank').head(n)
+    return board[['Rank', *PARTNER_KEYS, 'Value']].to_dict('records')
+
+
+def rank_partners(df, metric, period=ALL_PERIODS, n=10, direction='top', region=None):
+    """
+    The same records as lookup_leaderboard, computed from the processed rows; used when the
+    stored leaderboards cannot answer. None if the metric is not a numeric column of df.
+    """
+    if metric not in df.columns or not pd.api.types.is_numeric_dtype(df[metric]):
+        return None
+    df = df[[*PARTNER_KEYS, 'Date', metric]]
+    if region:
+        df = df[df['Region'].astype(str) == str(region)]
+    # Every month is kept: partners without a row in the period still rank, as zero
+    if df.empty:
+        return []
+    return lookup_leaderboard(build_leaderboards(df, k=n), metric, period, n, direction, region)
+
+
+def month_period(year, month):
+    return f"{int(year)}-{int(month):02d}"
+
+
+def top_partner_result(entry, metric, year, month):
+    """Formats a leaderboard entry like get_top_partner_for_metric_month's result."""
+    return {'Partner ID': entry['Partner ID'], 'Country': entry['Country'], 'Region': entry['Region'],
+            metric: entry['Value'], 'Year': year, 'Month': month, 'Metric': metric}
+
+
+# Leaderboards read from disk, by path, with the mtime they were read at
+_cache = {}
+_cache_lock = threading.Lock()
+
+def read_leaderboards(path):
+    """Reads a leaderboards file, reusing the parsed copy while the file is unchanged. None if it is missing."""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+    with time_stage("feather_read"):
+        leaderboards = pd.read_feather(path)
+    with _cache_lock:
+        _cache[path] = (mtime_ns, leaderboards)
+    return leaderboards
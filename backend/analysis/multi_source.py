@@ -0,0 +1,118 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from backend.utils.metrics import time_stage
+from backend.utils.metric_dtypes import widen_metric_dtypes
+from backend.utils.dotenv_loader import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('myAffiliate', 'dynamicWorks')
+# 'both' analyses the rows of every source together, 'difference' nets them per partner-date (myAffiliate - dynamicWorks)
+VIEWS = (*SOURCES, 'both', 'difference')
+DIMENSION_COLUMNS = ['Partner ID', 'Country', 'Region', 'Date', 'DataSource']
+
+
+class MultiSourceDataset:
+    """
+    The processed rows of one file per source held in a single frame, with DataSource as a
+    categorical dimension. Rows are grouped by source so selecting one source is a slice, and the
+    per-source per-date and monthly metric totals are aggregated once, when the dataset is built.
+    """
+
+    def __init__(self, frames_by_source, file_ids_by_source=None):
+        parts = []
+        self.source_slices = {}
+        offset = 0
+        for source, df in frames_by_source.items():
+            parts.append(widen_metric_dtypes(df).assign(DataSource=source))
+            self.source_slices[source] = slice(offset, offset + len(df))
+            offset += len(df)
+        combined = pd.concat(parts, ignore_index=True)
+        combined['DataSource'] = pd.Categorical(combined['DataSource'], categories=list(frames_by_source))
+        if not pd.api.types.is_datetime64_any_dtype(combined['Date']):
+            combined['Date'] = pd.to_datetime(combined['Date'])
+        self.metrics = [col for col in combined.columns
+                        if col not in DIMENSION_COLUMNS and pd.api.types.is_numeric_dtype(combined[col])]
+        self.df = combined
+        self.file_ids_by_source = dict(file_ids_by_source or {})
+        with time_stage("source_cube"):
+            # Per source and date sums (the cube /query answers sum-only queries from), rolled up to months
+            self.date_totals = combined.groupby(['DataSource', 'Date'], observed=True)[self.metrics].sum().reset_index()
+            self.monthly_totals = self.date_totals.groupby(
+                ['DataSource', self.date_totals['Date'].dt.to_period('M').rename('Month')], observed=False
+            )[self.metrics].sum()
+
+    @property
+    def sources(self):
+        return list(self.source_slices)
+
+    def select(self, view, start_date=None, end_date=None):
+        """
+        Rows for one of VIEWS, optionally restricted to dates in [start_date, end_date), in the
+        processed-data shape so calculate_kpis and analyze_performance run on them unchanged.
+        """
+        if view in self.source_slices:
+            df = self.df.iloc[self.source_slices[view]]
+        elif view in ('both', 'difference'):
+            df = self.df
+        else:
+            raise ValueError(f"Unknown view '{view}'. Expected one of {list(VIEWS)}")
+        if start_date is not None and end_date is not None:
+            df = df[(df['Date'] >= start_date) & (df['Date'] < end_date)]
+        if view == 'difference':
+            df = self._difference(df)
+        return df.reset_index(drop=True)
+
+    def _difference(self, df):
+        """Nets the metrics per partner-date: the first source's rows add, every other source's rows subtract."""
+        signs = (df['DataSource'] == self.sources[0]).map({True: 1, False: -1}).astype('int8').to_numpy()
+        signed = df[self.metrics].mul(signs, axis=0)
+        signed[['Partner ID', 'Date', 'Country', 'Region']] = df[['Partner ID', 'Date', 'Country', 'Region']]
+        aggregations = {metric: 'sum' for metric in self.metrics}
+        aggregations.update({'Country': 'first', 'Region': 'first'})
+        difference = signed.groupby(['Partner ID', 'Date'], sort=True).agg(aggregations).reset_index()
+        difference['DataSource'] = 'difference'
+        return difference[['Partner ID', 'Country', 'Region', 'Date', *self.metrics, 'DataSource']]
+
+    def monthly_series(self, metric, months):
+        """Monthly totals of metric per source for the given month periods (0 where a source has no data)."""
+        series = {}
+        for source in self.sources:
+            series[source] = self.monthly_totals.loc[source, metric].reindex(months, fill_value=0).tolist()
+        return series
+
+
+# Recently built datasets, keyed by the (source, file_id, mtime) of their files so appends or
+# re-uploads produce a new dataset instead of a stale one
+_datasets = OrderedDict()
+_datasets_lock = threading.Lock()
+MAX_CACHED_DATASETS = int(get_env_variable('MULTI_SOURCE_MAX_DATASETS', '2'))
+
+
+def get_multi_source_dataset(files_by_source):
+    """
+    Returns the MultiSourceDataset for {source: (file_id, processed_path)}, reading the files only
+    when that combination (or one of its files) has not been loaded before.
+    """
+    key = tuple((source, file_id, os.stat(path).st_mtime_ns) for source, (file_id, path) in files_by_source.items())
+    with _datasets_lock:
+        dataset = _datasets.get(key)
+        if dataset is not None:
+            _datasets.move_to_end(key)
+            return dataset
+
+    with time_stage("feather_read"):
+        frames = {source: pd.read_feather(path) for source, (_, path) in files_by_source.items()}
+    dataset = MultiSourceDataset(frames, {source: file_id for source, (file_id, _) in files_by_source.items()})
+    logger.info("Built multi-source dataset for %s: %d rows", dataset.file_ids_by_source, len(dataset.df))
+
+    with _datasets_lock:
+        _datasets[key] = dataset
+        while len(_datasets) > MAX_CACHED_DATASETS:
+            _datasets.popitem(last=False)
+    return dataset
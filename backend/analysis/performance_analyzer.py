@@ -1,6 +1,15 @@
+import logging
+
 import pandas as pd
 import numpy as np
 
+from backend.utils.metrics import time_stage
+from backend.utils.metric_dtypes import widen_metric_dtypes
+from backend.analysis.anomaly_detector import detect_anomalies
+
+logger = logging.getLogger(__name__)
+
+@time_stage("performance")
 def analyze_performance(df):
     """
     Analyzes partner and regional performance.
@@ -19,6 +28,7 @@ def analyze_performance(df):
     missing_base_cols = [col for col in base_required_columns if col not in df.columns]
     if missing_base_cols:
         return {"error": f"Missing base columns for performance analysis: {missing_base_cols}"}
+    df = widen_metric_dtypes(df)
     
     # Convert 'Date' and ensure 'Deriv Revenue' is numeric
     try:
@@ -56,9 +66,9 @@ def analyze_performance(df):
     # Optionally merge details for bottom partners too (similar logic as above)
     bottom_partners_list = bottom_partners_revenue.to_dict(orient='records')
     
-    # Potentially underperforming/loss-generating (example: Deriv Revenue <= 0)
+    # Potentially underperforming/loss-generating (Deriv Revenue < 0; zero rows add nothing to the sums)
     # Modified approach to preserve Country and Region information
-    loss_records = df[df['Deriv Revenue'] <= 0].copy()
+    loss_records = df[df['Deriv Revenue'] < 0].copy()
     
     if not loss_records.empty:
         # First check if Country and Region columns exist
@@ -116,7 +126,7 @@ def analyze_performance(df):
 
                 partners_with_positive_commissions_list = partner_commission_summary.to_dict(orient='records')
         except Exception as e:
-            print(f"Error analyzing positive commissions: {e}") # Log error
+            logger.error("Error analyzing positive commissions: %s", e)
             # Optionally add error info to results
             performance_results["positive_commissions_analysis_error"] = str(e)
 
@@ -144,10 +154,9 @@ def analyze_performance(df):
         country_trends['Month'] = country_trends['Month'].astype(str)
         # country_pivot = country_trends.pivot(index='Month', columns='Country', values='Deriv Revenue').fillna(0).reset_index()
         performance_results["country_revenue_trends"] = country_trends.to_dict(orient='records')
-        
-        # At-risk partners/regions (placeholder - complex logic, e.g., consistent decline)
-        # This would require more sophisticated trend analysis (e.g., rolling averages, slope of revenue over time)
-        performance_results["at_risk_partners_regions_notes"] = "At-risk detection requires more advanced trend analysis (e.g., consistent decline over several periods). Placeholder."
+
+        # Unusual months and month-over-month jumps of every partner and country revenue series
+        performance_results["anomalies"] = detect_anomalies(df)
     else:
         performance_results["regional_analysis_skipped"] = f"Skipped regional/country analysis due to missing columns: {missing_regional_cols}"
 
@@ -184,6 +193,7 @@ def convert_numpy_types(obj):
 def get_top_partner_for_metric_month(df, metric, year, month):
     """Finds the top performing partner for a specific metric in a given month."""
     try:
+        df = widen_metric_dtypes(df)
         # Ensure Date column is datetime type
         if not pd.api.types.is_datetime64_any_dtype(df['Date']):
             df['Date'] = pd.to_datetime(df['Date'])
@@ -198,7 +208,11 @@ def get_top_partner_for_metric_month(df, metric, year, month):
             return {"error": f"Metric '{metric}' not found in data"}
         
         # Group by Partner ID and get the sum of the metric
-        partner_performance = filtered_df.groupby(['Partner ID', 'Country', 'Region'])[metric].sum().reset_index()
+        partner_keys = ['Partner ID', 'Country', 'Region']
+        partner_performance = filtered_df.groupby(partner_keys)[metric].sum()
+        # Partners without a row this month (months without activity are not stored) count as zero
+        roster = pd.MultiIndex.from_frame(df[partner_keys].dropna().drop_duplicates())
+        partner_performance = partner_performance.reindex(partner_performance.index.union(roster), fill_value=0).reset_index()
         
         if partner_performance.empty:
             return {"message": f"No data found for {metric} in {month}/{year}"}
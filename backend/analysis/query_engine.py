@@ -0,0 +1,266 @@
+import logging
+
+import pandas as pd
+import pyarrow as pa
+
+from backend.utils.metrics import time_stage
+from backend.utils.metric_dtypes import widen_metric_dtypes
+from backend.utils.data_transformer import PARTNER_KEYS, fill_partner_dates
+
+logger = logging.getLogger(__name__)
+
+# Dimension names accepted in queries -> processed data columns
+DIMENSIONS = {
+    'Partner': 'Partner ID',
+    'Partner ID': 'Partner ID',
+    'Country': 'Country',
+    'Region': 'Region',
+    'DataSource': 'DataSource',
+    'date': 'Date',
+}
+# Period dimensions, derived from Date
+PERIODS = {'month': 'M', 'quarter': 'Q', 'year': 'Y'}
+AGGREGATIONS = {'sum', 'mean', 'min', 'max', 'count', 'nunique'}
+FILTER_OPS = {'==', '!=', '>', '>=', '<', '<=', 'in', 'not_in'}
+MAX_LIMIT = 10000
+
+
+def column_kind(dtype):
+    """'datetime', 'numeric' or 'string' for a pandas dtype or pyarrow type, to validate filter values."""
+    if isinstance(dtype, pa.DataType):
+        if pa.types.is_timestamp(dtype) or pa.types.is_date(dtype):
+            return 'datetime'
+        if pa.types.is_integer(dtype) or pa.types.is_floating(dtype) or pa.types.is_decimal(dtype):
+            return 'numeric'
+        return 'string'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'datetime'
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        return 'numeric'
+    return 'string'
+
+
+def _coerce_filter_value(value, kind):
+    """The value converted for comparison with a column of the kind, or raises ValueError."""
+    if isinstance(value, (bool, list, dict)) or value is None:
+        raise ValueError
+    if kind == 'datetime':
+        try:
+            return pd.Timestamp(value)
+        except (TypeError, OverflowError) as e:
+            raise ValueError from e
+    if kind == 'numeric':
+        if isinstance(value, (int, float)):
+            return value
+        number = float(value)
+        return int(number) if number.is_integer() else number
+    return str(value)
+
+
+def parse_query(spec, available_columns):
+    """
+    Validates a /query request body and normalizes it. Returns (query, None) or (None, error message).
+    available_columns is a list of column names, or {name: column_kind} so filter values are checked
+    against (and converted to) the column's type.
+
+    spec:
+      dimensions: names from DIMENSIONS or PERIODS, e.g. ["Country", "month"]
+      metrics: [{"column": "Deriv Revenue", "agg": "sum", "as": "revenue"}, ...]; "as" is optional
+      filters: [{"column": "Region", "op": "in", "value": ["LatAm"]}, {"column": "Date", "op": ">=", "value": "2025-01-01"}]
+      sort: [{"column": "revenue", "desc": true}]
+      limit: maximum rows returned
+    """
+    if not isinstance(spec, dict):
+        return None, "Query must be a JSON object"
+    for key in ('dimensions', 'metrics', 'filters', 'sort'):
+        if not isinstance(spec.get(key, []), list):
+            return None, f"'{key}' must be a list"
+
+    dimensions = []
+    for name in spec.get('dimensions', []):
+        if not isinstance(name, str):
+            return None, f"Dimension names must be strings, got {name!r}"
+        if name in PERIODS:
+            dimensions.append({'name': name, 'column': 'Date', 'period': PERIODS[name]})
+        elif name in DIMENSIONS and DIMENSIONS[name] in available_columns:
+            dimensions.append({'name': name, 'column': DIMENSIONS[name], 'period': None})
+        else:
+            return None, f"Unknown dimension '{name}'. Available: {sorted(set(DIMENSIONS) | set(PERIODS))}"
+
+    metrics = []
+    for metric in spec.get('metrics', []):
+        if isinstance(metric, str):
+            metric = {'column': metric}
+        if not isinstance(metric, dict):
+            return None, f"Metrics must be column names or objects, got {metric!r}"
+        column, agg = metric.get('column'), metric.get('agg', 'sum')
+        if column not in available_columns:
+            return None, f"Unknown metric column '{column}'"
+        if agg not in AGGREGATIONS:
+            return None, f"Unknown aggregation '{agg}'. Available: {sorted(AGGREGATIONS)}"
+        metrics.append({'column': column, 'agg': agg, 'name': metric.get('as') or f"{column}_{agg}"})
+    if not metrics:
+        return None, "At least one metric is required"
+
+    filters = []
+    for f in spec.get('filters', []):
+        if not isinstance(f, dict):
+            return None, f"Filters must be objects, got {f!r}"
+        column, op, value = f.get('column'), f.get('op', '=='), f.get('value')
+        if not isinstance(column, str) or not isinstance(op, str):
+            return None, "Filter column and op must be strings"
+        column = DIMENSIONS.get(column, column)
+        if column not in available_columns:
+            return None, f"Unknown filter column '{column}'"
+        if op not in FILTER_OPS:
+            return None, f"Unknown filter op '{op}'. Available: {sorted(FILTER_OPS)}"
+        if op in ('in', 'not_in') and not isinstance(value, list):
+            return None, f"Filter op '{op}' needs a list value"
+        if isinstance(available_columns, dict):
+            kind = available_columns[column]
+            try:
+                if op in ('in', 'not_in'):
+                    value = [_coerce_filter_value(item, kind) for item in value]
+                else:
+                    value = _coerce_filter_value(value, kind)
+            except ValueError:
+                return None, f"Filter value {f.get('value')!r} does not match the {kind} column '{column}'"
+        filters.append({'column': column, 'op': op, 'value': value})
+
+    output_names = [d['name'] for d in dimensions] + [m['name'] for m in metrics]
+    sort = []
+    for s in spec.get('sort', []):
+        if isinstance(s, str):
+            s = {'column': s}
+        if not isinstance(s, dict):
+            return None, f"Sort entries must be column names or objects, got {s!r}"
+        if s.get('column') not in output_names:
+            return None, f"Sort column '{s.get('column')}' is not one of the output columns {output_names}"
+        sort.append({'column': s['column'], 'desc': bool(s.get('desc', False))})
+
+    limit = spec.get('limit')
+    if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int) or limit < 1):
+        return None, "limit must be a positive integer"
+    limit = min(limit or MAX_LIMIT, MAX_LIMIT)
+
+    return {'dimensions': dimensions, 'metrics': metrics, 'filters': filters, 'sort': sort, 'limit': limit}, None
+
+
+def plan_query(query, cube_columns):
+    """
+    Picks the cheapest data able to answer the query: the per-date, per-source metric sums ('cube')
+    when every referenced column is in them and every aggregation is a sum (sums of sums are exact),
+    otherwise the raw partner rows ('raw').
+    """
+    referenced = {d['column'] for d in query['dimensions']}
+    referenced |= {m['column'] for m in query['metrics']}
+    referenced |= {f['column'] for f in query['filters']}
+    if cube_columns and referenced <= set(cube_columns) and all(m['agg'] == 'sum' for m in query['metrics']):
+        return 'cube'
+    return 'raw'
+
+
+def _filter_mask(df, f):
+    column = df[f['column']]
+    value = f['value']
+    if f['column'] == 'Date':
+        value = pd.to_datetime(value)
+    op = f['op']
+    if op == 'in':
+        return column.isin(value)
+    if op == 'not_in':
+        return ~column.isin(value)
+    return {'==': column.__eq__, '!=': column.__ne__, '>': column.__gt__,
+            '>=': column.__ge__, '<': column.__lt__, '<=': column.__le__}[op](value)
+
+
+def _apply_filters(df, filters):
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for f in filters:
+        mask &= _filter_mask(df, f)
+    return df[mask]
+
+
+def _fill_partner_grid(df, filters):
+    """
+    The partner rows with a zero row for every partner-date that is not stored (partner-dates without
+    activity are dropped at ingest), so per-row aggregations (count, mean, min, max, nunique) see
+    the full partner x date grid of each source. Filters on partner keys and DataSource are applied
+    first and Date filters narrow the dates filled in, so only the selected part of the grid is built.
+    """
+    partner_filters = [f for f in filters if f['column'] in (*PARTNER_KEYS, 'DataSource')]
+    date_filters = [f for f in filters if f['column'] == 'Date']
+    if 'DataSource' in df.columns:
+        parts = [part for _, part in df.groupby('DataSource', observed=True, sort=False)]
+    else:
+        parts = [df]
+    filled = []
+    for part in parts:
+        dates = _apply_filters(pd.DataFrame({'Date': part['Date'].unique()}), date_filters)['Date']
+        filled.append(fill_partner_dates(_apply_filters(part, partner_filters), dates))
+    return pd.concat(filled, ignore_index=True) if len(filled) > 1 else filled[0]
+
+
+def _to_json_list(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return [v.strftime('%Y-%m-%d') if pd.notna(v) else None for v in values]
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def run_query(df, query):
+    """Filters, groups and aggregates df for a parsed query. Returns the result in columnar form."""
+    df = widen_metric_dtypes(df)
+    if 'Partner ID' in df.columns and any(m['agg'] != 'sum' for m in query['metrics']):
+        df = _fill_partner_grid(df, query['filters'])
+    df = _apply_filters(df, query['filters'])
+
+    group_keys = []
+    for d in query['dimensions']:
+        if d['period']:
+            group_keys.append(df['Date'].dt.to_period(d['period']).astype(str).rename(d['name']))
+        else:
+            group_keys.append(df[d['column']].rename(d['name']))
+    aggregations = {m['name']: (m['column'], m['agg']) for m in query['metrics']}
+
+    if group_keys:
+        result = df.groupby(group_keys, sort=True, observed=True, dropna=False).agg(**aggregations).reset_index()
+    else:
+        result = pd.DataFrame({name: [df[column].agg(agg)] for name, (column, agg) in aggregations.items()})
+
+    if query['sort']:
+        result = result.sort_values([s['column'] for s in query['sort']],
+                                    ascending=[not s['desc'] for s in query['sort']], kind='stable')
+    total_rows = len(result)
+    result = result.head(query['limit'])
+    return {
+        "columns": list(result.columns),
+        "data": [_to_json_list(result[col]) for col in result.columns],
+        "rowCount": len(result),
+        "totalRows": total_rows,
+    }
+
+
+def execute_query(spec, raw_columns, cube_columns, load_raw, load_cube):
+    """
+    Parses, plans and runs a query. load_cube returns the per-date metric sums (Date, DataSource and
+    the summed metrics listed in cube_columns) or None when they are unavailable; load_raw returns
+    the processed rows. Each is called only if the plan needs it.
+    Returns the columnar result or {"error": ...}.
+    """
+    query, error = parse_query(spec, raw_columns)
+    if error:
+        return {"error": error}
+
+    cube = None
+    plan = 'raw'
+    if plan_query(query, cube_columns) == 'cube':
+        cube = load_cube()
+        plan = 'cube' if cube is not None else 'raw'
+
+    with time_stage("query"):
+        result = run_query(cube if plan == 'cube' else load_raw(), query)
+    result["plan"] = plan
+    logger.debug("Query answered from %s: %d of %d rows", plan, result["rowCount"], result["totalRows"])
+    return result
@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    """
+    Normalizes a chat query so near-verbatim repeats share a cache entry:
+    lower-cased, punctuation stripped (except characters that matter inside numbers/dates)
+    and whitespace collapsed.
+    """
+    if not isinstance(query, str):
+        return ""
+    normalized = query.lower().replace("’", "'")
+    normalized = re.sub(r"[^\w\s'$%./-]", " ", normalized)
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    return normalized.strip(" .?!")
+
+
+def chat_history_digest(chat_history, max_messages=4):
+    """
+    Digest of the most recent chat turns. Only the tail of the conversation can change the
+    meaning of a follow-up question, so older turns are left out of the key.
+    """
+    if not chat_history:
+        return ""
+    recent = []
+    for message in chat_history[-max_messages:]:
+        if isinstance(message, dict):
+            recent.append([message.get("sender"), normalize_query(message.get("text", ""))])
+        else:
+            recent.append([type(message).__name__, normalize_query(getattr(message, "content", ""))])
+    return hashlib.sha256(json.dumps(recent).encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """In-memory LRU cache of chatbot answers with a time-to-live per entry."""
+
+    def __init__(self, ttl_seconds=3600, max_entries=1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key hash -> {"file_id", "created_at", "answer"}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(file_context, query, chat_history, model_name):
+        """Hashes (file context, normalized query, chat-history digest, model name) into a key."""
+        key_parts = [list(file_context) if isinstance(file_context, tuple) else file_context,
+                     normalize_query(query), chat_history_digest(chat_history), model_name]
+        return hashlib.sha256(json.dumps(key_parts, default=str).encode("utf-8")).hexdigest()
+
+    def _is_expired(self, entry):
+        return self.ttl_seconds is not None and time.time() - entry["created_at"] > self.ttl_seconds
+
+    def get(self, key):
+        """Returns the cached answer or None on a miss or expired entry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["answer"]
+
+    def set(self, key, answer, file_id=None):
+        with self._lock:
+            self._store(key, {"file_id": file_id, "created_at": time.time(), "answer": answer})
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def invalidate_file(self, file_id):
+        """Drops every cached answer computed against the given file."""
+        with self._lock:
+            stale_keys = [key for key, entry in self._entries.items() if entry.get("file_id") == file_id]
+            for key in stale_keys:
+                self._remove(key)
+            return len(stale_keys)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    # Storage hooks, overridden by the file-backed implementation
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+
+
+class FileResponseCache(ResponseCache):
+    """
+    File-backed response cache: one JSON file per entry under cache_dir, so cached answers
+    survive restarts and can be inspected or seeded offline. Entries are also held in memory,
+    so hits never wait on disk.
+    """
+
+    def __init__(self, cache_dir, ttl_seconds=3600, max_entries=1000):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_existing_entries()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_existing_entries(self):
+        loaded = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.cache_dir, filename), "r") as f:
+                    entry = json.load(f)
+                loaded.append((filename[:-len(".json")], entry))
+            except Exception as e:
+                logger.warning("Skipping unreadable cache entry %s: %s", filename, e)
+        # Oldest first so LRU order matches creation time
+        for key, entry in sorted(loaded, key=lambda item: item[1].get("created_at", 0)):
+            if self._is_expired(entry):
+                self._remove(key)
+            else:
+                self._entries[key] = entry
+
+    def _store(self, key, entry):
+        super()._store(key, entry)
+        temp_path = self._entry_path(key) + ".tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(temp_path, self._entry_path(key))
+        except Exception as e:
+            logger.warning("Failed to persist cache entry: %s", e)
+
+    def _remove(self, key):
+        super()._remove(key)
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
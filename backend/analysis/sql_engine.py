@@ -0,0 +1,290 @@
+"""
+Optional in-process SQL engine (DuckDB) over all processed files.
+
+Each processed feather file is exposed to DuckDB as an Arrow dataset, so queries spanning many
+uploads scan only the columns and rows they need (projection and filter pushdown), in parallel and
+without loading the files into pandas first. Callers cannot send SQL: they pick one of
+SQL_TEMPLATES and pass parameters, which are validated against whitelists (identifiers) or bound as
+query parameters (values).
+
+SQL_ENGINE: 'duckdb' (default; used when the duckdb package is installed) or 'off'.
+SQL_ENGINE_THREADS / SQL_ENGINE_MEMORY_LIMIT (e.g. '2GB') bound DuckDB's resources; above the
+memory limit it spills to SQL_ENGINE_TEMP_DIRECTORY.
+"""
+import os
+import math
+import logging
+import threading
+from datetime import date, datetime, time
+
+from backend.utils.dotenv_loader import get_env_variable
+from backend.utils.lazy_loader import LazyResource
+from backend.utils.metrics import time_stage
+from backend.utils.metric_dtypes import CURRENCY_DECIMALS
+from backend.analysis.date_aggregates import KPI_METRICS
+
+logger = logging.getLogger(__name__)
+
+METRICS = list(KPI_METRICS)
+# Grouping choices -> SQL expression over the combined files (FileId is added per file)
+GROUP_BY_EXPRESSIONS = {
+    'Region': '"Region"',
+    'Country': '"Country"',
+    'Partner ID': '"Partner ID"',
+    'DataSource': '"DataSource"',
+    'FileId': '"FileId"',
+    'month': 'strftime("Date", \'%Y-%m\')',
+    'quarter': 'concat(year("Date"), \'Q\', quarter("Date"))',
+    'year': 'CAST(year("Date") AS VARCHAR)',
+}
+AGGREGATIONS = {'sum': 'SUM', 'avg': 'AVG', 'min': 'MIN', 'max': 'MAX'}
+MAX_LIMIT = 1000
+
+
+class SqlTemplateError(ValueError):
+    """Raised for an unknown template or invalid template parameters."""
+
+
+def _choice(params, name, choices, default=None):
+    value = params.get(name, default)
+    if value not in choices:
+        raise SqlTemplateError(f"'{name}' must be one of {list(choices)}")
+    return value
+
+
+def _date(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+    except ValueError:
+        raise SqlTemplateError(f"'{name}' must be a date formatted YYYY-MM-DD")
+
+
+def _limit(params, default=50):
+    limit = params.get('limit', default)
+    if not isinstance(limit, int) or limit < 1:
+        raise SqlTemplateError("'limit' must be a positive integer")
+    return min(limit, MAX_LIMIT)
+
+
+def _date_conditions(params):
+    conditions, values = [], []
+    start_date, end_date = _date(params, 'start_date'), _date(params, 'end_date')
+    if start_date:
+        conditions.append('"Date" >= ?')
+        values.append(start_date)
+    if end_date:
+        conditions.append('"Date" <= ?')
+        values.append(end_date)
+    return conditions, values
+
+
+def _partner_date_grid(where):
+    """
+    Every partner x date of each file, restricted by where: partner-dates without activity are not
+    stored, but counts and per-row aggregates are taken over the full grid (missing rows count as 0).
+    """
+    return (f'(SELECT p.*, d."Date" FROM (SELECT DISTINCT "FileId", "DataSource", "Partner ID", "Country", "Region" FROM files) p '
+            f'JOIN (SELECT DISTINCT "FileId", "Date" FROM files {where}) d USING ("FileId"))')
+
+
+# Aggregation over the full grid from the stored rows' SUM/MIN/MAX/COUNT (s) and the grid's row count (g)
+GRID_AGGREGATIONS = {
+    'sum': 'coalesce(s.total, 0)',
+    'avg': 'coalesce(s.total, 0) / g.grid_rows',
+    'min': 'CASE WHEN coalesce(s.stored_rows, 0) < g.grid_rows THEN least(coalesce(s.low, 0), 0) ELSE s.low END',
+    'max': 'CASE WHEN coalesce(s.stored_rows, 0) < g.grid_rows THEN greatest(coalesce(s.high, 0), 0) ELSE s.high END',
+}
+
+
+def metric_by_dimension_sql(params):
+    """Aggregated metric per group, largest first. Params: metric, group_by, agg, start_date, end_date, limit."""
+    metric = _choice(params, 'metric', METRICS, 'Deriv Revenue')
+    group_by = _choice(params, 'group_by', GROUP_BY_EXPRESSIONS, 'Region')
+    agg = _choice(params, 'agg', AGGREGATIONS, 'sum')
+    conditions, values = _date_conditions(params)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    expression = GROUP_BY_EXPRESSIONS[group_by]
+    sql = (f'SELECT g.grp AS "{group_by}", {GRID_AGGREGATIONS[agg]} AS value, g.partners FROM '
+           f'(SELECT {expression} AS grp, COUNT(*) AS grid_rows, COUNT(DISTINCT "Partner ID") AS partners '
+           f'FROM {_partner_date_grid(where)} GROUP BY 1) g '
+           f'LEFT JOIN (SELECT {expression} AS grp, SUM("{metric}") AS total, MIN("{metric}") AS low, '
+           f'MAX("{metric}") AS high, COUNT("{metric}") AS stored_rows FROM files {where} GROUP BY 1) s '
+           f'ON g.grp IS NOT DISTINCT FROM s.grp ORDER BY value DESC NULLS LAST LIMIT ?')
+    return sql, values + values + [_limit(params)]
+
+
+def partner_history_sql(params):
+    """One partner's metric per file and date. Params: partner_id, metric."""
+    partner_id = params.get('partner_id')
+    if partner_id in (None, ''):
+        raise SqlTemplateError("'partner_id' is required")
+    metric = _choice(params, 'metric', METRICS, 'Deriv Revenue')
+    sql = (f'SELECT "FileId", "DataSource", "Date", "Country", "Region", "{metric}" AS value FROM files '
+           f'WHERE CAST("Partner ID" AS VARCHAR) = ? ORDER BY "Date", "FileId"')
+    return sql, [str(partner_id)]
+
+
+def file_summary_sql(params):
+    """Rows (of the full partner x date grid), partners, date range and the metric's total per file. Params: metric."""
+    metric = _choice(params, 'metric', METRICS, 'Deriv Revenue')
+    sql = (f'SELECT "FileId", any_value("DataSource") AS "DataSource", '
+           f'COUNT(DISTINCT ("Partner ID", "Country", "Region")) * COUNT(DISTINCT "Date") AS rows, '
+           f'COUNT(DISTINCT "Partner ID") AS partners, MIN("Date") AS first_date, MAX("Date") AS last_date, '
+           f'SUM("{metric}") AS total FROM files GROUP BY 1 ORDER BY last_date DESC')
+    return sql, []
+
+
+SQL_TEMPLATES = {
+    'metric_by_dimension': metric_by_dimension_sql,
+    'partner_history': partner_history_sql,
+    'file_summary': file_summary_sql,
+}
+
+
+def describe_templates():
+    return {name: build_sql.__doc__.strip() for name, build_sql in SQL_TEMPLATES.items()}
+
+
+class SqlEngine:
+    """
+    A DuckDB database with the selected processed files registered as Arrow datasets and combined
+    into one 'files' view (plus a FileId column). Each query runs on its own cursor, so concurrent
+    requests do not share registration state.
+    """
+
+    def __init__(self, duckdb_module, pyarrow_dataset, threads=None, memory_limit=None, temp_directory=None):
+        self._ds = pyarrow_dataset
+        self._connection = duckdb_module.connect()
+        if threads:
+            self._connection.execute(f"SET threads = {int(threads)}")
+        if memory_limit:
+            self._connection.execute(f"SET memory_limit = '{memory_limit.replace(chr(39), '')}'")
+        if temp_directory:
+            self._connection.execute(f"SET temp_directory = '{temp_directory.replace(chr(39), '')}'")
+        self._datasets = {} # path -> (mtime_ns, pyarrow dataset)
+        self._lock = threading.Lock()
+
+    def _dataset(self, path):
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._datasets.get(path)
+            if cached is None or cached[0] != mtime_ns:
+                cached = (mtime_ns, self._ds.dataset(path, format='feather'))
+                self._datasets[path] = cached
+            return cached[1]
+
+    def run(self, template, params, files):
+        """
+        Runs a template over files ({file_id: processed_path}) and returns the result in columnar
+        form: {"columns": [...], "data": [[column values], ...], "rowCount": n}.
+        """
+        if template not in SQL_TEMPLATES:
+            raise SqlTemplateError(f"Unknown template '{template}'. Available: {list(SQL_TEMPLATES)}")
+        sql, values = SQL_TEMPLATES[template](params or {})
+        if not files:
+            raise SqlTemplateError("No processed files match the selection")
+
+        cursor = self._connection.cursor()
+        try:
+            selects, file_values = [], []
+            for position, (file_id, path) in enumerate(sorted(files.items())):
+                dataset = self._dataset(path)
+                cursor.register(f"file_{position}", dataset)
+                selects.append(f'SELECT *{_widen_float32(dataset.schema)}, CAST(? AS VARCHAR) AS "FileId" FROM file_{position}')
+                file_values.append(file_id)
+            files_sql = " UNION ALL BY NAME ".join(selects)
+            with time_stage("sql_query"):
+                result = cursor.execute(f"WITH files AS ({files_sql}) {sql}", file_values + values)
+                columns = [description[0] for description in result.description]
+                rows = result.fetchall()
+        finally:
+            cursor.close()
+
+        data = [[_json_value(row[i]) for row in rows] for i in range(len(columns))]
+        return {"columns": columns, "data": data, "rowCount": len(rows)}
+
+
+def _widen_float32(schema):
+    """
+    A REPLACE clause restoring float32 metric columns (see METRIC_DTYPE_POLICY) to their exact
+    cents as DOUBLE, so sums match the pandas results; empty when the file has none.
+    """
+    columns = [field.name for field in schema if str(field.type) == 'float']
+    if not columns:
+        return ''
+    replacements = ", ".join(f'round(CAST("{name}" AS DOUBLE), {CURRENCY_DECIMALS}) AS "{name}"' for name in columns)
+    return f" REPLACE ({replacements})"
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d') if value.time() == time.min else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _build_sql_engine():
+    """Creates the engine on first use, or returns None when it is turned off or duckdb is missing."""
+    if get_env_variable("SQL_ENGINE", "duckdb").lower() == "off":
+        logger.info("SQL engine turned off (SQL_ENGINE=off)")
+        return None
+    try:
+        import duckdb
+        import pyarrow.dataset as pyarrow_dataset
+    except ImportError:
+        logger.info("duckdb is not installed; the SQL engine endpoints and chat tool are disabled")
+        return None
+    return SqlEngine(duckdb, pyarrow_dataset,
+                     threads=get_env_variable("SQL_ENGINE_THREADS"),
+                     memory_limit=get_env_variable("SQL_ENGINE_MEMORY_LIMIT"),
+                     temp_directory=get_env_variable("SQL_ENGINE_TEMP_DIRECTORY"))
+
+sql_engine_loader = LazyResource("sql_engine", _build_sql_engine)
+
+# Returns {file_id: file info} for the stored files; set by the app so the chat tool can select files
+file_catalog = None
+
+def set_file_catalog(get_files):
+    global file_catalog
+    file_catalog = get_files
+
+def select_files(sources=None, uploaded_since=None, file_ids=None):
+    """
+    {file_id: processed_path} of the stored files matching every given criterion: a list of
+    file ids, a list of sources, and an upload date (YYYY-MM-DD) on or after which they were uploaded.
+    """
+    if file_catalog is None:
+        return {}
+    selected = {}
+    for file_id, info in file_catalog().items():
+        if file_ids and file_id not in file_ids:
+            continue
+        if sources and info.get('source') not in sources:
+            continue
+        if uploaded_since and info.get('upload_date', '')[:10] < str(uploaded_since)[:10]:
+            continue
+        if os.path.exists(info['processed_path']):
+            selected[file_id] = info['processed_path']
+    return selected
+
+def run_sql_template(template, params=None, sources=None, uploaded_since=None, file_ids=None):
+    """
+    Runs a SQL template over the selected stored files. Returns the columnar result or
+    {"error": ...}; the error is {"error": ..., "unavailable": True} when the engine is disabled.
+    """
+    engine = sql_engine_loader.get()
+    if engine is None:
+        return {"error": "The SQL engine is not available (install duckdb or unset SQL_ENGINE=off).", "unavailable": True}
+    files = select_files(sources, uploaded_since, file_ids)
+    try:
+        result = engine.run(template, params, files)
+    except SqlTemplateError as e:
+        return {"error": str(e)}
+    result["files"] = sorted(files)
+    return result
@@ -0,0 +1,95 @@
+import inspect
+import threading
+from collections import OrderedDict
+
+
+class ToolResultCache:
+    """
+    Bounded LRU cache for chatbot tool results.
+    Entries are keyed by (data context, tool name, normalized args), where the data
+    context identifies the file (and date window) the tools are currently operating on.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """Returns (True, value) on a hit and (False, None) on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_file(self, file_id):
+        """Drops every entry computed for the given file_id, whatever its date window."""
+        with self._lock:
+            stale_keys = [key for key in self._entries if key[0][0] == file_id]
+            for key in stale_keys:
+                del self._entries[key]
+            self.invalidations += len(stale_keys)
+            return len(stale_keys)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def _normalize_value(value):
+    """Normalizes a single tool argument so equivalent calls share a cache key."""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize_value(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _normalize_value(item)) for key, item in value.items()))
+    return repr(value)
+
+
+def make_tool_cache_key(context, func, args, kwargs):
+    """
+    Builds the cache key for a tool call. Arguments are bound to the tool signature with
+    defaults applied, so get_x(3) and get_x(months=3) map to the same entry.
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+        bound.apply_defaults()
+        normalized_args = tuple((name, _normalize_value(value)) for name, value in bound.arguments.items())
+    except TypeError:
+        normalized_args = (tuple(_normalize_value(arg) for arg in args),
+                           _normalize_value(kwargs))
+    return (context, func.__name__, normalized_args)
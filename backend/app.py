@@ -1,31 +1,79 @@
+import time
+startup_started = time.perf_counter() # Measures how long importing and setting up the app takes
+
 import os
 import uuid
 import json
-from flask import Flask, request, jsonify
+import logging
+import threading
+import importlib.util
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import pandas as pd
+import pyarrow as pa
 from werkzeug.utils import secure_filename
-import traceback
 
 from backend.utils.file_parser import parse_excel
+from backend.utils.streaming_ingest import stream_workbook_to_feather
+from backend.utils.metric_dtypes import compact_metric_dtypes, widen_metric_dtypes
+from backend.utils.data_transformer import transform_parsed_dataframe, merge_by_partner_date, fill_partner_dates
+from backend.utils.ingest_artifacts import artifact_path, write_feather_atomic, PROCESSED_DATA_KIND, DATE_AGGREGATES_KIND, DIMENSION_INDEX_KIND, MANIFEST_KIND, LEADERBOARDS_KIND, PARTNER_INDEX_KIND
+from backend.utils.file_manifest import build_manifest, write_manifest, load_manifest
+from backend.utils.dimension_index import INDEXED_DIMENSIONS, build_dimension_index, write_dimension_index, load_dimension_index, lookup_rows, read_rows
+from backend.utils.partner_index import build_partner_index, lookup_partner_ranges, read_row_ranges
+from backend.utils.dataset_cache import ProcessedDatasetCache
+from backend.utils.shared_dataset_store import SharedDatasetStore
+from backend.utils.retention import parse_source_limits, file_last_used, plan_retention, file_artifacts, find_stray_files, delete_paths
 from backend.utils.dotenv_loader import load_env, get_env_variable
+from backend.utils.lazy_loader import get_lazy_init_timings, get_lazy_init_errors
+from backend.utils.logging_config import configure_logging
+from backend.utils.metrics import time_stage, render_prometheus, http_request_duration_seconds, http_requests_in_flight
 from backend.analysis.kpi_calculator import calculate_kpis
-from backend.analysis.performance_analyzer import analyze_performance, get_top_partner_for_metric_month
-from backend.analysis.chatbot_service import set_current_df_for_chatbot, invoke_chatbot
+from backend.analysis.performance_analyzer import analyze_performance, get_top_partner_for_metric_month, convert_numpy_types
+from backend.analysis.date_aggregates import KPI_METRICS, compute_date_aggregates, replace_dates, kpis_from_date_aggregates
+from backend.analysis.analysis_cache import AnalysisResultCache
+from backend.analysis.leaderboards import ALL_PERIODS, build_leaderboards, read_leaderboards, lookup_leaderboard, rank_partners, month_period, top_partner_result
+from backend.analysis.chatbot_service import set_current_df_for_chatbot, invoke_chatbot, stream_chatbot, get_tool_cache_stats, get_response_cache_stats, conversation_store, get_recent_traces, get_trace, get_rotated_trace_files, invalidate_chat_caches
+from backend.analysis.multi_source import SOURCES, VIEWS, get_multi_source_dataset
+from backend.analysis.query_engine import execute_query, column_kind
+from backend.analysis.sql_engine import run_sql_template, describe_templates, set_file_catalog
 
 # Load environment variables
 load_env()
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes, or configure as needed
 
 # Configure upload folder and allowed extensions
-UPLOAD_FOLDER = 'uploads' # Make sure this folder exists or is created
-PROCESSED_DATA_FOLDER = 'processed_data' # Folder to store processed data
+UPLOAD_FOLDER = get_env_variable('UPLOAD_FOLDER', 'uploads') # Make sure this folder exists or is created
+PROCESSED_DATA_FOLDER = get_env_variable('PROCESSED_DATA_FOLDER', 'processed_data') # Folder to store processed data
 METADATA_FILE = os.path.join(PROCESSED_DATA_FOLDER, 'metadata.json') # File to track processed files
 ALLOWED_EXTENSIONS = {'xlsx'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# Request latency and in-flight count for /metrics
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    http_requests_in_flight.inc()
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc):
+    # Runs after streamed responses have finished, so /chat/stream is timed end to end
+    if 'request_started' not in g:
+        return
+    http_requests_in_flight.dec()
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_request_duration_seconds.observe(time.perf_counter() - g.request_started, endpoint=endpoint,
+                                          method=request.method, status=g.get('response_status', 500))
+
 # Ensure necessary folders exist
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -39,7 +87,7 @@ def load_metadata():
             with open(METADATA_FILE, 'r') as f:
                 return json.load(f)
         except Exception as e:
-            print(f"Error loading metadata file: {e}")
+            logger.error("Error loading metadata file: %s", e)
             return {"files": {}}
     else:
         return {"files": {}}
@@ -50,12 +98,257 @@ def save_metadata(metadata):
             json.dump(metadata, f, indent=2)
         return True
     except Exception as e:
-        print(f"Error saving metadata file: {e}")
+        logger.error("Error saving metadata file: %s", e)
         return False
 
 # Load metadata at startup
 metadata = load_metadata()
-print(f"Loaded metadata tracking {len(metadata['files'])} processed files")
+logger.info("Loaded metadata tracking %d processed files", len(metadata['files']))
+
+# The SQL engine and its chat tool select files from the stored file metadata
+set_file_catalog(lambda: metadata['files'])
+
+# Cached /get-analysis-data results per file and date window
+analysis_cache = AnalysisResultCache(max_entries=int(get_env_variable('ANALYSIS_CACHE_MAX_ENTRIES', '64')))
+
+# Whole processed frames, so repeated unfiltered reads (and the startup warm-up) skip the feather read
+dataset_cache = ProcessedDatasetCache(max_bytes=int(float(get_env_variable('DATASET_CACHE_MAX_MB', '512')) * 1024 * 1024))
+
+# SHARED_DATASET_DIR (e.g. /dev/shm/partner-dashboard): worker processes share one memory-mapped
+# uncompressed copy of each processed file instead of each decompressing its own
+SHARED_DATASET_DIR = get_env_variable('SHARED_DATASET_DIR', '')
+shared_dataset_store = SharedDatasetStore(SHARED_DATASET_DIR) if SHARED_DATASET_DIR else None
+if shared_dataset_store is not None:
+    shared_dataset_store.prune(metadata['files'])
+
+def read_processed_file(file_id, processed_df_path):
+    """Reads a whole processed file through the dataset cache (and the shared dataset store, when configured)."""
+    df = dataset_cache.get(processed_df_path)
+    if df is not None:
+        return df
+    mtime_ns = os.stat(processed_df_path).st_mtime_ns
+    if shared_dataset_store is not None:
+        try:
+            with time_stage("feather_read"):
+                df, dataset_path = shared_dataset_store.attach(file_id, processed_df_path)
+            # The store reference lives as long as the cache entry
+            dataset_cache.put(processed_df_path, df, mtime_ns, on_evict=lambda: shared_dataset_store.release(dataset_path))
+            return df
+        except Exception as e:
+            logger.warning("Shared dataset store unavailable for %s, reading the file directly: %s", file_id, e)
+    with time_stage("feather_read"):
+        df = pd.read_feather(processed_df_path)
+    dataset_cache.put(processed_df_path, df, mtime_ns)
+    return df
+
+def forget_file(file_id):
+    """Removes a file from the metadata (the caller saves it) and drops its cached and shared datasets and analyses."""
+    file_info = metadata['files'].pop(file_id, None)
+    if file_info is not None:
+        dataset_cache.invalidate(file_info['processed_path'])
+    if shared_dataset_store is not None:
+        shared_dataset_store.remove(file_id)
+    analysis_cache.invalidate_file(file_id)
+
+def write_date_aggregates(file_id, aggregates):
+    if aggregates is not None:
+        write_feather_atomic(aggregates, artifact_path(PROCESSED_DATA_FOLDER, file_id, DATE_AGGREGATES_KIND))
+    return aggregates
+
+def load_date_aggregates(file_id, df=None):
+    """
+    Reads a file's per-date aggregates, building and storing them from df for files processed
+    before aggregates were written at ingest. Returns None when they are unavailable.
+    """
+    aggregates_path = artifact_path(PROCESSED_DATA_FOLDER, file_id, DATE_AGGREGATES_KIND)
+    try:
+        if os.path.exists(aggregates_path):
+            return pd.read_feather(aggregates_path)
+        if df is not None:
+            return write_date_aggregates(file_id, compute_date_aggregates(df))
+    except Exception as e:
+        logger.warning("Date aggregates unavailable for %s: %s", file_id, e)
+    return None
+
+# Parsed manifests by file_id, with the manifest file's mtime they were read at
+manifest_cache = {}
+
+def write_file_manifest(file_id, df, source):
+    manifest = build_manifest(df, file_id, source)
+    write_manifest(manifest, artifact_path(PROCESSED_DATA_FOLDER, file_id, MANIFEST_KIND))
+    return manifest
+
+def get_file_manifest(file_id):
+    """
+    The manifest of a stored file, or None for unknown files. Files processed before manifests
+    existed get one built (from a single read of the data) on first request.
+    """
+    file_info = metadata['files'].get(file_id)
+    if file_info is None:
+        return None
+    manifest_path = artifact_path(PROCESSED_DATA_FOLDER, file_id, MANIFEST_KIND)
+    if not os.path.exists(manifest_path):
+        if not os.path.exists(file_info['processed_path']):
+            return None
+        with time_stage("feather_read"):
+            df = pd.read_feather(file_info['processed_path'])
+        write_file_manifest(file_id, df, file_info['source'])
+    mtime_ns = os.stat(manifest_path).st_mtime_ns
+    cached = manifest_cache.get(file_id)
+    if cached is None or cached[0] != mtime_ns:
+        cached = (mtime_ns, load_manifest(manifest_path))
+        manifest_cache[file_id] = cached
+    return cached[1]
+
+def write_file_dimension_index(file_id, df):
+    with time_stage("dimension_index"):
+        write_dimension_index(build_dimension_index(df), artifact_path(PROCESSED_DATA_FOLDER, file_id, DIMENSION_INDEX_KIND))
+
+def write_file_partner_index(file_id, df, processed_df_path):
+    with time_stage("partner_index"):
+        write_dimension_index(build_partner_index(df, processed_df_path), artifact_path(PROCESSED_DATA_FOLDER, file_id, PARTNER_INDEX_KIND))
+
+def load_file_partner_index(file_id, processed_df_path):
+    """The partner index of a stored file, built on first use for files processed before it existed."""
+    index_path = artifact_path(PROCESSED_DATA_FOLDER, file_id, PARTNER_INDEX_KIND)
+    if not os.path.exists(index_path):
+        with time_stage("feather_read"):
+            df = pd.read_feather(processed_df_path)
+        write_file_partner_index(file_id, df, processed_df_path)
+    return load_dimension_index(index_path)
+
+def file_dates(file_id, processed_df_path):
+    """Every Date of a stored file, from its per-date aggregates when they exist."""
+    date_aggregates = load_date_aggregates(file_id)
+    if date_aggregates is not None:
+        return date_aggregates['Date']
+    with time_stage("feather_read"):
+        return pd.read_feather(processed_df_path, columns=['Date'])['Date']
+
+# Partners kept per leaderboard; larger top/bottom-N requests are computed from the data
+LEADERBOARD_K = int(get_env_variable('LEADERBOARD_K', '25'))
+
+def write_file_leaderboards(file_id, df):
+    with time_stage("leaderboards"):
+        write_feather_atomic(build_leaderboards(df, LEADERBOARD_K), artifact_path(PROCESSED_DATA_FOLDER, file_id, LEADERBOARDS_KIND))
+
+def get_file_leaderboards(file_id):
+    """
+    The leaderboards of a stored file, or None for unknown files. Files processed before
+    leaderboards existed get them built on first request.
+    """
+    file_info = metadata['files'].get(file_id)
+    if file_info is None:
+        return None
+    leaderboards_path = artifact_path(PROCESSED_DATA_FOLDER, file_id, LEADERBOARDS_KIND)
+    if not os.path.exists(leaderboards_path):
+        if not os.path.exists(file_info['processed_path']):
+            return None
+        with time_stage("feather_read"):
+            df = pd.read_feather(file_info['processed_path'])
+        write_file_leaderboards(file_id, df)
+    return read_leaderboards(leaderboards_path)
+
+def parse_dimension_filters(get_values):
+    """
+    {column: [values]} from the region/country/partner parameters; get_values(param) returns the
+    raw values given for a parameter, each possibly comma-separated.
+    """
+    filters = {}
+    for param, column in INDEXED_DIMENSIONS.items():
+        values = [value.strip() for raw in get_values(param) for value in str(raw).split(',') if value.strip()]
+        if values:
+            filters[column] = values
+    return filters
+
+def json_values(data, key):
+    value = data.get(key)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def load_processed_rows(file_id, processed_df_path, filters=None):
+    """
+    Reads a processed file, or with dimension filters only its matching rows, located through the
+    file's dimension index (built on first use for files processed before indexes existed).
+    """
+    if not filters:
+        return read_processed_file(file_id, processed_df_path)
+    index_path = artifact_path(PROCESSED_DATA_FOLDER, file_id, DIMENSION_INDEX_KIND)
+    if not os.path.exists(index_path):
+        with time_stage("feather_read"):
+            df = pd.read_feather(processed_df_path)
+        write_file_dimension_index(file_id, df)
+    row_ids = lookup_rows(load_dimension_index(index_path), filters)
+    if row_ids is None:
+        df = read_processed_file(file_id, processed_df_path)
+        mask = pd.Series(True, index=df.index)
+        for column, values in filters.items():
+            mask &= df[column].astype(str).isin(values)
+        df = df[mask].reset_index(drop=True)
+    else:
+        with time_stage("feather_read"):
+            df = read_rows(processed_df_path, row_ids)
+    if 'Partner ID' in filters:
+        # The partners' months without activity are not stored; they are analysed as zero rows
+        df = fill_partner_dates(df, file_dates(file_id, processed_df_path))
+    return df
+
+# INGEST_MODE: 'auto' streams workbooks of at least INGEST_STREAM_MIN_MB, 'stream' streams all, 'parse' none
+INGEST_MODE = get_env_variable('INGEST_MODE', 'auto').lower()
+INGEST_STREAM_MIN_BYTES = float(get_env_variable('INGEST_STREAM_MIN_MB', '5')) * 1024 * 1024
+INGEST_BATCH_ROWS = int(get_env_variable('INGEST_BATCH_ROWS', '2000'))
+
+def should_stream_workbook(file_path):
+    if INGEST_MODE == 'parse':
+        return False
+    if INGEST_MODE == 'stream':
+        return True
+    return os.path.getsize(file_path) >= INGEST_STREAM_MIN_BYTES and importlib.util.find_spec('openpyxl') is not None
+
+def ingest_workbook(file_path, filename, source, stream_path):
+    """
+    Parses and transforms an uploaded workbook into processed rows (with DataSource), metric
+    columns narrowed per METRIC_DTYPE_POLICY. Large workbooks are streamed in row batches, already
+    narrowed, into stream_path; when streaming fails (e.g. a non-standard layout) the whole workbook
+    is parsed instead. Returns (df, streamed, None) or (None, False, error message); streamed is
+    True when stream_path already holds df as it should be stored.
+    The streamed file is still read back whole (O(rows) memory, in the compact dtypes): the index,
+    leaderboard and manifest sidecars, the chatbot frame and the upload's KPI / performance
+    response are built from the complete frame.
+    """
+    if should_stream_workbook(file_path):
+        try:
+            with time_stage("stream_ingest"):
+                stream_workbook_to_feather(file_path, stream_path, source, INGEST_BATCH_ROWS)
+            with time_stage("feather_read"):
+                df_final = pd.read_feather(stream_path)
+            return df_final, True, None
+        except Exception as e:
+            logger.warning("Streaming ingest of %s failed, parsing the whole workbook instead: %s", filename, e)
+
+    # 1. Parse Excel to DataFrame
+    with time_stage("parse"):
+        df = parse_excel(file_path)
+    if df is None or (isinstance(df, dict) and 'error' in df):
+        return None, False, df['error'] if isinstance(df, dict) else "Failed to parse Excel file into DataFrame."
+
+    # Ensure DataFrame is not empty after parsing
+    if df.empty:
+        return None, False, "Parsed DataFrame is empty."
+
+    logger.debug("DataFrame columns found: %s", list(df.columns))
+
+    # Data Transformation Logic
+    try:
+        df_final = transform_parsed_dataframe(df)
+    except Exception as e:
+        logger.exception("Error during DataFrame transformation: %s", e)
+        return None, False, f"Failed to transform data structure: {e}"
+
+    # Add data source as a column for future reference
+    df_final['DataSource'] = source
+    return compact_metric_dtypes(df_final), False, None
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -63,14 +356,27 @@ def allowed_file(filename):
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    print("--- Received request to /upload ---")
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     file = request.files['file']
     
     # Get data source from form data
     source = request.form.get('source', 'unknown')
-    print(f"Uploading file for source: {source}")
+    # mode=append merges the workbook into an existing processed file (targetFileId) instead of creating one
+    mode = request.form.get('mode', 'new')
+    target_file_id = request.form.get('targetFileId')
+    logger.info("Received upload for source: %s (mode: %s)", source, mode)
+    if mode not in ('new', 'append'):
+        return jsonify({"error": "mode must be 'new' or 'append'"}), 400
+    if mode == 'append':
+        if (not target_file_id or target_file_id not in metadata['files']
+                or not os.path.exists(metadata['files'][target_file_id]['processed_path'])):
+            return jsonify({"error": "Append mode requires the targetFileId of a stored file"}), 404
+        target_source = metadata['files'][target_file_id]['source']
+        if 'source' not in request.form:
+            source = target_source
+        elif source != target_source:
+            return jsonify({"error": f"Cannot append {source} data to a {target_source} file"}), 400
     
     if file.filename == '':
         return jsonify({"error": "No selected file"}), 400
@@ -79,152 +385,46 @@ def upload_file():
         filename = secure_filename(file.filename)
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         try:
-            file.save(file_path)
+            with time_stage("save"):
+                file.save(file_path)
         except Exception as e:
             return jsonify({"error": f"Failed to save file: {str(e)}"}), 500
 
-        # 1. Parse Excel to DataFrame
-        df = parse_excel(file_path)
-        if df is None or (isinstance(df, dict) and 'error' in df):
-            error_msg = df['error'] if isinstance(df, dict) else "Failed to parse Excel file into DataFrame."
-            # Clean up uploaded file
-            try:
-                os.remove(file_path)
-            except OSError as e_os:
-                print(f"Error deleting file {file_path}: {e_os}")
-            return jsonify({"error": error_msg}), 500
-        
-        # Ensure DataFrame is not empty after parsing
-        if df.empty:
-            try:
-                os.remove(file_path)
-            except OSError as e_os:
-                print(f"Error deleting file {file_path}: {e_os}")
-            return jsonify({"error": "Parsed DataFrame is empty."}), 500
-            
-        # Print DataFrame columns for debugging
-        print("--- DataFrame Columns Found ---")
-        print(list(df.columns))
-        print("-----------------------------")
-
-        # Data Transformation Logic 
-        print("--- Transforming DataFrame --- ")
+        # Generate Unique ID (new files) and parse the workbook into processed rows
+        file_id = str(uuid.uuid4())
+        processed_df_path = artifact_path(PROCESSED_DATA_FOLDER, file_id, PROCESSED_DATA_KIND)
+        if mode == 'append':
+            stream_path = os.path.join(PROCESSED_DATA_FOLDER, f"append-{file_id}.{PROCESSED_DATA_KIND}")
+        else:
+            stream_path = processed_df_path
         try:
-            # Make a copy to avoid modifying the original df if needed elsewhere
-            df_transformed = df.copy()
-
-            # Store original columns before manipulation
-            original_columns = df_transformed.columns
-
-            # --- Clean MultiIndex Header --- 
-            # Forward fill the metric names (level 0) across columns where it's 'Unnamed' or potentially 'NaT'
-            new_cols_level0 = []
-            last_valid_metric = None
-            # We need to iterate carefully, assuming metric names appear before their date columns
-            # This logic might need adjustment based on the *exact* column structure
-            for i, col_tuple in enumerate(original_columns):
-                level0, level1 = col_tuple
-                # Assume first few columns are IDs and don't have metric names in level 0
-                if i < 3:
-                    last_valid_metric = level0 # Or maybe None, depending on structure
-                    new_cols_level0.append(level0) # Keep original ID level 0 name
-                    continue
-                
-                # Check if level0 looks like a valid metric name (not 'Unnamed...', not 'NaT')
-                if not str(level0).startswith('Unnamed:') and pd.notna(level0):
-                    last_valid_metric = level0
-                    new_cols_level0.append(level0)
-                # If it's unnamed/NaT but we have a previous metric, use that
-                elif last_valid_metric:
-                    new_cols_level0.append(last_valid_metric)
-                # Otherwise, keep the original (might still be 'Unnamed' if it's an unexpected structure)
-                else:
-                    new_cols_level0.append(level0)
-            
-            # Assign the cleaned level 0 and original level 1 back to the columns
-            df_transformed.columns = pd.MultiIndex.from_tuples(list(zip(new_cols_level0, original_columns.get_level_values(1))))
-            # -----> ADDED: Name the MultiIndex levels <-----
-            df_transformed.columns.names = ['Metric', 'Date_Str'] 
-            print("Cleaned MultiIndex columns (showing first few):", list(df_transformed.columns[:15]))
-            
-            # --- Identify ID columns and Melt --- 
-            id_vars_multiindex = df_transformed.columns[:3]
-            id_vars_list = list(id_vars_multiindex)
-            print(f"Melting with id_vars: {id_vars_list}")
-            # -----> REMOVED var_name argument <-----
-            df_long = pd.melt(df_transformed, id_vars=id_vars_list, value_name='Value')
-
-            # --- Clean up Melted Data --- 
-            # Rename ID columns (Target the tuples that exist post-melt)
-            id_rename_map_tuples = {
-                ('Unnamed: 0_level_0', 'affiliate_id'): 'Partner ID',
-                ('Unnamed: 1_level_0', "partner's country"): 'Country',
-                ('Unnamed: 2_level_0', 'GP Team Region'): 'Region'
-            }
-            df_long.rename(columns=id_rename_map_tuples, inplace=True)
-            print(f"Columns after melting and ID rename: {list(df_long.columns)}")
-
-            # Convert Date_Str to datetime objects
-            df_long['Date_Str_Clean'] = df_long['Date_Str'].astype(str).str.split('.').str[0]
-            df_long['Date'] = pd.to_datetime(df_long['Date_Str_Clean'], errors='coerce')
-            df_long = df_long.dropna(subset=['Date'])
-
-            # ---> ADDED: Convert Value column to numeric, coercing errors to NaN <---
-            df_long['Value'] = pd.to_numeric(df_long['Value'], errors='coerce')
-            # Optionally, decide how to handle NaNs created from non-numeric values (e.g., fill with 0?)
-            # df_long['Value'] = df_long['Value'].fillna(0)
-
-            # Pivot the table to get metrics as columns
-            # ---> MODIFIED: Added aggfunc='sum' <--- 
-            df_final = df_long.pivot_table(
-                index=['Partner ID', 'Country', 'Region', 'Date'], 
-                columns='Metric', 
-                values='Value',
-                aggfunc='sum' # Specify aggregation function
-            ).reset_index()
-
-            # Rename metric columns to match expected names
-            # Important: Adjust keys here based on the *actual* metric names in level 0 of your MultiIndex
-            metric_rename_map = {
-                'Expected Revenue': 'Expected Revenue',
-                'Deriv Revenue': 'Deriv Revenue',
-                'Partners\' Commissions': 'Partner Commissions', # Note the apostrophe difference
-                'Total Deposits': 'Total Deposits',
-                'Active Clients': 'Active Clients',
-                'First Time Traders': 'FTT'
-                # Add mappings for 'Band', 'Partners' Performance Index', 'Client Retention Rate' if needed
-                # Or handle/drop them if they are not needed for these specific KPIs
-            }
-            df_final.rename(columns=metric_rename_map, inplace=True)
-            df_final.columns.name = None # Remove the index name ('Metric')
-
-            print("--- Transformed DataFrame Head ---")
-            print(df_final.head())
-            print("--- Transformed DataFrame Columns ---")
-            print(list(df_final.columns))
-            print("---------------------------------")
-
-        except Exception as e:
-            print(f"!!! Error during DataFrame transformation: {e} !!!")
-            print(traceback.format_exc()) # Print detailed traceback for transformation errors
+            df_final, streamed, error_msg = ingest_workbook(file_path, filename, source, stream_path)
+        finally:
+            if mode == 'append' and os.path.exists(stream_path):
+                os.remove(stream_path)
+        if error_msg:
             # Clean up uploaded file
             try:
                 os.remove(file_path)
             except OSError as e_os:
-                print(f"Error deleting file {file_path}: {e_os}")
-            return jsonify({"error": f"Failed to transform data structure: {e}"}), 500
-
-        # Add data source as a column for future reference
-        df_final['DataSource'] = source
+                logger.error("Error deleting file %s: %s", file_path, e_os)
+            return jsonify({"error": error_msg}), 500
 
-        # Generate Unique ID and Save Processed Data
-        file_id = str(uuid.uuid4())
-        processed_df_path = os.path.join(PROCESSED_DATA_FOLDER, f"{file_id}.feather")
+        if mode == 'append':
+            return append_to_processed_file(target_file_id, df_final, filename, file_path)
 
+        # Save Processed Data (a streamed workbook has been written already)
         try:
-            print(f"--- Saving transformed DataFrame to {processed_df_path} ---")
-            df_final.to_feather(processed_df_path)
-            set_current_df_for_chatbot(df_final, file_id)
+            if not streamed:
+                logger.info("Saving transformed DataFrame to %s", processed_df_path)
+                with time_stage("feather_write"):
+                    df_final.to_feather(processed_df_path)
+            date_aggregates = write_date_aggregates(file_id, compute_date_aggregates(df_final))
+            write_file_dimension_index(file_id, df_final)
+            write_file_partner_index(file_id, df_final, processed_df_path)
+            write_file_leaderboards(file_id, df_final)
+            manifest = write_file_manifest(file_id, df_final, source)
+            set_current_df_for_chatbot(df_final, file_id, manifest)
             
             # Update metadata to track this file
             metadata['files'][file_id] = {
@@ -244,32 +444,32 @@ def upload_file():
                 session_key = 'currentFileId'
             
         except Exception as e:
-            print(f"!!! Error saving processed DataFrame: {e} !!!")
+            logger.exception("Error saving processed DataFrame: %s", e)
             # Decide if this should be fatal
             try: os.remove(file_path) # Cleanup original upload
             except OSError: pass
             return jsonify({"error": f"Could not save processed data: {e}"}), 500
 
-        # 2. Calculate KPIs
-        kpi_results = calculate_kpis(df_final.copy())
+        # 2. Calculate KPIs (read off the per-date aggregates when they are exact for this data)
+        kpi_results = kpis_from_date_aggregates(date_aggregates) or calculate_kpis(df_final.copy())
         if 'error' in kpi_results:
-            print(f"KPI Calculation Error on transformed data: {kpi_results['error']}")
+            logger.error("KPI Calculation Error on transformed data: %s", kpi_results['error'])
             return jsonify({"error": f"KPI Calculation Error: {kpi_results['error']}"}), 500
 
         # 3. Perform Performance Analysis
         performance_results = analyze_performance(df_final.copy())
         if 'error' in performance_results:
-            print(f"Performance Analysis Error on transformed data: {performance_results['error']}")
+            logger.error("Performance Analysis Error on transformed data: %s", performance_results['error'])
             return jsonify({"error": f"Performance Analysis Error: {performance_results['error']}"}), 500
 
         # Cleanup original uploaded file
         try:
             os.remove(file_path)
-            print(f"Cleaned up original file: {file_path}")
+            logger.debug("Cleaned up original file: %s", file_path)
         except OSError as e:
-            print(f"Error deleting uploaded file {file_path}: {e}")
+            logger.error("Error deleting uploaded file %s: %s", file_path, e)
 
-        print(f"--- Upload successful for fileId: {file_id}, source: {source} ---")
+        logger.info("Upload successful for fileId: %s, source: %s", file_id, source)
         return jsonify({
             "message": "File processed successfully",
             "fileId": file_id,
@@ -281,17 +481,87 @@ def upload_file():
     else:
         return jsonify({"error": "File type not allowed"}), 400
 
+def append_to_processed_file(file_id, df_new, filename, upload_path):
+    """
+    Merges newly ingested rows into a stored processed file by (Partner ID, Date), replacing
+    overlapping rows, and keeps its file_id. Only the aggregates of the dates in the new rows are
+    recomputed, and only cached analyses whose date window covers those dates are dropped.
+    """
+    file_info = metadata['files'][file_id]
+    processed_df_path = file_info['processed_path']
+    try:
+        with time_stage("feather_read"):
+            df_existing = pd.read_feather(processed_df_path)
+        with time_stage("append_merge"):
+            # Merged as float64 and narrowed again, so the policy sees the combined values
+            df_merged, replaced_rows = merge_by_partner_date(widen_metric_dtypes(df_existing), widen_metric_dtypes(df_new))
+            df_merged = compact_metric_dtypes(df_merged)
+        with time_stage("feather_write"):
+            write_feather_atomic(df_merged, processed_df_path)
+        write_file_dimension_index(file_id, df_merged) # Row ids change with the merged row order
+        write_file_partner_index(file_id, df_merged, processed_df_path)
+        write_file_leaderboards(file_id, df_merged) # Whole-file totals move with any appended month
+        manifest = write_file_manifest(file_id, df_merged, file_info['source'])
+
+        touched_dates = pd.to_datetime(df_new['Date']).dropna().unique()
+        with time_stage("aggregates_update"):
+            date_aggregates = load_date_aggregates(file_id, df_existing)
+            touched_rows = df_merged[pd.to_datetime(df_merged['Date']).isin(touched_dates)]
+            updated_aggregates = compute_date_aggregates(touched_rows)
+            if date_aggregates is not None and updated_aggregates is not None:
+                date_aggregates = write_date_aggregates(file_id, replace_dates(date_aggregates, updated_aggregates))
+        del df_existing
+    except Exception as e:
+        logger.exception("Error appending to processed file %s: %s", file_id, e)
+        return jsonify({"error": f"Could not append to stored data: {e}"}), 500
+    finally:
+        try:
+            os.remove(upload_path)
+        except OSError as e_os:
+            logger.error("Error deleting file %s: %s", upload_path, e_os)
+
+    invalidated_analyses = analysis_cache.invalidate_dates(file_id, touched_dates)
+    invalidate_chat_caches(file_id)
+    set_current_df_for_chatbot(df_merged, file_id, manifest)
+
+    file_info.setdefault('appended_files', []).append(filename)
+    file_info['last_appended'] = pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+    save_metadata(metadata)
+
+    kpi_results = kpis_from_date_aggregates(date_aggregates) or calculate_kpis(df_merged.copy())
+    if 'error' in kpi_results:
+        return jsonify({"error": f"KPI Calculation Error: {kpi_results['error']}"}), 500
+    performance_results = analyze_performance(df_merged.copy())
+    if 'error' in performance_results:
+        return jsonify({"error": f"Performance Analysis Error: {performance_results['error']}"}), 500
+    analysis_cache.set(AnalysisResultCache.make_key(file_id), {"kpis": kpi_results, "performance_analysis": performance_results})
+
+    logger.info("Appended %s to fileId %s: %d rows added, %d replaced, %d dates touched, %d cached analyses dropped",
+                filename, file_id, len(df_new) - replaced_rows, replaced_rows, len(touched_dates), invalidated_analyses)
+    return jsonify({
+        "message": "File appended successfully",
+        "fileId": file_id,
+        "kpis": kpi_results,
+        "performance_analysis": performance_results,
+        "filename": filename,
+        "source": file_info['source'],
+        "append": {
+            "rowsAdded": len(df_new) - replaced_rows,
+            "rowsReplaced": replaced_rows,
+            "datesUpdated": sorted(pd.Timestamp(d).strftime('%Y-%m-%d') for d in touched_dates),
+            "totalRows": len(df_merged)
+        }
+    }), 200
+
 @app.route('/load-stored-files', methods=['GET'])
 def load_stored_files():
     """
     Endpoint to retrieve all stored processed files.
     This allows the frontend to discover and use files that were uploaded in previous sessions.
     """
-    print("--- Received request to load stored files ---")
-    
     # Return all metadata about stored files
     stored_files = []
-    for file_id, file_info in metadata['files'].items():
+    for file_id, file_info in list(metadata['files'].items()):
         # Check if the file still exists
         if os.path.exists(file_info['processed_path']):
             stored_files.append({
@@ -302,8 +572,8 @@ def load_stored_files():
             })
         else:
             # Remove from metadata if file no longer exists
-            print(f"Removing missing file from metadata: {file_id}")
-            del metadata['files'][file_id]
+            logger.warning("Removing missing file from metadata: %s", file_id)
+            forget_file(file_id)
     
     # Save updated metadata if any files were removed
     save_metadata(metadata)
@@ -312,38 +582,70 @@ def load_stored_files():
         "storedFiles": stored_files
     }), 200
 
+def compute_file_analysis(file_id, df_final, df_loaded, window_start=None, window_end=None, dimension_filters=None):
+    """
+    KPIs and performance analysis of df_final, the rows of a file inside [window_start, window_end)
+    out of df_loaded (the rows read for the request). Returns (results, None) or (None, error message).
+    """
+    # The per-date aggregates cover all rows, so they only apply without dimension filters
+    date_aggregates = load_date_aggregates(file_id, df_loaded) if not dimension_filters else None
+    kpi_results = (kpis_from_date_aggregates(date_aggregates, window_start, window_end)
+                   or calculate_kpis(df_final.copy()))
+    performance_results = analyze_performance(df_final.copy())
+
+    if isinstance(kpi_results, dict) and 'error' in kpi_results:
+        return None, f"KPI Calculation Error on loaded data: {kpi_results['error']}"
+    if isinstance(performance_results, dict) and 'error' in performance_results:
+        return None, f"Performance Analysis Error on loaded data: {performance_results['error']}"
+    return {"kpis": kpi_results, "performance_analysis": performance_results}, None
+
+# Access times are saved to the metadata at most this often per file (they only rank the warm-up)
+ACCESS_SAVE_INTERVAL_SECONDS = 60
+
+def record_file_access(file_info):
+    now = pd.Timestamp.now()
+    last_accessed = file_info.get('last_accessed')
+    file_info['last_accessed'] = now.strftime('%Y-%m-%d %H:%M:%S')
+    if last_accessed is None or (now - pd.Timestamp(last_accessed)).total_seconds() >= ACCESS_SAVE_INTERVAL_SECONDS:
+        save_metadata(metadata)
+
 @app.route('/get-analysis-data/<file_id>', methods=['GET'])
 def get_analysis_data(file_id):
-    print(f"--- Received request to get analysis data for fileId: {file_id} ---")
-    
     # First check if file exists in our metadata
     if file_id not in metadata['files']:
-        print(f"File ID not found in metadata: {file_id}")
+        logger.warning("File ID not found in metadata: %s", file_id)
         return jsonify({"error": "File ID not found in stored files. Please upload the file again."}), 404
     
     file_info = metadata['files'][file_id]
     processed_df_path = file_info['processed_path']
+    record_file_access(file_info)
 
     # Get date range parameters from query string
     start_date = request.args.get('startDate')
     end_date = request.args.get('endDate')
     preset = request.args.get('preset', 'all')
+    # Optional region / country / partner filters, repeated or comma-separated
+    dimension_filters = parse_dimension_filters(request.args.getlist)
 
-    print(f"Date filtering requested - preset: {preset}, startDate: {start_date}, endDate: {end_date}")
+    logger.info("Analysis data requested for fileId %s - preset: %s, startDate: %s, endDate: %s, filters: %s",
+                file_id, preset, start_date, end_date, dimension_filters)
 
     if not os.path.exists(processed_df_path):
-        print(f"Processed data file not found: {processed_df_path}")
+        logger.warning("Processed data file not found: %s", processed_df_path)
         # Remove from metadata since file doesn't exist
-        del metadata['files'][file_id]
+        forget_file(file_id)
         save_metadata(metadata)
         return jsonify({"error": "Processed data not found. Please upload the file again."}), 404
 
     try:
-        print(f"Loading DataFrame from {processed_df_path}")
-        df_final = pd.read_feather(processed_df_path)
+        df_final = load_processed_rows(file_id, processed_df_path, dimension_filters)
+        if dimension_filters and df_final.empty:
+            return jsonify({"error": f"No data matches the filters {dimension_filters}"}), 404
+        df_loaded = df_final
+        window_start, window_end = None, None
         
         original_row_count = len(df_final)
-        print(f"Original data row count: {original_row_count}")
+        logger.debug("Loaded %d rows from %s", original_row_count, processed_df_path)
         
         # Apply date filtering if parameters are provided
         if start_date and end_date:
@@ -362,43 +664,42 @@ def get_analysis_data(file_id):
                 df_filtered = df_final[(df_final['Date'] >= start_date) & (df_final['Date'] < end_date)]
                 
                 filtered_row_count = len(df_filtered)
-                print(f"Filtered data by date range: {start_date.strftime('%Y-%m-%d')} to {(end_date - pd.Timedelta(days=1)).strftime('%Y-%m-%d')}")
-                print(f"Filtered data row count: {filtered_row_count} (removed {original_row_count - filtered_row_count} rows)")
+                logger.debug("Filtered data by date range %s to %s: %d rows (removed %d rows)",
+                             start_date.strftime('%Y-%m-%d'), (end_date - pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+                             filtered_row_count, original_row_count - filtered_row_count)
                 
                 # Use the filtered dataframe for further processing
                 df_final = df_filtered
+                window_start, window_end = start_date, end_date
                 
                 # If the filtered data is empty, log a warning
                 if filtered_row_count == 0:
-                    print(f"WARNING: Filtered data is empty for date range {start_date.strftime('%Y-%m-%d')} to {(end_date - pd.Timedelta(days=1)).strftime('%Y-%m-%d')}")
+                    logger.warning("Filtered data is empty for date range %s to %s",
+                                   start_date.strftime('%Y-%m-%d'), (end_date - pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
                 
             except Exception as e:
-                print(f"Error applying date filter: {e}")
-                print(traceback.format_exc())
+                logger.exception("Error applying date filter: %s", e)
                 # Continue with unfiltered data if date filtering fails
         else:
-            print("No date filtering applied - using all data")
+            logger.debug("No date filtering applied - using all data")
         
-        set_current_df_for_chatbot(df_final, file_id)
+        set_current_df_for_chatbot(df_final, file_id, get_file_manifest(file_id), window_start, window_end, dimension_filters)
         
-        # Re-run analysis on the loaded (and potentially filtered) data
-        kpi_results = calculate_kpis(df_final.copy())
-        performance_results = analyze_performance(df_final.copy())
-
-        if isinstance(kpi_results, dict) and 'error' in kpi_results:
-             return jsonify({"error": f"KPI Calculation Error on loaded data: {kpi_results['error']}"}), 500
-        if isinstance(performance_results, dict) and 'error' in performance_results:
-            return jsonify({"error": f"Performance Analysis Error on loaded data: {performance_results['error']}"}), 500
+        # Results for this file and window are cached until new data is appended to the window
+        cache_key = AnalysisResultCache.make_key(file_id, window_start, window_end, dimension_filters)
+        cached_results = analysis_cache.get(cache_key)
+        if cached_results is not None:
+            return jsonify(cached_results), 200
 
-        print(f"--- Successfully retrieved analysis data for fileId: {file_id} ---")
-        return jsonify({
-             "kpis": kpi_results, 
-             "performance_analysis": performance_results
-        }), 200
+        # Re-run analysis on the loaded (and potentially filtered) data
+        results, error_msg = compute_file_analysis(file_id, df_final, df_loaded, window_start, window_end, dimension_filters)
+        if error_msg:
+            return jsonify({"error": error_msg}), 500
+        analysis_cache.set(cache_key, results)
+        return jsonify(results), 200
 
     except Exception as e:
-        print(f"!!! Error loading/analyzing processed data for {file_id}: {e} !!!")
-        print(traceback.format_exc())
+        logger.exception("Error loading/analyzing processed data for %s: %s", file_id, e)
         return jsonify({"error": f"Failed to retrieve analysis data: {e}"}), 500
 
 @app.route('/get-top-partner', methods=['POST'])
@@ -421,14 +722,40 @@ def get_top_partner_endpoint():
     except ValueError:
         return jsonify({"error": "Year and month must be integers"}), 400
 
-    print(f"--- Received request for top partner: fileId={file_id}, metric={metric_column}, year={year}, month={month} ---")
+    # Optional region / country / partner filters (a value or a list each)
+    dimension_filters = parse_dimension_filters(lambda param: json_values(data, param))
 
-    processed_df_path = os.path.join(PROCESSED_DATA_FOLDER, f"{file_id}.feather")
+    logger.info("Top partner requested: fileId=%s, metric=%s, year=%s, month=%s, filters=%s",
+                file_id, metric_column, year, month, dimension_filters)
+
+    processed_df_path = artifact_path(PROCESSED_DATA_FOLDER, file_id, PROCESSED_DATA_KIND)
     if not os.path.exists(processed_df_path):
         return jsonify({"error": "Processed data not found."}), 404
 
+    # The manifest rules out unknown metrics and months without reading the data
+    manifest = get_file_manifest(file_id) if file_id in metadata['files'] else None
+    if manifest is not None:
+        if metric_column not in manifest['metrics']:
+            return jsonify({"error": f"Metric '{metric_column}' not found in data"}), 400
+        if f"{year}-{month:02d}" not in manifest['months']:
+            return jsonify({"message": f"No data found for {month}/{year}"}), 200
+
+    # Unfiltered, or within a single region, the top partner is the head of a stored leaderboard
+    regions = dimension_filters.get('Region', [])
+    if manifest is not None and set(dimension_filters) <= {'Region'} and len(regions) <= 1:
+        try:
+            entries = lookup_leaderboard(get_file_leaderboards(file_id), metric_column, month_period(year, month),
+                                         n=1, region=regions[0] if regions else None)
+        except Exception as e:
+            logger.warning("Leaderboards unavailable for %s, computing the top partner: %s", file_id, e)
+            entries = None
+        if entries == []:
+            return jsonify({"message": f"No data found for {month}/{year}"}), 200
+        if entries:
+            return jsonify(convert_numpy_types(top_partner_result(entries[0], metric_column, year, month))), 200
+
     try:
-        df_final = pd.read_feather(processed_df_path)
+        df_final = load_processed_rows(file_id, processed_df_path, dimension_filters)
         result = get_top_partner_for_metric_month(df_final, metric_column, year, month)
         
         if 'error' in result:
@@ -436,10 +763,138 @@ def get_top_partner_endpoint():
         return jsonify(result), 200
 
     except Exception as e:
-        print(f"!!! Error in /get-top-partner endpoint for {file_id}: {e} !!!")
-        print(traceback.format_exc())
+        logger.exception("Error in /get-top-partner endpoint for %s: %s", file_id, e)
         return jsonify({"error": f"Failed to get top partner: {e}"}), 500
 
+@app.route('/leaderboard/<file_id>', methods=['GET'])
+def get_leaderboard(file_id):
+    """
+    Top or bottom n partners of a stored file by a metric: ?metric=&n=10&direction=top|bottom, for
+    one month (?year=&month=) or the whole file, optionally within one ?region=. Answered from the
+    file's leaderboards when n is within LEADERBOARD_K, otherwise computed from the data.
+    """
+    metric_column = request.args.get('metric')
+    direction = request.args.get('direction', 'top')
+    region = request.args.get('region') or None
+    if not metric_column:
+        return jsonify({"error": "Missing required parameter: metric"}), 400
+    if direction not in ('top', 'bottom'):
+        return jsonify({"error": "direction must be 'top' or 'bottom'"}), 400
+    try:
+        n = int(request.args.get('n', 10))
+        year, month = request.args.get('year'), request.args.get('month')
+        period = month_period(year, month) if year and month else ALL_PERIODS
+    except ValueError:
+        return jsonify({"error": "n, year and month must be integers"}), 400
+    if n < 1:
+        return jsonify({"error": "n must be a positive integer"}), 400
+
+    manifest = get_file_manifest(file_id)
+    if manifest is None:
+        return jsonify({"error": "File ID not found in stored files."}), 404
+    if metric_column not in manifest['metrics']:
+        return jsonify({"error": f"Metric '{metric_column}' not found in data"}), 400
+
+    try:
+        source = 'leaderboard'
+        entries = lookup_leaderboard(get_file_leaderboards(file_id), metric_column, period, n, direction, region)
+        if entries is None:
+            source = 'computed'
+            processed_df_path = metadata['files'][file_id]['processed_path']
+            df = load_processed_rows(file_id, processed_df_path, {'Region': [region]} if region else None)
+            entries = rank_partners(df, metric_column, period, n, direction, region)
+    except Exception as e:
+        logger.exception("Error in /leaderboard endpoint for %s: %s", file_id, e)
+        return jsonify({"error": f"Failed to get leaderboard: {e}"}), 500
+
+    return jsonify(convert_numpy_types({
+        "fileId": file_id,
+        "metric": metric_column,
+        "period": period,
+        "direction": direction,
+        "region": region,
+        "entries": entries,
+        "source": source
+    })), 200
+
+@app.route('/partner/<partner_ids>/timeseries', methods=['GET'])
+def get_partner_timeseries(partner_ids):
+    """
+    Per-date metric history of one or more partners (comma-separated ids) of a stored file:
+    ?fileId=, optionally ?metrics=a,b (default: every metric). The rows are read through the
+    file's partner index, so the cost follows the partners' row count, not the file size. Dates
+    without a stored row (no activity) are zeros.
+    """
+    file_id = request.args.get('fileId')
+    requested_ids = list(dict.fromkeys(value.strip() for value in partner_ids.split(',') if value.strip()))
+    if not file_id:
+        return jsonify({"error": "Missing required parameter: fileId"}), 400
+    if not requested_ids:
+        return jsonify({"error": "No partner ID given"}), 400
+    file_info = metadata['files'].get(file_id)
+    if file_info is None:
+        return jsonify({"error": "File ID not found in stored files."}), 404
+    processed_df_path = file_info['processed_path']
+    if not os.path.exists(processed_df_path):
+        return jsonify({"error": "Processed data file not found."}), 404
+
+    try:
+        index = load_file_partner_index(file_id, processed_df_path)
+        ranges = lookup_partner_ranges(index, requested_ids)
+        dates = file_dates(file_id, processed_df_path) if ranges else None
+        partners = []
+        metric_columns = None
+        for partner_id, partner_ranges in ranges.items():
+            with time_stage("feather_read"):
+                rows = read_row_ranges(processed_df_path, index, partner_ranges)
+            rows = widen_metric_dtypes(fill_partner_dates(rows, dates))
+            if metric_columns is None:
+                available = [col for col in rows.columns
+                             if col not in ('Partner ID', 'Country', 'Region', 'Date', 'DataSource')
+                             and pd.api.types.is_numeric_dtype(rows[col])]
+                metric_columns = [value.strip() for value in request.args.get('metrics', '').split(',') if value.strip()] or available
+                unknown = [col for col in metric_columns if col not in available]
+                if unknown:
+                    return jsonify({"error": f"Metrics not found in data: {unknown}"}), 400
+            series = rows.groupby(pd.to_datetime(rows['Date']))[metric_columns].sum().sort_index()
+            series.index = series.index.strftime('%Y-%m-%d')
+            partners.append({
+                "partnerId": partner_id,
+                "country": rows['Country'].iloc[0],
+                "region": rows['Region'].iloc[0],
+                "series": series.rename_axis('Date').reset_index().to_dict(orient='records')
+            })
+    except Exception as e:
+        logger.exception("Error in /partner timeseries endpoint for %s: %s", file_id, e)
+        return jsonify({"error": f"Failed to get partner time series: {e}"}), 500
+
+    return jsonify(convert_numpy_types({
+        "fileId": file_id,
+        "metrics": metric_columns or [],
+        "partners": partners,
+        "notFound": [partner_id for partner_id in requested_ids if partner_id not in ranges]
+    })), 200
+
+def resolve_conversation(data):
+    """
+    Returns (conversation_id, chat_history) for a chat request.
+    History is kept server-side per conversation, so clients only need to send the new message
+    plus 'conversationId'. A client-side 'chat_history' is only used to seed a new conversation.
+    The store is per process and in memory, so a conversationId can be unknown here (restart,
+    eviction, another worker); without a chat_history to seed it from, chat_history is None and
+    the caller asks the client to resend its history (conversation_reset_response).
+    """
+    conversation_id = data.get('conversationId')
+    if conversation_id and not data.get('chat_history') and not conversation_store.exists(conversation_id):
+        logger.info("Unknown conversation %s; asking the client to resend its history", conversation_id)
+        return conversation_id, None
+    conversation_id = conversation_store.get_or_create(conversation_id, seed_history=data.get('chat_history'))
+    return conversation_id, conversation_store.get_history(conversation_id)
+
+def conversation_reset_response(conversation_id):
+    return jsonify({"error": "Unknown conversation; resend the request with its chat_history.",
+                    "conversationReset": True, "conversationId": conversation_id}), 409
+
 @app.route('/chat', methods=['POST'])
 def chat_endpoint():
     data = request.get_json()
@@ -448,20 +903,84 @@ def chat_endpoint():
 
     user_query = data['query']
     file_id = data['fileId'] # For context, ensuring chatbot operates on the right file's data
-    chat_history_frontend = data.get('chat_history', []) # Get chat_history if sent
 
     # Ensure the correct DataFrame is loaded for the chatbot context for this file_id
     # This might involve re-calling set_current_df_for_chatbot if the global one is not for this file_id
     # For simplicity now, we assume set_current_df_for_chatbot was called by /upload or /get-analysis-data
     # A more robust system would check if chatbot_service.current_file_id_for_tools matches file_id
     # and reload if necessary.
-    print(f"--- Received chat query for fileId '{file_id}': '{user_query}' ---")
+    logger.info("Received chat query for fileId '%s': '%s'", file_id, user_query)
     
-    # Convert frontend chat history to proper format for the chatbot
-    # We're now passing the chat history to the chatbot
-    response_text = invoke_chatbot(user_query, chat_history_frontend)
+    # Recent turns plus a rolling summary of older ones, from the server-side conversation store
+    conversation_id, chat_history = resolve_conversation(data)
+    if chat_history is None:
+        return conversation_reset_response(conversation_id)
+    response_text = invoke_chatbot(user_query, chat_history)
+    conversation_store.append_turn(conversation_id, user_query, response_text)
     
-    return jsonify({"answer": response_text}), 200
+    return jsonify({"answer": response_text, "conversationId": conversation_id}), 200
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream_endpoint():
+    """
+    Streaming variant of /chat using server-sent events.
+    Emits 'tool_start' and 'tool_end' events while the agent runs its tools, a 'token' event per
+    answer token, and a final 'done' event carrying the full answer and conversationId (or an 'error' event).
+    """
+    data = request.get_json()
+    if not data or 'query' not in data or 'fileId' not in data:
+        return jsonify({"error": "Missing query or fileId"}), 400
+
+    user_query = data['query']
+    file_id = data['fileId']
+    logger.info("Received streaming chat query for fileId '%s': '%s'", file_id, user_query)
+    conversation_id, chat_history = resolve_conversation(data)
+    if chat_history is None:
+        return conversation_reset_response(conversation_id)
+
+    def generate_events():
+        for event in stream_chatbot(user_query, chat_history):
+            if event['event'] == 'done':
+                conversation_store.append_turn(conversation_id, user_query, event['data']['answer'])
+                event['data']['conversationId'] = conversation_id
+            yield f"event: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/chat/cache-stats', methods=['GET'])
+def chat_cache_stats():
+    """
+    Endpoint to inspect the chatbot caches (entries, hits, misses, hit rate):
+    the tool result cache and the /chat response cache.
+    """
+    return jsonify({
+        "toolCache": get_tool_cache_stats(),
+        "responseCache": get_response_cache_stats()
+    }), 200
+
+@app.route('/debug/traces', methods=['GET'])
+def debug_traces():
+    """
+    Lists recent chatbot traces (newest first) with their duration, route (fast_path, response_cache,
+    agent, ...) and time spent in LLM calls and tools. ?limit= caps the number returned (default 50).
+    """
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify(get_recent_traces(limit)), 200
+
+@app.route('/debug/traces/<trace_id>', methods=['GET'])
+def debug_trace(trace_id):
+    """Returns one trace with all its spans: each LLM call with token counts and each tool run with its args."""
+    trace = get_trace(trace_id)
+    if trace is None:
+        return jsonify({"error": "Trace not found (tracing may be off or the trace has been evicted)."}), 404
+    return jsonify(trace), 200
 
 @app.route('/get-comparison-data', methods=['POST'])
 def get_comparison_data():
@@ -473,7 +992,6 @@ def get_comparison_data():
     - metricsToCompare: List of metrics to include in comparison
     - timeframe: Time frame for comparison (e.g., 'monthly')
     """
-    print("--- Received request to /get-comparison-data ---")
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
@@ -486,12 +1004,11 @@ def get_comparison_data():
     if not my_affiliate_id or not dynamic_works_id:
         return jsonify({"error": "Both myAffiliateId and dynamicWorksId are required"}), 400
 
-    print(f"Comparing - MyAffiliate ID: {my_affiliate_id}, DynamicWorks ID: {dynamic_works_id}")
-    print(f"Metrics to compare: {metrics_to_compare}")
+    logger.info("Comparing - MyAffiliate ID: %s, DynamicWorks ID: %s, metrics: %s", my_affiliate_id, dynamic_works_id, metrics_to_compare)
 
     # Check if the processed data files exist
-    ma_file_path = os.path.join(PROCESSED_DATA_FOLDER, f"{my_affiliate_id}.feather")
-    dw_file_path = os.path.join(PROCESSED_DATA_FOLDER, f"{dynamic_works_id}.feather")
+    ma_file_path = artifact_path(PROCESSED_DATA_FOLDER, my_affiliate_id, PROCESSED_DATA_KIND)
+    dw_file_path = artifact_path(PROCESSED_DATA_FOLDER, dynamic_works_id, PROCESSED_DATA_KIND)
 
     if not os.path.exists(ma_file_path):
         return jsonify({"error": f"MyAffiliate data file not found for ID: {my_affiliate_id}"}), 404
@@ -499,67 +1016,23 @@ def get_comparison_data():
         return jsonify({"error": f"DynamicWorks data file not found for ID: {dynamic_works_id}"}), 404
 
     try:
-        # Load both dataframes
-        ma_df = pd.read_feather(ma_file_path)
-        dw_df = pd.read_feather(dw_file_path)
-
-        # Ensure Date column is datetime
-        if not pd.api.types.is_datetime64_any_dtype(ma_df['Date']):
-            ma_df['Date'] = pd.to_datetime(ma_df['Date'])
-        if not pd.api.types.is_datetime64_any_dtype(dw_df['Date']):
-            dw_df['Date'] = pd.to_datetime(dw_df['Date'])
+        # Both files are loaded into one dataset whose per-source monthly totals are aggregated once
+        dataset = get_multi_source_dataset({'myAffiliate': (my_affiliate_id, ma_file_path),
+                                            'dynamicWorks': (dynamic_works_id, dw_file_path)})
 
-        # Filter data to only include Oct 2024 through April 2025
+        # Generate month labels (Oct 2024 - Apr 2025)
         # This is for consistency with the frontend date filters
-        ma_df = ma_df[(ma_df['Date'].dt.year == 2024) & (ma_df['Date'].dt.month >= 10) | 
-                       (ma_df['Date'].dt.year == 2025) & (ma_df['Date'].dt.month <= 4)]
-        dw_df = dw_df[(dw_df['Date'].dt.year == 2024) & (dw_df['Date'].dt.month >= 10) | 
-                       (dw_df['Date'].dt.year == 2025) & (dw_df['Date'].dt.month <= 4)]
-
-        # Prepare result structure
+        months = pd.period_range(start='2024-10', end='2025-04', freq='M')
         comparison_result = {
-            "months": []
+            "months": [str(month) for month in months]
         }
 
-        # Add metrics based on what was requested
-        for metric in metrics_to_compare:
-            if metric in ma_df.columns and metric in dw_df.columns:
-                comparison_result[metric.lower().replace(' ', '')] = {
-                    "myAffiliate": [],
-                    "dynamicWorks": []
-                }
-
-        # Generate month labels (Oct 2024 - Apr 2025)
-        date_range = pd.date_range(start='2024-10-01', end='2025-04-30', freq='MS')
-        month_labels = [d.strftime('%Y-%m') for d in date_range]
-        comparison_result["months"] = month_labels
-
-        # Aggregate data by month for each source and metric
+        # Monthly sums per source for each requested metric, 0 for months a source has no data for
         for metric in metrics_to_compare:
-            if metric in ma_df.columns and metric in dw_df.columns:
-                # Create period column for grouping
-                ma_df['Month'] = ma_df['Date'].dt.to_period('M')
-                dw_df['Month'] = dw_df['Date'].dt.to_period('M')
-
-                # Group by Month and calculate sums
-                ma_monthly = ma_df.groupby('Month')[metric].sum().reset_index()
-                dw_monthly = dw_df.groupby('Month')[metric].sum().reset_index()
-
-                # Convert period to string format
-                ma_monthly['Month'] = ma_monthly['Month'].astype(str)
-                dw_monthly['Month'] = dw_monthly['Month'].astype(str)
-
-                # Ensure all months are included (filling with 0 for missing months)
-                for month in month_labels:
-                    # MyAffiliate
-                    ma_value = ma_monthly.loc[ma_monthly['Month'] == month, metric].values
-                    ma_value = ma_value[0] if len(ma_value) > 0 else 0
-                    comparison_result[metric.lower().replace(' ', '')]["myAffiliate"].append(ma_value)
-
-                    # DynamicWorks
-                    dw_value = dw_monthly.loc[dw_monthly['Month'] == month, metric].values
-                    dw_value = dw_value[0] if len(dw_value) > 0 else 0
-                    comparison_result[metric.lower().replace(' ', '')]["dynamicWorks"].append(dw_value)
+            if metric in dataset.metrics:
+                series = dataset.monthly_series(metric, months)
+                series["difference"] = [ma - dw for ma, dw in zip(series["myAffiliate"], series["dynamicWorks"])]
+                comparison_result[metric.lower().replace(' ', '')] = series
 
         # Handle special metrics renaming for frontend
         metrics_mapping = {
@@ -577,39 +1050,398 @@ def get_comparison_data():
         return jsonify(comparison_result), 200
 
     except Exception as e:
-        print(f"!!! Error generating comparison data: {e} !!!")
-        print(traceback.format_exc())
+        logger.exception("Error generating comparison data: %s", e)
         return jsonify({"error": f"Failed to generate comparison data: {e}"}), 500
 
+def latest_file_id_for_source(source):
+    """The most recently uploaded stored file of a source, or None."""
+    candidates = [(info['upload_date'], file_id) for file_id, info in metadata['files'].items()
+                  if info['source'] == source and os.path.exists(info['processed_path'])]
+    return max(candidates)[1] if candidates else None
+
+@app.route('/get-source-analysis', methods=['POST'])
+def get_source_analysis():
+    """
+    KPIs and performance analysis over the combined MyAffiliate and DynamicWorks data.
+    Expects JSON payload containing:
+    - view: 'myAffiliate', 'dynamicWorks', 'both' (all rows of both sources) or
+      'difference' (metrics netted per partner and month as myAffiliate - dynamicWorks)
+    - myAffiliateId / dynamicWorksId: optional, default to the latest stored file of each source
+    - startDate / endDate: optional inclusive date range
+    """
+    data = request.get_json(silent=True) or {}
+    view = data.get('view', 'both')
+    if view not in VIEWS:
+        return jsonify({"error": f"view must be one of {list(VIEWS)}"}), 400
+
+    files_by_source = {}
+    for source in SOURCES:
+        file_id = data.get(f"{source}Id") or latest_file_id_for_source(source)
+        if not file_id or file_id not in metadata['files']:
+            return jsonify({"error": f"No stored {source} file available"}), 404
+        processed_df_path = metadata['files'][file_id]['processed_path']
+        if not os.path.exists(processed_df_path):
+            return jsonify({"error": f"{source} data file not found for ID: {file_id}"}), 404
+        files_by_source[source] = (file_id, processed_df_path)
+
+    start_date, end_date = None, None
+    if data.get('startDate') and data.get('endDate'):
+        try:
+            start_date = pd.to_datetime(data['startDate'])
+            end_date = pd.to_datetime(data['endDate']) + pd.Timedelta(days=1)
+        except (ValueError, TypeError) as e:
+            return jsonify({"error": f"Invalid date range: {e}"}), 400
+
+    try:
+        dataset = get_multi_source_dataset(files_by_source)
+        df_view = dataset.select(view, start_date, end_date)
+        kpi_results = calculate_kpis(df_view.copy())
+        performance_results = analyze_performance(df_view.copy())
+    except Exception as e:
+        logger.exception("Error analysing %s view: %s", view, e)
+        return jsonify({"error": f"Failed to analyse {view} data: {e}"}), 500
+
+    for results, label in ((kpi_results, "KPI Calculation"), (performance_results, "Performance Analysis")):
+        if isinstance(results, dict) and 'error' in results:
+            return jsonify({"error": f"{label} Error: {results['error']}"}), 500
+
+    return jsonify({
+        "view": view,
+        "fileIds": dataset.file_ids_by_source,
+        "kpis": kpi_results,
+        "performance_analysis": performance_results
+    }), 200
+
+@app.route('/query', methods=['POST'])
+def query_data():
+    """
+    Declarative aggregation over processed data. Expects JSON payload containing:
+    - fileId, or fileIds with one stored file per source to query them together (DataSource dimension)
+    - dimensions, metrics, filters, sort, limit: see backend.analysis.query_engine.parse_query
+    Sum-only queries over dates and sources are answered from per-date aggregates instead of the
+    partner rows. The result is columnar: {"columns": [...], "data": [[column values], ...]}.
+    """
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get('fileIds') or ([data['fileId']] if data.get('fileId') else [])
+    if not file_ids:
+        return jsonify({"error": "fileId or fileIds is required"}), 400
+    for file_id in file_ids:
+        if file_id not in metadata['files'] or not os.path.exists(metadata['files'][file_id]['processed_path']):
+            return jsonify({"error": f"File ID not found in stored files: {file_id}"}), 404
+
+    try:
+        if len(file_ids) == 1:
+            file_id = file_ids[0]
+            file_info = metadata['files'][file_id]
+            with pa.memory_map(file_info['processed_path']) as source_file:
+                raw_columns = {field.name: column_kind(field.type) for field in pa.ipc.open_file(source_file).schema}
+            cube_columns = ['Date', 'DataSource', *[m for m in KPI_METRICS if m in raw_columns]]
+
+            def load_raw():
+                return read_processed_file(file_id, file_info['processed_path'])
+
+            def load_cube():
+                aggregates = load_date_aggregates(file_id) # None (-> raw) for files without the sidecar yet
+                if aggregates is None:
+                    return None
+                return aggregates.assign(DataSource=file_info['source'])
+        else:
+            files_by_source = {}
+            for file_id in file_ids:
+                source = metadata['files'][file_id]['source']
+                if source in files_by_source:
+                    return jsonify({"error": f"fileIds must be from different sources; two are {source} files"}), 400
+                files_by_source[source] = (file_id, metadata['files'][file_id]['processed_path'])
+            dataset = get_multi_source_dataset(files_by_source)
+            raw_columns = {column: column_kind(dtype) for column, dtype in dataset.df.dtypes.items()}
+            cube_columns = ['Date', 'DataSource', *dataset.metrics]
+
+            def load_raw():
+                return dataset.df
+
+            def load_cube():
+                return dataset.date_totals
+
+        result = execute_query(data, raw_columns, cube_columns, load_raw, load_cube)
+    except Exception as e:
+        logger.exception("Error running query %s: %s", data, e)
+        return jsonify({"error": f"Failed to run query: {e}"}), 500
+
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result), 200
+
+@app.route('/sql-query', methods=['GET', 'POST'])
+def sql_query():
+    """
+    Runs a parameterized SQL template over many stored files at once with the embedded SQL engine.
+    GET lists the templates. POST expects JSON payload containing:
+    - template: a template name, params: its parameters
+    - optional file selection: fileIds, sources (e.g. ["myAffiliate"]), uploadedSince (YYYY-MM-DD)
+    Without a selection the template runs over every stored file.
+    """
+    if request.method == 'GET':
+        return jsonify({"templates": describe_templates()}), 200
+
+    data = request.get_json(silent=True) or {}
+    if not data.get('template'):
+        return jsonify({"error": "template is required"}), 400
+    try:
+        result = run_sql_template(data['template'], data.get('params'), sources=data.get('sources'),
+                                  uploaded_since=data.get('uploadedSince'), file_ids=data.get('fileIds'))
+    except Exception as e:
+        logger.exception("Error running SQL template %s: %s", data.get('template'), e)
+        return jsonify({"error": f"Failed to run SQL query: {e}"}), 500
+    if result.pop('unavailable', False):
+        return jsonify(result), 503
+    if 'error' in result:
+        return jsonify(result), 400
+    return jsonify(result), 200
+
+@app.route('/file-manifest/<file_id>', methods=['GET'])
+def file_manifest(file_id):
+    """
+    Row count, date range, months, metric statistics and distinct Country / Region / Partner ID
+    values of a stored file. ?dictionaries=Region,Country limits which value lists are returned
+    (the Partner ID list can be long); ?dictionaries= returns none.
+    """
+    manifest = get_file_manifest(file_id)
+    if manifest is None:
+        return jsonify({"error": "File ID not found in stored files."}), 404
+    if 'dictionaries' in request.args:
+        wanted = [name.strip() for name in request.args['dictionaries'].split(',') if name.strip()]
+        manifest = {**manifest, "dictionaries": {name: values for name, values in manifest['dictionaries'].items() if name in wanted}}
+    return jsonify(manifest), 200
+
 @app.route('/get-team-regions/<file_id>', methods=['GET'])
 def get_team_regions(file_id):
     """
     Endpoint to get unique GP Team Regions from the provided file.
     Used for filtering in the Country Analysis view.
     """
-    print(f"--- Received request to get team regions for fileId: {file_id} ---")
-    processed_df_path = os.path.join(PROCESSED_DATA_FOLDER, f"{file_id}.feather")
-
-    if not os.path.exists(processed_df_path):
-        print(f"Processed data file not found: {processed_df_path}")
-        return jsonify({"error": "Processed data not found. Please upload the file again."}), 404
-
     try:
-        df = pd.read_feather(processed_df_path)
+        # Answered from the file's manifest, without reading the data
+        manifest = get_file_manifest(file_id)
+        if manifest is None:
+            logger.warning("Processed data not found for fileId: %s", file_id)
+            return jsonify({"error": "Processed data not found. Please upload the file again."}), 404
         
-        if 'Region' not in df.columns:
+        if 'Region' not in manifest['dictionaries']:
             return jsonify({"error": "Region column not found in the data."}), 400
         
-        # Get unique regions, filter out None/NA values, and sort
-        regions = df['Region'].dropna().unique().tolist()
-        regions = sorted([region for region in regions if region and pd.notna(region)])
+        # Distinct regions, already sorted and without missing values
+        regions = [region for region in manifest['dictionaries']['Region'] if region]
         
         return jsonify({"regions": regions}), 200
 
     except Exception as e:
-        print(f"!!! Error fetching team regions for {file_id}: {e} !!!")
-        print(traceback.format_exc())
+        logger.exception("Error fetching team regions for %s: %s", file_id, e)
         return jsonify({"error": f"Failed to fetch team regions: {e}"}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus text-format metrics: stage, tool, LLM-round and HTTP latency histograms,
+    in-flight requests, chat and analysis cache hit rates and the number of live conversations.
+    """
+    cache_stats = {"tool": get_tool_cache_stats(), "response": get_response_cache_stats(), "analysis": analysis_cache.stats(),
+                   "dataset": dataset_cache.stats()}
+    enabled_caches = {name: stats for name, stats in cache_stats.items() if stats.get("enabled", True)}
+    extra_gauges = {
+        "partner_chat_cache_hit_ratio": ("Hit rate of the chatbot, analysis and dataset caches since startup.",
+                                         {(("cache", name),): stats["hit_rate"] for name, stats in enabled_caches.items()}),
+        "partner_chat_cache_hits": ("Hits of the chatbot, analysis and dataset caches since startup.",
+                                    {(("cache", name),): stats["hits"] for name, stats in enabled_caches.items()}),
+        "partner_chat_cache_misses": ("Misses of the chatbot, analysis and dataset caches since startup.",
+                                      {(("cache", name),): stats["misses"] for name, stats in enabled_caches.items()}),
+        "partner_chat_cache_entries": ("Entries currently held by the chatbot, analysis and dataset caches.",
+                                       {(("cache", name),): stats["entries"] for name, stats in enabled_caches.items()}),
+        "partner_chat_conversations": ("Conversations held in the server-side conversation store.",
+                                       {(): conversation_store.stats()["conversations"]}),
+    }
+    if shared_dataset_store is not None:
+        store_stats = shared_dataset_store.stats()
+        extra_gauges["partner_shared_datasets"] = ("Datasets in the shared dataset store.", {(): store_stats["datasets"]})
+        extra_gauges["partner_shared_dataset_bytes"] = ("Size of the shared dataset store's memory-mapped files.", {(): store_stats["bytes"]})
+    return Response(render_prometheus(extra_gauges), mimetype='text/plain; version=0.0.4')
+
+# Optional startup warm-up: WARMUP_FILES_PER_SOURCE most recently used files per source, at most
+# WARMUP_MAX_FILES files and WARMUP_MAX_MB of processed data, are read and analyzed in the background
+WARMUP_ENABLED = get_env_variable('WARMUP_ENABLED', 'false').lower() == 'true'
+WARMUP_FILES_PER_SOURCE = int(get_env_variable('WARMUP_FILES_PER_SOURCE', '1'))
+WARMUP_MAX_FILES = int(get_env_variable('WARMUP_MAX_FILES', '4'))
+WARMUP_MAX_BYTES = float(get_env_variable('WARMUP_MAX_MB', '256')) * 1024 * 1024
+warmup_status = {"state": "enabled" if WARMUP_ENABLED else "disabled", "files": [], "seconds": None}
+
+def select_warmup_files():
+    """file_ids to warm, most recently uploaded, appended or analyzed first, within the caps."""
+    by_recency = sorted(list(metadata['files'].items()), key=lambda item: file_last_used(item[1]), reverse=True)
+    per_source = {}
+    selected = []
+    total_bytes = 0
+    for file_id, file_info in by_recency:
+        if len(selected) >= WARMUP_MAX_FILES:
+            break
+        if per_source.get(file_info['source'], 0) >= WARMUP_FILES_PER_SOURCE:
+            continue
+        try:
+            size = os.path.getsize(file_info['processed_path'])
+        except OSError:
+            continue
+        if total_bytes + size > WARMUP_MAX_BYTES:
+            continue
+        per_source[file_info['source']] = per_source.get(file_info['source'], 0) + 1
+        total_bytes += size
+        selected.append(file_id)
+    return selected
+
+def warm_file(file_id):
+    """Loads a file into the dataset cache with its manifest and leaderboards and caches its default (whole-file) analysis."""
+    processed_df_path = metadata['files'][file_id]['processed_path']
+    mtime_ns = os.stat(processed_df_path).st_mtime_ns
+    df = read_processed_file(file_id, processed_df_path)
+    get_file_manifest(file_id)
+    get_file_leaderboards(file_id)
+    results, error_msg = compute_file_analysis(file_id, df, df)
+    if error_msg:
+        logger.warning("Warm-up analysis of %s failed: %s", file_id, error_msg)
+        return
+    # An append while the analysis ran has already replaced the data; its result would be stale
+    if os.stat(processed_df_path).st_mtime_ns == mtime_ns:
+        analysis_cache.set(AnalysisResultCache.make_key(file_id), results)
+
+def warm_up_recent_files():
+    started = time.perf_counter()
+    warmup_status["state"] = "running"
+    try:
+        with time_stage("warmup"):
+            for file_id in select_warmup_files():
+                try:
+                    warm_file(file_id)
+                    warmup_status["files"].append(file_id)
+                except Exception as e:
+                    logger.warning("Warm-up of %s failed: %s", file_id, e)
+        warmup_status["state"] = "done"
+    except Exception as e:
+        logger.exception("Warm-up failed: %s", e)
+        warmup_status["state"] = "failed"
+    warmup_status["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("Warm-up loaded %d files in %.3fs", len(warmup_status["files"]), warmup_status["seconds"])
+
+# Retention: per-source limits as '5' or 'myAffiliate=5,dynamicWorks=3,*=10' (empty or 0: unlimited),
+# measured from a file's last use; stray files are removed after RETENTION_STRAY_HOURS
+RETENTION_MAX_FILES = parse_source_limits(get_env_variable('RETENTION_MAX_FILES_PER_SOURCE', ''))
+RETENTION_MAX_AGE_DAYS = parse_source_limits(get_env_variable('RETENTION_MAX_AGE_DAYS', ''))
+RETENTION_PINNED_FILES = {value.strip() for value in get_env_variable('RETENTION_PINNED_FILES', '').split(',') if value.strip()}
+RETENTION_STRAY_HOURS = float(get_env_variable('RETENTION_STRAY_HOURS', '24'))
+RETENTION_INTERVAL_MINUTES = float(get_env_variable('RETENTION_INTERVAL_MINUTES', '60'))
+retention_lock = threading.Lock()
+last_retention_summary = None
+
+def run_retention(dry_run=False):
+    """
+    Removes the stored files beyond the retention limits (processed data, derived files and catalog
+    entry together), drops catalog entries whose data is gone, and deletes stray files. Returns a
+    summary of what was (with dry_run: would be) removed.
+    """
+    global last_retention_summary
+    with retention_lock, time_stage("retention"):
+        files = dict(metadata['files'])
+        removed = plan_retention(files, RETENTION_MAX_FILES, RETENTION_MAX_AGE_DAYS, RETENTION_PINNED_FILES)
+        missing = [file_id for file_id, file_info in files.items()
+                   if file_id not in removed and not os.path.exists(file_info['processed_path'])]
+        # Files other workers have registered since this one loaded the catalog are not strays;
+        # without a readable catalog no artifact is judged by its file id
+        try:
+            with open(METADATA_FILE, 'r') as f:
+                known_file_ids = set(files) | set(json.load(f)['files'])
+        except Exception as e:
+            logger.warning("Retention keeps untracked artifacts: the catalog could not be read (%s)", e)
+            known_file_ids = None
+        removed_paths = [path for file_id in removed for path in file_artifacts(PROCESSED_DATA_FOLDER, file_id)]
+        stray_paths = find_stray_files(PROCESSED_DATA_FOLDER, UPLOAD_FOLDER, known_file_ids,
+                                       RETENTION_STRAY_HOURS * 3600, extra_folders=[os.getcwd()],
+                                       extra_files=get_rotated_trace_files())
+
+        freed_bytes = sum(os.path.getsize(path) for path in removed_paths + stray_paths if os.path.exists(path))
+        if not dry_run:
+            # Out of the catalog and caches first, so no new request starts reading them
+            for file_id in [*removed, *missing]:
+                forget_file(file_id)
+                invalidate_chat_caches(file_id)
+            if removed or missing:
+                save_metadata(metadata)
+            freed_bytes = delete_paths(removed_paths + stray_paths)
+
+        summary = {
+            "dryRun": dry_run,
+            "ranAt": pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "removedFiles": [{"fileId": file_id, "filename": files[file_id].get('filename'),
+                              "source": files[file_id].get('source'), "reason": reason}
+                             for file_id, reason in removed.items()],
+            "droppedMissingFiles": missing,
+            "strayFiles": stray_paths,
+            "freedBytes": freed_bytes,
+        }
+    if not dry_run:
+        last_retention_summary = summary
+        if removed or missing or stray_paths:
+            logger.info("Retention removed %d files and %d catalog entries without data, deleted %d stray files, freed %d bytes",
+                        len(removed), len(missing), len(stray_paths), freed_bytes)
+    return summary
+
+def retention_loop():
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            logger.exception("Retention run failed: %s", e)
+        time.sleep(RETENTION_INTERVAL_MINUTES * 60)
+
+@app.route('/retention', methods=['GET', 'POST'])
+def retention_endpoint():
+    """
+    GET: the retention policy and the last run's summary.
+    POST: runs retention now; {"dryRun": true} only reports what would be removed.
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            return jsonify(run_retention(dry_run=bool(data.get('dryRun', False)))), 200
+        except Exception as e:
+            logger.exception("Error in /retention endpoint: %s", e)
+            return jsonify({"error": f"Retention run failed: {e}"}), 500
+    return jsonify({
+        "maxFilesPerSource": RETENTION_MAX_FILES,
+        "maxAgeDays": RETENTION_MAX_AGE_DAYS,
+        "pinnedFiles": sorted(RETENTION_PINNED_FILES),
+        "strayHours": RETENTION_STRAY_HOURS,
+        "intervalMinutes": RETENTION_INTERVAL_MINUTES,
+        "lastRun": last_retention_summary
+    }), 200
+
+@app.route('/startup-timings', methods=['GET'])
+def startup_timings():
+    """
+    Endpoint reporting how long the app module took to load, for the lazily-initialized
+    subsystems (Excel parser, chat agent) how long their first use took or why it last failed (they
+    are retried on next use), and the warm-up's progress.
+    """
+    return jsonify({
+        "appStartupSeconds": startup_duration_seconds,
+        "lazyInitSeconds": get_lazy_init_timings(),
+        "lazyInitErrors": get_lazy_init_errors(),
+        "warmup": warmup_status
+    }), 200
+
+if WARMUP_ENABLED:
+    # Runs beside the app: readiness does not wait for it
+    threading.Thread(target=warm_up_recent_files, name='warmup', daemon=True).start()
+if RETENTION_INTERVAL_MINUTES > 0:
+    threading.Thread(target=retention_loop, name='retention', daemon=True).start()
+
+startup_duration_seconds = time.perf_counter() - startup_started
+logger.info("Backend ready in %.3fs (Excel parser and chat agent load on first use)", startup_duration_seconds)
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000) 
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""
+Compares two benchmark result files written by run_benchmarks.
+
+Usage:
+    python -m backend.benchmarks.compare_results baseline.json candidate.json [--threshold 0.2]
+
+Prints the wall-time and peak-memory ratio for every (rows, stage) present in both files and
+exits with status 1 if any stage got slower (or used more memory) by more than the threshold.
+"""
+import sys
+import json
+import argparse
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        report = json.load(f)
+    return report.get("meta", {}), {(r["rows"], r["stage"]): r for r in report["results"]}
+
+
+def compare(baseline_path, candidate_path, threshold=0.2):
+    baseline_meta, baseline = load_results(baseline_path)
+    candidate_meta, candidate = load_results(candidate_path)
+    print(f"Baseline: {baseline_meta.get('git_commit')}  Candidate: {candidate_meta.get('git_commit')}")
+    print(f"{'rows':>9}  {'stage':<45} {'time (s)':>19} {'ratio':>7} {'peak MB ratio':>14}")
+
+    regressions = []
+    for key in sorted(set(baseline) & set(candidate)):
+        old, new = baseline[key], candidate[key]
+        time_ratio = new["wall_seconds"] / old["wall_seconds"] if old["wall_seconds"] else float('inf')
+        memory_ratio = new["peak_memory_mb"] / old["peak_memory_mb"] if old["peak_memory_mb"] else float('inf')
+        flag = ""
+        if time_ratio > 1 + threshold or memory_ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key[0]:>9}  {key[1]:<45} {old['wall_seconds']:>8.3f} -> {new['wall_seconds']:>8.3f} "
+              f"{time_ratio:>6.2f}x {memory_ratio:>13.2f}x{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed slowdown before flagging (0.2 = 20%%)')
+    args = parser.parse_args(argv)
+    regressions = compare(args.baseline, args.candidate, args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+A local stand-in for the OpenAI chat-completions API, used by the load harness so /chat can be
+exercised offline and without token costs.
+
+It answers POST .../chat/completions in both the regular and the streaming (server-sent events)
+form. When the request offers tools and the last message is from the user, it replies with one
+tool call picked from keywords in the question; once a tool result is in the conversation it
+replies with a short final answer. Requests without tools (e.g. history summarization) get a
+plain text reply. A fixed latency per response simulates model time.
+
+Usage (from the repository root):
+    python -m backend.benchmarks.fake_openai_server --port 8765 --latency 0.2
+then point the backend at it with API_BASE_URL=http://127.0.0.1:8765/v1.
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# (keywords, tool name, arguments) checked in order against the lower-cased question
+TOOL_RULES = [
+    (('anomal', 'unusual', 'outlier', 'spike'), 'detect_metric_anomalies', {'metric': 'Deriv Revenue', 'level': 'both', 'top_n': 5}),
+    (('leaderboard', 'bottom', 'top 10'), 'get_partner_leaderboard', {'metric': 'Deriv Revenue', 'n': 10, 'direction': 'top'}),
+    (('top partner', 'best partner', 'highest'), 'get_top_partner_tool', {'metric': 'Deriv Revenue', 'year': 2025, 'month': 4}),
+    (('how many partners', 'partner count', 'number of partners'), 'get_partner_counts_by_country_tool', {}),
+    (('negative',), 'get_partners_with_negative_revenue', {}),
+    (('compare',), 'compare_countries_by_month', {'countries': ['Country 000', 'Country 001'], 'metric': 'Deriv Revenue', 'months': 4}),
+    (('churn',), 'identify_churn_risk_partners', {'months': 3}),
+    (('growth', 'declin', 'trend'), 'identify_partners_with_trends', {'trend_type': 'growth', 'metric': 'Deriv Revenue', 'months': 3}),
+    (('all files', 'every file', 'across files'), 'aggregate_across_files', {'metric': 'Deriv Revenue', 'group_by': 'Region'}),
+]
+DEFAULT_TOOL = ('get_countries_by_revenue', {})
+
+FINAL_ANSWER = "Based on the data, here is the summary you asked for: the figures above come from the uploaded file."
+SUMMARY_ANSWER = "The user asked about partner performance and the assistant answered from the uploaded data."
+
+
+def choose_tool_call(question, offered_tools):
+    """Returns (tool name, arguments) for the question, restricted to the tools the request offers."""
+    text = (question or "").lower()
+    for keywords, tool_name, arguments in TOOL_RULES:
+        if tool_name in offered_tools and any(keyword in text for keyword in keywords):
+            return tool_name, arguments
+    if DEFAULT_TOOL[0] in offered_tools:
+        return DEFAULT_TOOL
+    return offered_tools[0], {}
+
+
+def build_reply(body):
+    """Returns (content, tool_call) for a chat-completions request body; exactly one is None."""
+    messages = body.get('messages', [])
+    offered_tools = [t['function']['name'] for t in body.get('tools', []) if t.get('type') == 'function']
+    if not offered_tools:
+        return SUMMARY_ANSWER, None
+    if messages and messages[-1].get('role') == 'tool':
+        return FINAL_ANSWER, None
+    question = next((m.get('content') for m in reversed(messages) if m.get('role') == 'user'), '')
+    if isinstance(question, list): # content parts
+        question = ' '.join(part.get('text', '') for part in question if isinstance(part, dict))
+    tool_name, arguments = choose_tool_call(question, offered_tools)
+    return None, {'id': f"call_{uuid.uuid4().hex[:12]}", 'type': 'function',
+                  'function': {'name': tool_name, 'arguments': json.dumps(arguments)}}
+
+
+class FakeChatCompletionsHandler(BaseHTTPRequestHandler):
+    latency_seconds = 0.0
+    token_delay_seconds = 0.0
+    request_count = 0
+    _count_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f"Unknown path {self.path}"}})
+            return
+        with FakeChatCompletionsHandler._count_lock:
+            FakeChatCompletionsHandler.request_count += 1
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        content, tool_call = build_reply(body)
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if body.get('stream'):
+            self._stream_reply(body, content, tool_call)
+        else:
+            self._send_completion(body, content, tool_call)
+
+    @staticmethod
+    def _usage(body, content, tool_call):
+        """Rough token counts (~4 characters per token), so callers can exercise usage accounting."""
+        prompt_tokens = sum(len(str(m.get('content') or '')) for m in body.get('messages', [])) // 4
+        completion_tokens = len(content or tool_call['function']['arguments']) // 4
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens}
+
+    def _send_completion(self, body, content, tool_call):
+        message = {'role': 'assistant', 'content': content}
+        if tool_call:
+            message['tool_calls'] = [tool_call]
+        self._send_json(200, {
+            'id': f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': body.get('model', 'fake-model'),
+            'choices': [{'index': 0, 'message': message, 'finish_reason': 'tool_calls' if tool_call else 'stop'}],
+            'usage': self._usage(body, content, tool_call),
+        })
+
+    def _stream_reply(self, body, content, tool_call):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        def send_chunk(delta, finish_reason=None, usage=None):
+            chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()),
+                     'model': body.get('model', 'fake-model'),
+                     'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if usage is None else []}
+            if usage is not None:
+                chunk['usage'] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        if tool_call:
+            send_chunk({'role': 'assistant', 'content': None, 'tool_calls': [dict(tool_call, index=0)]})
+            send_chunk({}, 'tool_calls')
+        else:
+            send_chunk({'role': 'assistant', 'content': ''})
+            for word in content.split(' '):
+                send_chunk({'content': word + ' '})
+                if self.token_delay_seconds:
+                    time.sleep(self.token_delay_seconds)
+            send_chunk({}, 'stop')
+        # Like the real API, a final usage-only chunk when the client asks for it
+        if (body.get('stream_options') or {}).get('include_usage'):
+            send_chunk(None, usage=self._usage(body, content, tool_call))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_fake_openai_server(host='127.0.0.1', port=0, latency_seconds=0.0, token_delay_seconds=0.0):
+    """
+    Starts the fake server on a background thread and returns it; port 0 picks a free port
+    (read it back from server.server_address). Call server.shutdown() to stop it.
+    """
+    handler = type('ConfiguredFakeChatCompletionsHandler', (FakeChatCompletionsHandler,),
+                   {'latency_seconds': latency_seconds, 'token_delay_seconds': token_delay_seconds})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help='Seconds to wait before each response (simulated model time)')
+    parser.add_argument('--token-delay', type=float, default=0.0, help='Seconds between streamed answer tokens')
+    args = parser.parse_args(argv)
+
+    server = start_fake_openai_server(args.host, args.port, args.latency, args.token_delay)
+    print(f"Fake chat-completions server listening on http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""
+Concurrent HTTP load test for the backend.
+
+Generates synthetic processed files (a MyAffiliate and a DynamicWorks dataset) in a temporary
+data folder, starts the Flask app against them in a subprocess with the fake chat-completions
+server standing in for OpenAI, then drives mixed traffic from many concurrent clients:
+/get-analysis-data with varied date windows, /get-top-partner, /get-comparison-data and /chat.
+Reports throughput and p50/p95/p99 latency per endpoint.
+
+Usage (from the repository root):
+    python -m backend.benchmarks.load_test --clients 20 --duration 60 --partners 25000
+
+Use --base-url to load an already running backend instead; the file ids are then taken from
+its /load-stored-files (one 'myAffiliate' and one 'dynamicWorks' file are needed).
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+import pandas as pd
+
+from backend.benchmarks.synthetic_data import generate_wide_dataframe, month_starts
+from backend.benchmarks.fake_openai_server import start_fake_openai_server
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Relative request weights; override with --mix analysis=4,top_partner=3,comparison=2,chat=1
+DEFAULT_MIX = {'analysis': 4, 'top_partner': 3, 'comparison': 2, 'chat': 1}
+
+TOP_PARTNER_METRICS = ['Deriv Revenue', 'Expected Revenue', 'Partner Commissions', 'Total Deposits', 'Active Clients', 'FTT']
+COMPARISON_METRICS = ['Deriv Revenue', 'Partner Commissions', 'Active Clients', 'FTT']
+
+# A mix of questions the fast path answers directly and ones that go through the agent
+CHAT_QUERIES = [
+    "Who is the top partner for Deriv Revenue in April 2025?",
+    "How many partners are there in each country?",
+    "Rank countries by revenue",
+    "Which partners had negative revenue?",
+    "Compare Country 000 and Country 001 on revenue over the last few months",
+    "Give me an overview of revenue by country and explain it",
+]
+
+
+def write_processed_files(data_folder, partners, months):
+    """Writes one processed file per source, as /upload would, plus metadata.json. Returns {source: file_id}."""
+    from backend.utils.data_transformer import transform_parsed_dataframe
+
+    metadata = {"files": {}}
+    file_ids = {}
+    for seed, source in enumerate(['myAffiliate', 'dynamicWorks']):
+        with contextlib.redirect_stdout(io.StringIO()):
+            df_final = transform_parsed_dataframe(generate_wide_dataframe(partners, months=months, seed=42 + seed))
+        df_final['DataSource'] = source
+        file_id = f"loadtest-{source}"
+        processed_path = os.path.join(data_folder, f"{file_id}.feather")
+        df_final.to_feather(processed_path)
+        metadata['files'][file_id] = {
+            'filename': f"{file_id}.xlsx",
+            'source': source,
+            'processed_path': processed_path,
+            'upload_date': pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+        file_ids[source] = file_id
+        print(f"Wrote {len(df_final)} rows for {source} to {processed_path}")
+    with open(os.path.join(data_folder, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    return file_ids
+
+
+def start_backend(port, data_folder, llm_base_url, response_cache_backend, log_path):
+    """Starts the Flask app in a subprocess (threaded server, no reloader) and returns the process."""
+    env = dict(os.environ)
+    env.update({
+        'PROCESSED_DATA_FOLDER': data_folder,
+        'UPLOAD_FOLDER': os.path.join(data_folder, 'uploads'),
+        'CHAT_RESPONSE_CACHE_BACKEND': response_cache_backend,
+        # Never send load-test traffic to a real model, whatever backend/.env says
+        'API_BASE_URL': llm_base_url,
+        'OPENAI_API_KEY': 'load-test-key',
+        'CHAT_HISTORY_SUMMARIZER': 'extractive',
+    })
+    launcher = f"from backend.app import app; app.run(host='127.0.0.1', port={port}, threaded=True, debug=False, use_reloader=False)"
+    log_file = open(log_path, 'w')
+    return subprocess.Popen([sys.executable, '-c', launcher], cwd=REPO_ROOT, env=env,
+                            stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(base_url, timeout_seconds=120, process=None):
+    deadline = time.time() + timeout_seconds
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("Backend exited during startup; see its log")
+        try:
+            with urllib.request.urlopen(f"{base_url}/startup-timings", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.25)
+    raise RuntimeError(f"Backend at {base_url} was not ready after {timeout_seconds}s")
+
+
+def http_request(method, url, payload=None, timeout=120):
+    """Sends a request and returns the HTTP status (0 on connection errors)."""
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    request = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        return e.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+
+def discover_file_ids(base_url):
+    """Picks one stored file per source from a running backend's /load-stored-files."""
+    with urllib.request.urlopen(f"{base_url}/load-stored-files", timeout=30) as response:
+        stored_files = json.loads(response.read())['storedFiles']
+    file_ids = {}
+    for stored in stored_files:
+        file_ids.setdefault(stored['source'], stored['fileId'])
+    missing = {'myAffiliate', 'dynamicWorks'} - set(file_ids)
+    if missing:
+        raise RuntimeError(f"No stored file for source(s) {sorted(missing)} at {base_url}")
+    return file_ids
+
+
+def date_windows(months):
+    """(startDate, endDate) windows like the dashboard presets: all data, last month, last 3 months, a custom range."""
+    starts = month_starts(months)
+    month_end = pd.offsets.MonthEnd(0)
+    last_day = (starts[-1] + month_end).strftime('%Y-%m-%d')
+    windows = [(None, None), (starts[-1].strftime('%Y-%m-%d'), last_day)]
+    if months >= 3:
+        windows.append((starts[-3].strftime('%Y-%m-%d'), last_day))
+    if months >= 4:
+        windows.append((starts[1].strftime('%Y-%m-%d'), (starts[3] + month_end).strftime('%Y-%m-%d')))
+    return windows
+
+
+def build_request_factories(base_url, file_ids, months):
+    """Returns {endpoint name: function(rng) -> (method, url, payload)} for the traffic mix."""
+    analysis_file_ids = list(file_ids.values())
+    windows = date_windows(months)
+    year_months = [(d.year, d.month) for d in month_starts(months)]
+
+    def analysis(rng):
+        start_date, end_date = rng.choice(windows)
+        url = f"{base_url}/get-analysis-data/{rng.choice(analysis_file_ids)}"
+        if start_date:
+            url += f"?preset=custom&startDate={start_date}&endDate={end_date}"
+        return 'GET', url, None
+
+    def top_partner(rng):
+        year, month = rng.choice(year_months)
+        return 'POST', f"{base_url}/get-top-partner", {
+            'fileId': rng.choice(analysis_file_ids), 'metric': rng.choice(TOP_PARTNER_METRICS), 'year': year, 'month': month}
+
+    def comparison(rng):
+        metrics = rng.sample(COMPARISON_METRICS, rng.randint(1, len(COMPARISON_METRICS)))
+        return 'POST', f"{base_url}/get-comparison-data", {
+            'myAffiliateId': file_ids['myAffiliate'], 'dynamicWorksId': file_ids['dynamicWorks'],
+            'metricsToCompare': metrics, 'timeframe': 'monthly'}
+
+    def chat(rng):
+        return 'POST', f"{base_url}/chat", {'fileId': file_ids['myAffiliate'], 'query': rng.choice(CHAT_QUERIES), 'chat_history': []}
+
+    return {'analysis': analysis, 'top_partner': top_partner, 'comparison': comparison, 'chat': chat}
+
+
+def parse_mix(mix_arg):
+    if not mix_arg:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in mix_arg.split(','):
+        name, weight = part.split('=')
+        if name.strip() not in DEFAULT_MIX:
+            raise ValueError(f"Unknown endpoint '{name}' in --mix (expected {', '.join(DEFAULT_MIX)})")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_clients(factories, mix, clients, duration_seconds, seed=0):
+    """Runs `clients` threads sending weighted-random requests for duration_seconds. Returns per-endpoint samples."""
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    samples = defaultdict(list) # endpoint -> [(latency seconds, status)]
+    samples_lock = threading.Lock()
+    deadline = time.perf_counter() + duration_seconds
+
+    def client_loop(client_index):
+        rng = random.Random(seed + client_index)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, url, payload = factories[name](rng)
+            started = time.perf_counter()
+            status = http_request(method, url, payload)
+            latency = time.perf_counter() - started
+            with samples_lock:
+                samples[name].append((latency, status))
+
+    threads = [threading.Thread(target=client_loop, args=(i,), daemon=True) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - started
+
+
+def summarize(samples, elapsed_seconds):
+    endpoints = {}
+    for name, endpoint_samples in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in endpoint_samples)
+        errors = sum(1 for _, status in endpoint_samples if status != 200)
+        endpoints[name] = {
+            "requests": len(endpoint_samples),
+            "errors": errors,
+            "throughput_rps": round(len(endpoint_samples) / elapsed_seconds, 2),
+            "mean_ms": round(1000 * sum(latencies) / len(latencies), 1),
+            "p50_ms": round(1000 * percentile(latencies, 0.50), 1),
+            "p95_ms": round(1000 * percentile(latencies, 0.95), 1),
+            "p99_ms": round(1000 * percentile(latencies, 0.99), 1),
+            "max_ms": round(1000 * latencies[-1], 1),
+        }
+    total_requests = sum(e["requests"] for e in endpoints.values())
+    return {
+        "elapsed_seconds": round(elapsed_seconds, 2),
+        "total_requests": total_requests,
+        "total_errors": sum(e["errors"] for e in endpoints.values()),
+        "throughput_rps": round(total_requests / elapsed_seconds, 2) if elapsed_seconds else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(summary):
+    print(f"\n{'endpoint':<14} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, e in summary["endpoints"].items():
+        print(f"{name:<14} {e['requests']:>9} {e['errors']:>7} {e['throughput_rps']:>8.2f} "
+              f"{e['p50_ms']:>9.1f} {e['p95_ms']:>9.1f} {e['p99_ms']:>9.1f} {e['max_ms']:>9.1f}")
+    print(f"{'total':<14} {summary['total_requests']:>9} {summary['total_errors']:>7} {summary['throughput_rps']:>8.2f}"
+          f"   over {summary['elapsed_seconds']}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=20, help='Concurrent clients')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of load after warm-up')
+    parser.add_argument('--mix', default=None, help='Endpoint weights, e.g. analysis=4,top_partner=3,comparison=2,chat=1')
+    parser.add_argument('--partners', type=int, default=25000, help='Partners (workbook rows) per generated file')
+    parser.add_argument('--months', type=int, default=7, help='Months per generated file')
+    parser.add_argument('--port', type=int, default=5055, help='Port for the backend started by the harness')
+    parser.add_argument('--llm-latency', type=float, default=0.3, help='Seconds the fake model takes per response')
+    parser.add_argument('--response-cache', choices=['memory', 'off'], default='memory', help='CHAT_RESPONSE_CACHE_BACKEND for the backend')
+    parser.add_argument('--base-url', default=None, help='Load an already running backend instead of starting one')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Also write the summary as JSON here')
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    backend_process = None
+    fake_llm = None
+    with tempfile.TemporaryDirectory() as work_dir:
+        try:
+            if args.base_url:
+                base_url = args.base_url.rstrip('/')
+                file_ids = discover_file_ids(base_url)
+            else:
+                file_ids = write_processed_files(work_dir, args.partners, args.months)
+                fake_llm = start_fake_openai_server(latency_seconds=args.llm_latency)
+                llm_base_url = f"http://127.0.0.1:{fake_llm.server_address[1]}/v1"
+                log_path = os.path.join(work_dir, 'backend.log')
+                backend_process = start_backend(args.port, work_dir, llm_base_url, args.response_cache, log_path)
+                base_url = f"http://127.0.0.1:{args.port}"
+                wait_until_ready(base_url, process=backend_process)
+                print(f"Backend ready at {base_url} (fake LLM at {llm_base_url})")
+
+            factories = build_request_factories(base_url, file_ids, args.months)
+            # Warm-up: load each file once so /chat has a dataset and first-use costs are not measured
+            for file_id in file_ids.values():
+                http_request('GET', f"{base_url}/get-analysis-data/{file_id}")
+            http_request('POST', f"{base_url}/chat", {'fileId': file_ids['myAffiliate'], 'query': 'hello', 'chat_history': []})
+
+            print(f"Running {args.clients} clients for {args.duration}s with mix {mix}")
+            samples, elapsed = run_clients(factories, mix, args.clients, args.duration, seed=args.seed)
+            summary = summarize(samples, elapsed)
+            summary["config"] = {"clients": args.clients, "duration": args.duration, "mix": mix,
+                                 "partners": args.partners, "months": args.months,
+                                 "llm_latency": args.llm_latency, "response_cache": args.response_cache,
+                                 "base_url": args.base_url}
+            print_report(summary)
+            if args.output:
+                with open(args.output, 'w') as f:
+                    json.dump(summary, f, indent=2)
+                print(f"Summary written to {args.output}")
+        finally:
+            if backend_process is not None:
+                backend_process.terminate()
+                try:
+                    backend_process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    backend_process.kill()
+            if fake_llm is not None:
+                fake_llm.shutdown()
+
+
+if __name__ == '__main__':
+    main()
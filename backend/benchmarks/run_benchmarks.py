@@ -0,0 +1,232 @@
+"""
+Benchmarks the ingest and analysis pipeline on synthetic workbooks.
+
+Each stage (parse_excel, transform, feather write/read, calculate_kpis, analyze_performance and
+every chatbot tool) is timed at each requested size, recording wall time and peak memory.
+Results are written as JSON so runs on different commits can be compared with
+`python -m backend.benchmarks.compare_results old.json new.json`.
+
+Usage (from the repository root):
+    python -m backend.benchmarks.run_benchmarks --rows 25000 250000 1000000 --output bench.json
+
+--rows is the number of workbook rows (partners); the processed dataset has rows x months rows.
+"""
+import os
+import io
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import tracemalloc
+import subprocess
+import contextlib
+
+import pandas as pd
+
+from backend.benchmarks.synthetic_data import generate_wide_dataframe, write_workbook, DEFAULT_METRICS
+from backend.utils.data_transformer import transform_parsed_dataframe
+from backend.analysis.kpi_calculator import calculate_kpis
+from backend.analysis.performance_analyzer import analyze_performance
+
+DEFAULT_ROW_COUNTS = [25000, 250000, 1000000]
+
+# Chatbot tool calls benchmarked, with representative arguments
+TOOL_CALLS = [
+    ('get_top_partner_tool', {'metric': 'Deriv Revenue', 'year': 2025, 'month': 4}),
+    ('get_partner_counts_by_country_tool', {}),
+    ('get_countries_by_revenue', {}),
+    ('get_partners_with_negative_revenue', {}),
+    ('compare_countries_by_month', {'countries': ['Country 000', 'Country 001'], 'metric': 'Deriv Revenue', 'months': 4}),
+    ('identify_partners_with_trends', {'trend_type': 'growth', 'metric': 'Deriv Revenue', 'months': 3}),
+    ('identify_churn_risk_partners', {'months': 3}),
+]
+
+
+def _current_rss_bytes():
+    """Current resident set size from /proc (Linux), or None where unavailable."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class PeakMemorySampler:
+    """
+    Tracks the peak resident memory above the starting level while a stage runs, by sampling RSS
+    from a background thread. Unlike tracemalloc this also sees Arrow allocations and does not
+    slow the stage down. Falls back to tracemalloc where /proc is not available.
+    """
+
+    def __init__(self, interval_seconds=0.005):
+        self.interval_seconds = interval_seconds
+        self.use_rss = _current_rss_bytes() is not None
+        self._stop = threading.Event()
+        self._baseline = 0
+        self._peak = 0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self._peak = max(self._peak, _current_rss_bytes())
+            self._stop.wait(self.interval_seconds)
+
+    def __enter__(self):
+        if self.use_rss:
+            self._baseline = self._peak = _current_rss_bytes()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        else:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.use_rss:
+            self._stop.set()
+            self._thread.join()
+            self._peak = max(self._peak, _current_rss_bytes())
+        else:
+            _, self._peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return False
+
+    @property
+    def peak_mb(self):
+        return (self._peak - self._baseline) / (1024 * 1024)
+
+
+def _max_rss_mb():
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+    except ImportError:
+        return None
+
+
+def measure(stage, rows, results, func, stages=None, quiet=True):
+    """
+    Runs func once, appending its wall time and peak memory (MB above the level before the
+    stage) to results. Stages not matching the `stages` prefixes are skipped.
+    """
+    if stages and not any(stage.startswith(prefix) for prefix in stages):
+        return None
+    gc.collect()
+    error = None
+    output = None
+    with PeakMemorySampler() as memory:
+        started = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+                output = func()
+        except Exception as e:
+            error = str(e)
+        wall_seconds = time.perf_counter() - started
+    max_rss_mb = _max_rss_mb()
+    result = {
+        "rows": rows,
+        "stage": stage,
+        "wall_seconds": round(wall_seconds, 4),
+        "peak_memory_mb": round(memory.peak_mb, 2),
+        "max_rss_mb": round(max_rss_mb, 1) if max_rss_mb is not None else None,
+    }
+    if error:
+        result["error"] = error
+    results.append(result)
+    print(f"  {stage:<45} {result['wall_seconds']:>9.3f}s  peak +{result['peak_memory_mb']:>9.1f} MB"
+          + (f"  ERROR: {error}" if error else ""))
+    return output
+
+
+def benchmark_size(rows, months, metrics, results, include_parse, work_dir, stages=None):
+    print(f"--- {rows} workbook rows x {months} months x {len(metrics)} metrics ---")
+    df_wide = generate_wide_dataframe(rows, months=months, metrics=metrics)
+
+    if include_parse:
+        from backend.utils.file_parser import parse_excel
+        workbook_path = os.path.join(work_dir, f"bench_{rows}.xlsx")
+        write_workbook(df_wide, workbook_path)
+        measure("parse_excel", rows, results, lambda: parse_excel(workbook_path), stages=stages)
+        os.remove(workbook_path)
+
+    # The transform output feeds every later stage, so it always runs
+    df_final = measure("transform", rows, results, lambda: transform_parsed_dataframe(df_wide))
+    del df_wide
+    if df_final is None:
+        return
+    df_final['DataSource'] = 'benchmark'
+
+    feather_path = os.path.join(work_dir, f"bench_{rows}.feather")
+    measure("feather_write", rows, results, lambda: df_final.to_feather(feather_path), stages=stages)
+    if not os.path.exists(feather_path):
+        df_final.to_feather(feather_path)
+    df_loaded = measure("feather_read", rows, results, lambda: pd.read_feather(feather_path), stages=stages)
+    os.remove(feather_path)
+    del df_loaded
+
+    measure("calculate_kpis", rows, results, lambda: calculate_kpis(df_final.copy()), stages=stages)
+    measure("analyze_performance", rows, results, lambda: analyze_performance(df_final.copy()), stages=stages)
+
+    from backend.analysis import chatbot_service
+    with contextlib.redirect_stdout(io.StringIO()):
+        chatbot_service.set_current_df_for_chatbot(df_final, f"benchmark-{rows}")
+    tools_by_name = {chat_tool.name: chat_tool for chat_tool in chatbot_service.tools}
+    for tool_name, tool_args in TOOL_CALLS:
+        # Call the undecorated function so the tool result cache does not hide the real cost
+        tool_func = getattr(tools_by_name[tool_name].func, '__wrapped__', tools_by_name[tool_name].func)
+        measure(f"tool:{tool_name}", rows, results, lambda: tool_func(**tool_args), stages=stages)
+    with contextlib.redirect_stdout(io.StringIO()):
+        chatbot_service.set_current_df_for_chatbot(None, None)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmarks(row_counts, months=7, metrics=None, include_parse=False, stages=None):
+    metrics = metrics or DEFAULT_METRICS
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in row_counts:
+            benchmark_size(rows, months, metrics, results, include_parse, work_dir, stages=stages)
+    return {
+        "meta": {
+            "git_commit": _git_commit(),
+            "timestamp": pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "months": months,
+            "metrics": metrics,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROW_COUNTS, help='Workbook row counts (partners) to benchmark')
+    parser.add_argument('--months', type=int, default=7, help='Number of monthly date columns per metric')
+    parser.add_argument('--metrics', nargs='+', default=None, help='Metric names (workbook spelling) to generate')
+    parser.add_argument('--include-parse', action='store_true', help='Also write .xlsx files and time parse_excel (needs openpyxl and unstructured; slow)')
+    parser.add_argument('--stages', nargs='+', default=None, help='Only run stages starting with these prefixes, e.g. transform calculate_kpis tool:get_top')
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results')
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.rows, months=args.months, metrics=args.metrics, include_parse=args.include_parse,
+                            stages=args.stages)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Metric names as they appear in level 0 of the workbook header (before METRIC_RENAME_MAP)
+DEFAULT_METRICS = [
+    'Expected Revenue', 'Deriv Revenue', "Partners' Commissions",
+    'Total Deposits', 'Active Clients', 'First Time Traders'
+]
+COUNT_METRICS = {'Active Clients', 'First Time Traders'}
+
+ID_COLUMNS = [
+    ('Unnamed: 0_level_0', 'affiliate_id'),
+    ('Unnamed: 1_level_0', "partner's country"),
+    ('Unnamed: 2_level_0', 'GP Team Region'),
+]
+
+REGIONS = ['Africa', 'Asia', 'Europe', 'LATAM', 'Middle East', 'Oceania']
+
+
+def month_starts(months, end='2025-04-01'):
+    """The header dates for the given number of months, ending at `end`."""
+    return pd.date_range(end=end, periods=months, freq='MS')
+
+
+def generate_wide_dataframe(partners, months=7, metrics=None, countries=50, active_share=0.3, seed=42):
+    """
+    Generates a DataFrame in exactly the shape parse_excel returns for our affiliate workbooks:
+    three ID columns (affiliate_id, partner's country, GP Team Region) followed by one column per
+    metric x month under a two-level Metric/Date header, where only the first date column of each
+    metric carries the metric name and the rest are 'Unnamed: N_level_0' (merged header cells).
+
+    active_share is the probability that a partner has any activity in a given month; inactive
+    partner-months are left empty, as in the real exports.
+    """
+    metrics = metrics or DEFAULT_METRICS
+    rng = np.random.default_rng(seed)
+    dates = month_starts(months)
+
+    country_names = [f'Country {i:03d}' for i in range(countries)]
+    country_codes = rng.integers(0, countries, size=partners)
+    region_by_country = np.array([REGIONS[i % len(REGIONS)] for i in range(countries)], dtype=object)
+
+    columns = list(ID_COLUMNS)
+    data = {
+        ID_COLUMNS[0]: np.arange(100000, 100000 + partners),
+        ID_COLUMNS[1]: np.array(country_names, dtype=object)[country_codes],
+        ID_COLUMNS[2]: region_by_country[country_codes],
+    }
+
+    active = rng.random((partners, months)) < active_share
+    column_index = len(ID_COLUMNS)
+    for metric in metrics:
+        if metric in COUNT_METRICS:
+            values = rng.poisson(3, size=(partners, months)).astype('float64')
+        else:
+            # Heavy-tailed revenue-like values; Deriv Revenue can be negative (company losses)
+            values = np.round(rng.lognormal(mean=5, sigma=1.5, size=(partners, months)), 2)
+            if metric == 'Deriv Revenue':
+                values *= np.where(rng.random((partners, months)) < 0.15, -1, 1)
+        values[~active] = np.nan
+        for month_position, date in enumerate(dates):
+            level0 = metric if month_position == 0 else f'Unnamed: {column_index}_level_0'
+            column = (level0, date.strftime('%Y-%m-%d %H:%M:%S'))
+            columns.append(column)
+            data[column] = values[:, month_position]
+            column_index += 1
+
+    df = pd.DataFrame(data, columns=pd.MultiIndex.from_tuples(columns))
+    return df
+
+
+def write_workbook(df_wide, path):
+    """
+    Writes a generated wide DataFrame as an .xlsx workbook with the two header rows, so the full
+    parse_excel path can be benchmarked. Requires openpyxl.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    sheet.append(['' if str(level0).startswith('Unnamed:') else level0 for level0, _ in df_wide.columns])
+    sheet.append([level1 for _, level1 in df_wide.columns])
+    for row in df_wide.itertuples(index=False, name=None):
+        sheet.append([None if isinstance(value, float) and np.isnan(value) else value for value in row])
+    workbook.save(path)
+    return path
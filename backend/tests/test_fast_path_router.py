@@ -0,0 +1,75 @@
+from backend.analysis.fast_path_router import route_query
+
+AVAILABLE_MONTHS = {(2025, 1), (2025, 2), (2025, 3), (2025, 4)}
+DIMENSIONS = {'Country': ['Kenya', 'Nigeria', 'Vietnam'], 'Region': ['Africa', 'Asia']}
+
+
+def route(query):
+    return route_query(query, AVAILABLE_MONTHS, DIMENSIONS)
+
+
+def test_top_partner_for_metric_and_month():
+    result = route("Who is the top partner for revenue in April 2025?")
+    assert result['tool'] == 'get_top_partner_tool'
+    assert result['args'] == {'metric': 'Deriv Revenue', 'year': 2025, 'month': 4}
+    assert result['confidence'] == 1.0
+
+
+def test_top_partner_fills_the_year_from_the_data():
+    result = route("Who is the top partner for FTT in March?")
+    assert result['args'] == {'metric': 'FTT', 'year': 2025, 'month': 3}
+    assert result['confidence'] >= 0.8
+
+
+def test_top_partner_in_a_country_goes_to_the_agent():
+    assert route("Who is the top partner in Kenya for revenue in April 2025?")['confidence'] == 0.0
+
+
+def test_top_partner_with_a_demonym_goes_to_the_agent():
+    assert route("Which Nigerian partner had the highest FTT in April 2025")['confidence'] == 0.0
+
+
+def test_top_partner_of_a_source_goes_to_the_agent():
+    assert route("Which partner had the highest FTT in April 2025 among myAffiliate partners")['confidence'] == 0.0
+
+
+def test_top_partner_over_two_periods_goes_to_the_agent():
+    assert route("Who is the top partner for revenue in April 2025 or March 2025?")['confidence'] == 0.0
+
+
+def test_countries_by_revenue():
+    result = route("Which countries have the most revenue?")
+    assert result['tool'] == 'get_countries_by_revenue'
+    assert result['confidence'] == 1.0
+
+
+def test_countries_by_revenue_in_a_year_goes_to_the_agent():
+    assert route("Which countries have the most revenue in 2025?")['confidence'] == 0.0
+
+
+def test_countries_by_revenue_in_a_month_goes_to_the_agent():
+    assert route("Which countries have the most revenue in April?")['confidence'] == 0.0
+
+
+def test_partner_counts_by_country():
+    result = route("How many partners are there by country?")
+    assert result['tool'] == 'get_partner_counts_by_country_tool'
+    assert result['confidence'] == 1.0
+
+
+def test_partner_counts_in_a_region_goes_to_the_agent():
+    assert route("How many partners are there by country in Asia?")['confidence'] == 0.0
+
+
+def test_partner_counts_of_a_source_goes_to_the_agent():
+    assert route("How many dynamicWorks partners are there by country?")['confidence'] == 0.0
+
+
+def test_may_as_a_verb_is_not_a_period():
+    assert route("Which countries may have the most revenue?")['confidence'] == 1.0
+
+
+def test_names_are_not_matched_inside_other_words():
+    dimensions = {'Country': ['Oman'], 'Region': []}
+    result = route_query("Which countries have the most revenue? Show the womanswear partners too", AVAILABLE_MONTHS, dimensions)
+    assert result['confidence'] == 1.0
@@ -0,0 +1,226 @@
+import logging
+
+import pandas as pd
+
+from backend.utils.metrics import time_stage
+from backend.utils.dotenv_loader import get_env_variable
+
+logger = logging.getLogger(__name__)
+
+# ID columns as they come out of the two-level workbook header (Metric / Date)
+ID_RENAME_MAP = {
+    ('Unnamed: 0_level_0', 'affiliate_id'): 'Partner ID',
+    ('Unnamed: 1_level_0', "partner's country"): 'Country',
+    ('Unnamed: 2_level_0', 'GP Team Region'): 'Region'
+}
+
+# Rename metric columns to match expected names
+# Important: Adjust keys here based on the *actual* metric names in level 0 of your MultiIndex
+METRIC_RENAME_MAP = {
+    'Expected Revenue': 'Expected Revenue',
+    'Deriv Revenue': 'Deriv Revenue',
+    'Partners\' Commissions': 'Partner Commissions', # Note the apostrophe difference
+    'Total Deposits': 'Total Deposits',
+    'Active Clients': 'Active Clients',
+    'First Time Traders': 'FTT'
+    # Add mappings for 'Band', 'Partners' Performance Index', 'Client Retention Rate' if needed
+    # Or handle/drop them if they are not needed for these specific KPIs
+}
+
+PARTNER_KEYS = ['Partner ID', 'Country', 'Region']
+# Inactive partner-months (most of them) are not stored unless DROP_EMPTY_PARTNER_DATES=false
+DROP_EMPTY_PARTNER_DATES = get_env_variable('DROP_EMPTY_PARTNER_DATES', 'true').lower() == 'true'
+
+
+def clean_multiindex_header(df):
+    """
+    Forward fills the metric names (level 0) across the date columns of the parsed sheet,
+    where the spreadsheet's merged header cells leave 'Unnamed' or 'NaT' placeholders.
+    Returns a copy with the column levels named ['Metric', 'Date_Str'].
+    """
+    # Make a copy to avoid modifying the original df if needed elsewhere
+    df_transformed = df.copy()
+
+    # Store original columns before manipulation
+    original_columns = df_transformed.columns
+
+    # Forward fill the metric names (level 0) across columns where it's 'Unnamed' or potentially 'NaT'
+    new_cols_level0 = []
+    last_valid_metric = None
+    # We need to iterate carefully, assuming metric names appear before their date columns
+    # This logic might need adjustment based on the *exact* column structure
+    for i, col_tuple in enumerate(original_columns):
+        level0, level1 = col_tuple
+        # Assume first few columns are IDs and don't have metric names in level 0
+        if i < 3:
+            last_valid_metric = level0 # Or maybe None, depending on structure
+            new_cols_level0.append(level0) # Keep original ID level 0 name
+            continue
+
+        # Check if level0 looks like a valid metric name (not 'Unnamed...', not 'NaT')
+        if not str(level0).startswith('Unnamed:') and pd.notna(level0):
+            last_valid_metric = level0
+            new_cols_level0.append(level0)
+        # If it's unnamed/NaT but we have a previous metric, use that
+        elif last_valid_metric:
+            new_cols_level0.append(last_valid_metric)
+        # Otherwise, keep the original (might still be 'Unnamed' if it's an unexpected structure)
+        else:
+            new_cols_level0.append(level0)
+
+    # Assign the cleaned level 0 and original level 1 back to the columns
+    df_transformed.columns = pd.MultiIndex.from_tuples(list(zip(new_cols_level0, original_columns.get_level_values(1))))
+    df_transformed.columns.names = ['Metric', 'Date_Str']
+    logger.debug("Cleaned MultiIndex columns (showing first few): %s", list(df_transformed.columns[:15]))
+    return df_transformed
+
+
+def reshape_to_long(df_transformed):
+    """
+    Melts the wide sheet (one column per metric x date) and pivots it back so each row is one
+    partner-date with one column per metric.
+    """
+    # --- Identify ID columns and Melt ---
+    id_vars_list = list(df_transformed.columns[:3])
+    logger.debug("Melting with id_vars: %s", id_vars_list)
+    df_long = pd.melt(df_transformed, id_vars=id_vars_list, value_name='Value')
+
+    # --- Clean up Melted Data ---
+    # Rename ID columns (Target the tuples that exist post-melt)
+    df_long.rename(columns=ID_RENAME_MAP, inplace=True)
+    logger.debug("Columns after melting and ID rename: %s", list(df_long.columns))
+
+    # Convert Date_Str to datetime objects
+    df_long['Date_Str_Clean'] = df_long['Date_Str'].astype(str).str.split('.').str[0]
+    df_long['Date'] = pd.to_datetime(df_long['Date_Str_Clean'], errors='coerce')
+    df_long = df_long.dropna(subset=['Date'])
+
+    # Convert Value column to numeric, coercing errors to NaN
+    df_long['Value'] = pd.to_numeric(df_long['Value'], errors='coerce')
+
+    # Pivot the table to get metrics as columns
+    df_final = df_long.pivot_table(
+        index=['Partner ID', 'Country', 'Region', 'Date'],
+        columns='Metric',
+        values='Value',
+        aggfunc='sum' # Specify aggregation function
+    ).reset_index()
+
+    df_final.rename(columns=METRIC_RENAME_MAP, inplace=True)
+    df_final.columns.name = None # Remove the index name ('Metric')
+    return df_final
+
+
+def drop_empty_partner_dates(df_final):
+    """
+    Drops partner-date rows whose metrics are all zero or missing: the pivot turns the empty cells
+    of an inactive partner-month into zeros, and most partners are inactive in most months. One row
+    is kept for every Partner ID / Country / Region and every Date / Country / Region, so each
+    partner, date and country still appears and analyses that count a missing partner-date as zero
+    give the same results as on the full grid.
+    """
+    metrics = [col for col in df_final.columns if col not in PARTNER_KEYS and col != 'Date']
+    keep = (df_final[metrics].fillna(0) != 0).any(axis=1)
+    for keys in (PARTNER_KEYS, ['Date', 'Country', 'Region']):
+        covered = pd.MultiIndex.from_frame(df_final.loc[keep, keys])
+        keep |= ~pd.MultiIndex.from_frame(df_final[keys]).isin(covered) & ~df_final.duplicated(keys)
+    logger.debug("Dropped %d of %d partner-date rows without activity", int((~keep).sum()), len(df_final))
+    return df_final[keep.to_numpy()].reset_index(drop=True)
+
+
+def fill_partner_dates(df, dates):
+    """
+    Adds zero rows for the dates (of the whole file) on which a partner of df has no stored row,
+    e.g. after df was filtered down to a few partners; their other columns come from the partner's
+    first row. Frames stored without dropping empty partner-dates come back unchanged.
+    """
+    if df.empty or any(col not in df.columns for col in [*PARTNER_KEYS, 'Date']):
+        return df
+    partners = df.drop_duplicates(PARTNER_KEYS).drop(columns='Date')
+    grid = partners.merge(pd.DataFrame({'Date': pd.unique(dates)}).astype({'Date': df['Date'].dtype}), how='cross')
+    missing = grid[~pd.MultiIndex.from_frame(grid[[*PARTNER_KEYS, 'Date']]).isin(
+        pd.MultiIndex.from_frame(df[[*PARTNER_KEYS, 'Date']]))]
+    if missing.empty:
+        return df
+    missing = missing[df.columns].copy()
+    metrics = [col for col in df.columns if col not in PARTNER_KEYS and col not in ('Date', 'DataSource')]
+    missing[metrics] = 0.0
+    filled = pd.concat([df, missing.astype(df.dtypes.to_dict())], ignore_index=True)
+    return filled.sort_values(['Partner ID', 'Date'], kind='stable').reset_index(drop=True)
+
+
+def transform_parsed_dataframe(df):
+    """
+    Transforms the DataFrame returned by parse_excel (two-level Metric/Date header, three ID
+    columns) into the processed long format: one row per Partner ID / Country / Region / Date.
+    Raises on malformed input; callers decide how to report the error.
+    """
+    with time_stage("header_cleanup"):
+        df_transformed = clean_multiindex_header(df)
+    with time_stage("reshape"):
+        df_final = reshape_to_long(df_transformed)
+        if DROP_EMPTY_PARTNER_DATES:
+            df_final = drop_empty_partner_dates(df_final)
+
+    logger.info("Transformed DataFrame: %d rows, columns %s", len(df_final), list(df_final.columns))
+    # Rendering a preview is not free on large frames, so only do it when it will be shown
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Transformed DataFrame head:\n%s", df_final.head())
+    return df_final
+
+
+def _restore_anchors(existing_df, overlap, new_df, merged):
+    """
+    Adds zero rows for the partners (Partner ID / Country / Region) and the dates per Country /
+    Region that only appeared in replaced rows but would still have rows on the full grid: a
+    partner on an existing date the new workbook does not cover, a date with an existing partner
+    of that Country / Region the new workbook does not list.
+    """
+    replaced = existing_df[overlap]
+    if replaced.empty:
+        return merged
+    metrics = [col for col in merged.columns if col not in PARTNER_KEYS and col not in ('Date', 'DataSource')]
+    anchors = []
+
+    old_dates = existing_df.loc[~existing_df['Date'].isin(new_df['Date'].unique()), 'Date']
+    lost = replaced.drop_duplicates(PARTNER_KEYS)
+    lost = lost[~pd.MultiIndex.from_frame(lost[PARTNER_KEYS]).isin(pd.MultiIndex.from_frame(merged[PARTNER_KEYS]))]
+    if not lost.empty and not old_dates.empty:
+        anchors.append(lost.assign(Date=old_dates.min()))
+
+    date_keys = ['Date', 'Country', 'Region']
+    present = pd.concat([merged[date_keys], *[anchor[date_keys] for anchor in anchors]])
+    lost = replaced.drop_duplicates(date_keys)
+    lost = lost[~pd.MultiIndex.from_frame(lost[date_keys]).isin(pd.MultiIndex.from_frame(present))]
+    unlisted = existing_df[~existing_df['Partner ID'].isin(new_df['Partner ID'].unique())]
+    if not lost.empty and not unlisted.empty:
+        partners = unlisted.drop_duplicates(['Country', 'Region']).drop(columns='Date')
+        anchors.append(lost[date_keys].merge(partners, on=['Country', 'Region'], how='inner')[merged.columns])
+
+    anchors = [anchor for anchor in anchors if not anchor.empty]
+    if not anchors:
+        return merged
+    anchors = pd.concat(anchors, ignore_index=True)
+    anchors[metrics] = 0.0
+    logger.debug("Kept %d zero rows for partners and dates only the replaced rows had", len(anchors))
+    return pd.concat([merged, anchors[merged.columns]], ignore_index=True)
+
+
+def merge_by_partner_date(existing_df, new_df):
+    """
+    Merges newly ingested rows into an existing processed dataset. The new workbook covers every
+    date it has for every partner it lists (its rows without activity may not be stored), so
+    existing rows of a new_df partner on a new_df date are replaced and everything else is kept.
+    Returns (merged DataFrame, number of replaced rows).
+    """
+    new_df = new_df.copy()
+    for col in ['Partner ID', 'Date']:
+        if col in existing_df.columns and new_df[col].dtype != existing_df[col].dtype:
+            new_df[col] = new_df[col].astype(existing_df[col].dtype)
+    overlap = (existing_df['Partner ID'].isin(new_df['Partner ID'].unique())
+               & existing_df['Date'].isin(new_df['Date'].unique())).to_numpy()
+    merged = pd.concat([existing_df[~overlap], new_df], ignore_index=True)
+    merged = _restore_anchors(existing_df, overlap, new_df, merged)
+    merged = merged.sort_values(['Partner ID', 'Date'], kind='stable').reset_index(drop=True)
+    logger.info("Merged %d new rows into %d existing rows (%d replaced)", len(new_df), len(existing_df), int(overlap.sum()))
+    return merged, int(overlap.sum())
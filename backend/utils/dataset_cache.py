@@ -0,0 +1,83 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class ProcessedDatasetCache:
+    """
+    LRU cache of whole processed DataFrames keyed by file path, bounded by their in-memory size.
+    An entry is only returned while the file's mtime is unchanged, so a rewritten file (append) is
+    read again. Callers get a shallow copy: with copy-on-write, assigning a column to it leaves the
+    cached frame untouched. An entry's on_evict callback runs when it leaves the cache.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # path -> (mtime_ns, nbytes, DataFrame, on_evict)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != mtime_ns:
+                if entry is not None:
+                    self._remove(path)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[2].copy(deep=False)
+
+    def put(self, path, df, mtime_ns=None, on_evict=None):
+        """Caches df as the content of path (as of mtime_ns, default: the file's current mtime). Frames above the budget are not kept."""
+        if mtime_ns is None:
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                mtime_ns = None
+        nbytes = int(df.memory_usage(deep=True).sum())
+        if mtime_ns is None or nbytes > self.max_bytes:
+            if on_evict is not None:
+                on_evict()
+            return
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+            self._entries[path] = (mtime_ns, nbytes, df.copy(deep=False), on_evict)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def contains(self, path):
+        with self._lock:
+            return path in self._entries
+
+    def invalidate(self, path):
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+
+    def _remove(self, path):
+        _, nbytes, _, on_evict = self._entries.pop(path)
+        self._bytes -= nbytes
+        if on_evict is not None:
+            on_evict()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
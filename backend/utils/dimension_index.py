@@ -0,0 +1,80 @@
+import os
+import uuid
+
+import numpy as np
+import pyarrow.feather as feather
+
+# Query parameter -> indexed processed data column
+INDEXED_DIMENSIONS = {'region': 'Region', 'country': 'Country', 'partner': 'Partner ID'}
+
+
+def _labels(series):
+    # Integral float IDs (e.g. from a column with gaps) are indexed as '123', the way users type them
+    if series.dtype.kind == 'f' and (series.dropna() % 1 == 0).all():
+        series = series.astype('Int64')
+    return series.astype(str).to_numpy(dtype=str)
+
+
+def build_dimension_index(df):
+    """
+    For each indexed column, the row ids of every value in CSR form: values[i] owns
+    row_ids[offsets[i]:offsets[i + 1]]. Values are stored as strings and row ids ascend within a value.
+    """
+    index = {}
+    for column in INDEXED_DIMENSIONS.values():
+        if column not in df.columns:
+            continue
+        labels = _labels(df[column])
+        values, codes = np.unique(labels, return_inverse=True)
+        row_ids = np.argsort(codes, kind='stable').astype(np.int32)
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(values)), out=offsets[1:])
+        index[column] = {'values': values, 'offsets': offsets, 'row_ids': row_ids}
+    return index
+
+
+def write_dimension_index(index, path):
+    """Saves the index as an .npz archive via a temporary file and a rename."""
+    arrays = {f"{column}/{name}": array for column, parts in index.items() for name, array in parts.items()}
+    temp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}.npz"
+    try:
+        np.savez(temp_path, **arrays)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def load_dimension_index(path):
+    index = {}
+    with np.load(path, allow_pickle=False) as archive:
+        for key in archive.files:
+            column, name = key.split('/')
+            index.setdefault(column, {})[name] = archive[key]
+    return index
+
+
+def lookup_rows(index, filters):
+    """
+    Row ids matching every filter ({column: [values]}, values within a column OR-ed), ascending.
+    Returns None when a filtered column is not indexed.
+    """
+    row_ids = None
+    for column, wanted in filters.items():
+        parts = index.get(column)
+        if parts is None:
+            return None
+        wanted = sorted({str(value) for value in wanted})
+        positions = np.searchsorted(parts['values'], np.asarray(wanted))
+        matches = [parts['row_ids'][parts['offsets'][p]:parts['offsets'][p + 1]]
+                   for p, value in zip(positions, wanted)
+                   if p < len(parts['values']) and parts['values'][p] == value]
+        column_rows = np.sort(np.concatenate(matches)) if matches else np.empty(0, dtype=np.int32)
+        row_ids = column_rows if row_ids is None else np.intersect1d(row_ids, column_rows, assume_unique=True)
+    return row_ids
+
+
+def read_rows(path, row_ids):
+    """Reads only the given rows of a feather file (memory-mapped Arrow take, then pandas)."""
+    table = feather.read_table(path, memory_map=True)
+    return table.take(row_ids).to_pandas()
@@ -0,0 +1,66 @@
+import os
+import json
+import uuid
+
+import pandas as pd
+
+from backend.utils.metric_dtypes import widen_metric_dtypes
+
+# Columns whose distinct values are listed in the manifest
+DICTIONARY_COLUMNS = ['Country', 'Region', 'Partner ID']
+NON_METRIC_COLUMNS = {'Partner ID', 'Country', 'Region', 'Date', 'DataSource'}
+
+
+def _distinct(series):
+    values = series.dropna().unique().tolist()
+    if series.dtype.kind == 'f' and all(float(v).is_integer() for v in values):
+        values = [int(v) for v in values]
+    return sorted(v for v in values if v != '')
+
+
+def build_manifest(df, file_id, source):
+    """
+    Summary of a processed file that metadata endpoints and chat tools can use without reading
+    the data: row count, date range and months present, per-metric sum/min/max/null count, and
+    the distinct Country / Region / Partner ID values.
+    """
+    df = widen_metric_dtypes(df)
+    dates = pd.to_datetime(df['Date']) if 'Date' in df.columns else pd.Series(dtype='datetime64[ns]')
+    metrics = {}
+    for column in df.columns:
+        if column in NON_METRIC_COLUMNS or not pd.api.types.is_numeric_dtype(df[column]):
+            continue
+        values = df[column]
+        metrics[column] = {
+            "sum": float(values.sum()),
+            "min": float(values.min()) if values.notna().any() else None,
+            "max": float(values.max()) if values.notna().any() else None,
+            "null_count": int(values.isna().sum()),
+        }
+    return {
+        "file_id": file_id,
+        "source": source,
+        "row_count": int(len(df)),
+        "columns": list(df.columns),
+        "date_min": dates.min().strftime('%Y-%m-%d') if dates.notna().any() else None,
+        "date_max": dates.max().strftime('%Y-%m-%d') if dates.notna().any() else None,
+        "months": sorted(dates.dropna().dt.strftime('%Y-%m').unique().tolist()),
+        "metrics": metrics,
+        "dictionaries": {column: _distinct(df[column]) for column in DICTIONARY_COLUMNS if column in df.columns},
+    }
+
+
+def write_manifest(manifest, path):
+    temp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    try:
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def load_manifest(path):
+    with open(path, 'r') as f:
+        return json.load(f)
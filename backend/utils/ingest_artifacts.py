@@ -0,0 +1,29 @@
+import os
+import uuid
+
+# Files written for each processed dataset, all named <file_id>.<kind> in the processed data folder
+PROCESSED_DATA_KIND = 'feather' # One row per Partner ID / Country / Region / Date
+DATE_AGGREGATES_KIND = 'aggregates.feather' # Per-date metric sums and active partner counts
+DIMENSION_INDEX_KIND = 'dimindex.npz' # Region / Country / Partner ID -> row ids
+MANIFEST_KIND = 'manifest.json' # Row count, dates, metric statistics and distinct dimension values
+LEADERBOARDS_KIND = 'leaderboards.feather' # Top/bottom-k partners per metric and month, overall and per region
+PARTNER_INDEX_KIND = 'partnerindex.npz' # Partner ID -> row ranges, plus the record batch offsets of the data file
+
+
+def artifact_path(folder, file_id, kind):
+    return os.path.join(folder, f"{file_id}.{kind}")
+
+
+def write_feather_atomic(df, path):
+    """
+    Writes a DataFrame to feather via a temporary file and a rename, so readers never see a
+    half-written file and a failed write leaves the previous version in place.
+    """
+    temp_path = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+    try:
+        df.reset_index(drop=True).to_feather(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
@@ -0,0 +1,55 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds spent initializing each lazily-loaded subsystem, filled in on first use
+lazy_init_timings = {}
+# Last error of each subsystem whose initialization failed and will be retried; cleared on success
+lazy_init_errors = {}
+
+
+class LazyResource:
+    """
+    Builds an expensive resource (a heavy import, an LLM client, an agent) on first use.
+    Initialization is thread-safe: concurrent first callers wait for a single build.
+    A failed build (the factory raises) is not cached: the error is recorded in lazy_init_errors,
+    re-raised, and the next call retries the build.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    @property
+    def initialized(self):
+        return self._initialized
+
+    def get(self):
+        if self._initialized:
+            return self._value
+        with self._lock:
+            if not self._initialized:
+                started = time.perf_counter()
+                try:
+                    self._value = self._factory()
+                except Exception as e:
+                    lazy_init_errors[self.name] = str(e)
+                    raise
+                self._initialized = True
+                lazy_init_errors.pop(self.name, None)
+                lazy_init_timings[self.name] = time.perf_counter() - started
+                logger.info("Initialized '%s' in %.3fs", self.name, lazy_init_timings[self.name])
+        return self._value
+
+
+def get_lazy_init_timings():
+    return dict(lazy_init_timings)
+
+
+def get_lazy_init_errors():
+    return dict(lazy_init_errors)
@@ -0,0 +1,87 @@
+"""
+Storage dtypes of the processed metric columns.
+
+METRIC_DTYPE_POLICY:
+  'compact' (default): count metrics become nullable Int32 when every value is a whole number in range,
+                       currency metrics become float32 when every value survives the float32 round trip to the cent
+  'counts':            only the count metrics are narrowed
+  'off':               every metric stays float64 (as pivot_table produces them)
+Narrowing is lossless: widen_metric_dtypes restores the exact float64 values, and the analysis
+functions widen first, so their sums and results do not depend on the policy.
+"""
+import numpy as np
+import pandas as pd
+
+from backend.utils.dotenv_loader import get_env_variable
+
+COUNT_METRICS = ['Active Clients', 'FTT']
+CURRENCY_METRICS = ['Expected Revenue', 'Deriv Revenue', 'Partner Commissions', 'Total Deposits']
+CURRENCY_DECIMALS = 2
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+METRIC_DTYPE_POLICY = get_env_variable('METRIC_DTYPE_POLICY', 'compact').lower()
+
+
+def _fits_int32(values):
+    present = values[~np.isnan(values)]
+    return bool(np.all(present == np.floor(present)) and np.all((present >= INT32_MIN) & (present <= INT32_MAX)))
+
+
+def _fits_float32(values):
+    restored = np.round(values.astype(np.float32).astype(np.float64), CURRENCY_DECIMALS)
+    return bool(np.array_equal(restored, values, equal_nan=True))
+
+
+def metric_narrowing(df, policy=None):
+    """{column: dtype} for the float64 metric columns of df the policy can narrow without losing a value."""
+    policy = policy or METRIC_DTYPE_POLICY
+    if policy == 'off':
+        return {}
+    narrowing = {}
+    for column in COUNT_METRICS:
+        if column in df.columns and df[column].dtype == np.float64 and _fits_int32(df[column].to_numpy()):
+            narrowing[column] = 'Int32'
+    if policy == 'compact':
+        for column in CURRENCY_METRICS:
+            if column in df.columns and df[column].dtype == np.float64 and _fits_float32(df[column].to_numpy()):
+                narrowing[column] = np.float32
+    return narrowing
+
+
+def compact_metric_dtypes(df, policy=None, narrowing=None):
+    """
+    Narrows the float64 metric columns of a processed frame as far as the policy allows without
+    losing a value, or to the given {column: dtype} narrowing (a metric_narrowing result that holds
+    for df). Returns df itself when nothing changes, otherwise a shallow copy.
+    """
+    if narrowing is None:
+        narrowing = metric_narrowing(df, policy)
+    if not narrowing:
+        return df
+    df = df.copy(deep=False)
+    for column, dtype in narrowing.items():
+        df[column] = df[column].astype(dtype)
+    return df
+
+
+def widen_metric_dtypes(df):
+    """
+    The float64 view analysis code works on: Int32 counts become float64 with NaN for missing,
+    float32 currency is restored to its exact float64 cents. Returns df itself when every metric
+    is already float64, otherwise a shallow copy.
+    """
+    widened = {}
+    for column in COUNT_METRICS + CURRENCY_METRICS:
+        if column not in df.columns:
+            continue
+        dtype = df[column].dtype
+        if isinstance(dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_integer_dtype(dtype):
+            widened[column] = df[column].astype(np.float64)
+        elif dtype == np.float32:
+            widened[column] = df[column].astype(np.float64).round(CURRENCY_DECIMALS)
+    if not widened:
+        return df
+    df = df.copy(deep=False)
+    for column, values in widened.items():
+        df[column] = values
+    return df
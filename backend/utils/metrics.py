@@ -0,0 +1,144 @@
+import time
+import threading
+import contextlib
+
+# Latency buckets in seconds, from cached lookups up to full-file ingest
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Thread-safe Prometheus-style histogram with one series per label combination."""
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {} # label values -> {"counts": [...], "sum": float, "count": int}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        label_values = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series_items = sorted((key, dict(value, counts=list(value["counts"]))) for key, value in self._series.items())
+        for label_values, series in series_items:
+            labels = list(zip(self.label_names, label_values))
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets, series["counts"]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(float(upper_bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series['count']}")
+        return lines
+
+
+class Gauge:
+    """Thread-safe gauge that can be incremented and decremented (e.g. in-flight requests)."""
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {} if label_names else {(): 0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        label_values = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, label_values)))} {_format_value(value)}")
+        return lines
+
+
+# --- Backend metrics ---
+stage_duration_seconds = Histogram(
+    "partner_stage_duration_seconds",
+    "Duration of ingest and analysis stages (save, parse, stream_ingest, header_cleanup, reshape, feather_write, feather_read, append_merge, aggregates_update, leaderboards, partner_index, warmup, retention, kpi, performance, anomalies).",
+    label_names=("stage",))
+tool_duration_seconds = Histogram(
+    "partner_chat_tool_duration_seconds",
+    "Duration of chatbot tool executions (tool result cache misses).",
+    label_names=("tool",))
+llm_round_duration_seconds = Histogram(
+    "partner_llm_round_duration_seconds",
+    "Duration of each LLM call made by the chat agent or the history summarizer.",
+    label_names=("model",))
+http_request_duration_seconds = Histogram(
+    "partner_http_request_duration_seconds",
+    "HTTP request latency by route, method and status.",
+    label_names=("endpoint", "method", "status"))
+http_requests_in_flight = Gauge(
+    "partner_http_requests_in_flight",
+    "HTTP requests currently being handled.")
+
+registered_metrics = [stage_duration_seconds, tool_duration_seconds, llm_round_duration_seconds,
+                      http_request_duration_seconds, http_requests_in_flight]
+
+
+def time_stage(stage):
+    """
+    Times a pipeline stage into partner_stage_duration_seconds.
+    Usable as a context manager (`with time_stage("parse"):`) or a decorator (`@time_stage("kpi")`).
+    """
+    return stage_duration_seconds.time(stage=stage)
+
+
+def render_prometheus(extra_gauges=None):
+    """
+    Renders all registered metrics in the Prometheus text exposition format.
+    extra_gauges maps a metric name to (description, {label tuple: value}) for point-in-time values
+    such as cache hit rates, where the label tuple is a sequence of (name, value) pairs.
+    """
+    lines = []
+    for metric in registered_metrics:
+        lines.extend(metric.render())
+    for name, (description, samples) in (extra_gauges or {}).items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples.items():
+            lines.append(f"{name}{_format_labels(list(labels))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
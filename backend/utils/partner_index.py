@@ -0,0 +1,77 @@
+"""
+Partner ID -> row ranges of a processed file, for reading one partner's history without the rest.
+
+Processed files are clustered by partner: the pivot in reshape_to_long and the append merge both
+order rows by Partner ID, so each partner's rows are one contiguous run (a few runs at most, e.g. for
+a partner listed twice in a streamed workbook). The index keeps those runs plus the first row of
+every record batch in the Arrow file, so a lookup decompresses only the batches holding the runs.
+"""
+import numpy as np
+import pyarrow as pa
+
+from backend.utils.dimension_index import _labels
+
+PARTNER_COLUMN = 'Partner ID'
+
+
+def _batch_offsets(path):
+    """First row of every record batch of an Arrow IPC (feather) file, plus the row count."""
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        sizes = [reader.get_batch(i).num_rows for i in range(reader.num_record_batches)]
+    return np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)])
+
+
+def build_partner_index(df, path):
+    """
+    Runs of equal Partner ID in df, which must be the frame stored at path, in CSR form:
+    values[i] owns the row ranges [starts[j], stops[j]) for j in offsets[i]:offsets[i + 1].
+    Saved and loaded like a dimension index (write_dimension_index / load_dimension_index).
+    """
+    labels = _labels(df[PARTNER_COLUMN])
+    run_starts = np.flatnonzero(np.concatenate([[True], labels[1:] != labels[:-1]])) if len(labels) else np.empty(0, dtype=np.int64)
+    run_stops = np.append(run_starts[1:], len(labels))
+    values, codes = np.unique(labels[run_starts], return_inverse=True)
+    order = np.argsort(codes, kind='stable')
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(values)), out=offsets[1:])
+    return {
+        PARTNER_COLUMN: {'values': values, 'offsets': offsets,
+                         'starts': run_starts[order].astype(np.int64), 'stops': run_stops[order].astype(np.int64)},
+        'batches': {'offsets': _batch_offsets(path)},
+    }
+
+
+def lookup_partner_ranges(index, partner_ids):
+    """{partner id (as given): [(start, stop), ...]} for the ids present in the index."""
+    parts = index[PARTNER_COLUMN]
+    ranges = {}
+    for partner_id in partner_ids:
+        position = np.searchsorted(parts['values'], str(partner_id))
+        if position < len(parts['values']) and parts['values'][position] == str(partner_id):
+            runs = slice(parts['offsets'][position], parts['offsets'][position + 1])
+            ranges[partner_id] = list(zip(parts['starts'][runs].tolist(), parts['stops'][runs].tolist()))
+    return ranges
+
+
+def read_row_ranges(path, index, ranges):
+    """
+    Reads the rows of the given [start, stop) ranges, in order, as a DataFrame. Only the record
+    batches overlapping a range are read (memory-mapped) and decompressed.
+    """
+    batch_offsets = index['batches']['offsets']
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        batches = {}
+        pieces = []
+        for start, stop in ranges:
+            first = int(np.searchsorted(batch_offsets, start, side='right')) - 1
+            last = int(np.searchsorted(batch_offsets, stop, side='left'))
+            for i in range(first, last):
+                if i not in batches:
+                    batches[i] = reader.get_batch(i)
+                lo = max(start, batch_offsets[i]) - batch_offsets[i]
+                hi = min(stop, batch_offsets[i + 1]) - batch_offsets[i]
+                pieces.append(batches[i].slice(lo, hi - lo))
+        table = pa.Table.from_batches(pieces, schema=reader.schema)
+        return table.to_pandas()
@@ -0,0 +1,125 @@
+"""
+Retention of stored files and cleanup of what ingestion leaves behind.
+
+Stored files are kept per source by count (newest first) and by age, measured from their last
+use (upload, append or analysis). Pinned files are always kept. Independently of the limits,
+files nobody tracks are removed once they are older than a grace period: artifacts of file ids not
+in the metadata, temporary and append-* files from interrupted writes, uploads that were never
+cleaned up, problem_table_N.html dumps of tables the parser could not read, and the rotated chat
+trace export.
+"""
+import os
+import re
+import glob
+import time
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# <file_id>.<kind> artifacts, and the append-<id>.feather files of an append in progress
+ARTIFACT_NAME = re.compile(r'^(append-)?[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.')
+PROBLEM_TABLE_PATTERN = 'problem_table_*.html'
+
+
+def parse_source_limits(value):
+    """
+    Per-source limits from '5' (every source) or 'myAffiliate=5,dynamicWorks=3,*=10'.
+    Returns {source or '*': number}; missing or 0 means unlimited.
+    """
+    limits = {}
+    for part in str(value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        source, _, number = part.rpartition('=')
+        limits[source.strip() or '*'] = float(number)
+    return limits
+
+
+def file_last_used(file_info):
+    """When a stored file was last uploaded, appended to or analyzed ('YYYY-MM-DD HH:MM:SS')."""
+    return max(file_info.get(key) or '' for key in ('upload_date', 'last_appended', 'last_accessed'))
+
+
+def plan_retention(files, max_files, max_age_days, pinned=(), now=None):
+    """
+    The stored files the limits remove: {file_id: reason}. files is metadata['files'];
+    max_files / max_age_days are parse_source_limits results.
+    """
+    now = pd.Timestamp.now() if now is None else now
+    by_source = {}
+    for file_id, file_info in files.items():
+        by_source.setdefault(file_info.get('source'), []).append((file_last_used(file_info), file_id))
+
+    removed = {}
+    for source, entries in by_source.items():
+        entries.sort(reverse=True)
+        count_limit = int(max_files.get(source, max_files.get('*', 0)))
+        age_limit = max_age_days.get(source, max_age_days.get('*', 0))
+        kept = 0
+        for last_used, file_id in entries:
+            if file_id in pinned:
+                continue
+            if age_limit and last_used and now - pd.Timestamp(last_used) > pd.Timedelta(days=age_limit):
+                removed[file_id] = f"unused for more than {age_limit:g} days"
+            elif count_limit and kept >= count_limit:
+                removed[file_id] = f"more than {count_limit} {source} files"
+            else:
+                kept += 1
+    return removed
+
+
+def file_artifacts(folder, file_id):
+    """Every file stored for a file id: the processed data, its derived files and leftover temporaries."""
+    return sorted(glob.glob(os.path.join(glob.escape(folder), glob.escape(file_id) + '.*')))
+
+
+def find_stray_files(processed_folder, upload_folder, known_file_ids, older_than_seconds, extra_folders=(),
+                     extra_files=(), now=None):
+    """
+    Files no stored dataset needs, last modified more than older_than_seconds ago: artifacts of
+    unknown file ids, temporaries (*.tmp-*) and append-* files in processed_folder, anything left
+    in upload_folder, problem_table_N.html files in the extra folders, and the extra_files that
+    exist (e.g. the rotated chat trace export). With known_file_ids None (the catalog could not
+    be read) artifacts of unknown ids are kept.
+    """
+    now = time.time() if now is None else now
+    candidates = []
+    for entry in os.scandir(processed_folder) if os.path.isdir(processed_folder) else []:
+        if not entry.is_file() or not ARTIFACT_NAME.match(entry.name):
+            continue
+        if ('.tmp-' in entry.name or entry.name.startswith('append-')
+                or (known_file_ids is not None and entry.name.split('.', 1)[0] not in known_file_ids)):
+            candidates.append(entry.path)
+    for entry in os.scandir(upload_folder) if os.path.isdir(upload_folder) else []:
+        if entry.is_file():
+            candidates.append(entry.path)
+    for folder in extra_folders:
+        candidates.extend(glob.glob(os.path.join(glob.escape(folder), PROBLEM_TABLE_PATTERN)))
+    candidates.extend(path for path in extra_files if os.path.isfile(path))
+
+    stray = []
+    for path in candidates:
+        try:
+            if now - os.path.getmtime(path) > older_than_seconds:
+                stray.append(path)
+        except FileNotFoundError:
+            pass
+    return stray
+
+
+def delete_paths(paths):
+    """Deletes files, returning the bytes freed. Files already gone are skipped."""
+    freed = 0
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning("Could not delete %s: %s", path, e)
+    return freed
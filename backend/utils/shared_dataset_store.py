@@ -0,0 +1,195 @@
+"""
+Processed datasets shared between worker processes through memory-mapped Arrow files.
+
+Processed files are lz4-compressed feather, so every worker that reads one decompresses its own
+copy. With a store directory (ideally on a tmpfs such as /dev/shm), the first worker to need a
+dataset writes it once, uncompressed, as <file_id>.<version>.arrow (version: the processed file's
+mtime); every worker then memory-maps that file and builds its DataFrame on the shared pages
+(numeric, date and string columns are not copied; nullable integer columns are).
+
+Each process holding a dataset keeps a marker file <dataset>.ref-<pid>; the live markers are the
+dataset's reference count. A dataset superseded by a newer version is deleted once no live process
+references it. remove() deletes a file's datasets outright (the file is gone from the metadata);
+processes that still have them mapped keep their pages until they drop the frames.
+"""
+import os
+import glob
+import uuid
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+try:
+    import fcntl
+except ImportError: # Unix only; without it the store is only safe within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ARROW_SUFFIX = '.arrow'
+REF_MARKER = '.ref-'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedDatasetStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, 'store.lock')
+        self._thread_lock = threading.Lock()
+        self._local_refs = {} # dataset path -> references held by this process
+        self.materialized = 0
+        self.attached = 0
+        atexit.register(self.release_all)
+
+    def dataset_path(self, file_id, version):
+        return os.path.join(self.directory, f"{file_id}.{version}{ARROW_SUFFIX}")
+
+    def _marker_path(self, dataset_path):
+        return f"{dataset_path}{REF_MARKER}{os.getpid()}"
+
+    @contextmanager
+    def _locked(self):
+        """Serializes store changes between the threads and processes using the directory."""
+        with self._thread_lock:
+            with open(self._lock_path, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def reference_count(self, dataset_path):
+        """Number of live processes holding the dataset; markers of dead processes are removed."""
+        count = 0
+        for marker in glob.glob(glob.escape(dataset_path) + REF_MARKER + '*'):
+            try:
+                pid = int(marker.rsplit(REF_MARKER, 1)[1])
+            except ValueError:
+                continue
+            if _pid_alive(pid):
+                count += 1
+            else:
+                try:
+                    os.remove(marker)
+                except FileNotFoundError:
+                    pass
+        return count
+
+    def _versions(self, file_id):
+        """{version: dataset path} of the file's datasets in the store."""
+        versions = {}
+        for path in glob.glob(os.path.join(glob.escape(self.directory), f"{glob.escape(file_id)}.*{ARROW_SUFFIX}")):
+            version = os.path.basename(path)[len(file_id) + 1:-len(ARROW_SUFFIX)]
+            if version.isdigit():
+                versions[int(version)] = path
+        return versions
+
+    def _delete_superseded(self, file_id):
+        versions = self._versions(file_id)
+        for version, path in versions.items():
+            if version < max(versions) and self.reference_count(path) == 0:
+                os.remove(path)
+                logger.debug("Deleted superseded shared dataset %s", path)
+
+    def attach(self, file_id, processed_path):
+        """
+        The processed file as a DataFrame on the shared memory-mapped dataset, which is written
+        first if no process has done so for the file's current version. Returns
+        (DataFrame, dataset path); pass the path to release() when the frame is no longer cached.
+        """
+        version = os.stat(processed_path).st_mtime_ns
+        dataset_path = self.dataset_path(file_id, version)
+        with self._locked():
+            if not os.path.exists(dataset_path):
+                table = feather.read_table(processed_path)
+                temp_path = f"{dataset_path}.tmp-{uuid.uuid4().hex[:8]}"
+                try:
+                    with pa.OSFile(temp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+                    os.replace(temp_path, dataset_path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                self.materialized += 1
+                logger.info("Materialized shared dataset %s (%d rows)", dataset_path, table.num_rows)
+                del table
+            if self._local_refs.get(dataset_path, 0) == 0:
+                open(self._marker_path(dataset_path), 'a').close()
+            self._local_refs[dataset_path] = self._local_refs.get(dataset_path, 0) + 1
+            self._delete_superseded(file_id)
+            source = pa.memory_map(dataset_path)
+        self.attached += 1
+        table = pa.ipc.open_file(source).read_all()
+        # split_blocks keeps each column as its own block, so pandas can wrap the mapped buffers
+        return table.to_pandas(split_blocks=True), dataset_path
+
+    def release(self, dataset_path):
+        """Drops one of this process's references; a superseded dataset nobody references is deleted."""
+        file_id = os.path.basename(dataset_path).split('.', 1)[0]
+        with self._locked():
+            remaining = self._local_refs.get(dataset_path, 0) - 1
+            if remaining > 0:
+                self._local_refs[dataset_path] = remaining
+                return
+            self._local_refs.pop(dataset_path, None)
+            try:
+                os.remove(self._marker_path(dataset_path))
+            except FileNotFoundError:
+                pass
+            self._delete_superseded(file_id)
+
+    def remove(self, file_id):
+        """Deletes every dataset of a file removed from the metadata, with all its reference markers."""
+        with self._locked():
+            for path in self._versions(file_id).values():
+                for marker in glob.glob(glob.escape(path) + REF_MARKER + '*'):
+                    try:
+                        os.remove(marker)
+                    except FileNotFoundError:
+                        pass
+                os.remove(path)
+                self._local_refs.pop(path, None)
+                logger.info("Removed shared dataset %s", path)
+
+    def prune(self, known_file_ids):
+        """Deletes the datasets of files that are no longer in the metadata (e.g. deleted while no worker ran)."""
+        file_ids = {os.path.basename(path).split('.', 1)[0]
+                    for path in glob.glob(os.path.join(glob.escape(self.directory), f"*{ARROW_SUFFIX}"))}
+        for file_id in file_ids - set(known_file_ids):
+            self.remove(file_id)
+
+    def release_all(self):
+        """Drops this process's references (at exit)."""
+        for dataset_path in list(self._local_refs):
+            self._local_refs[dataset_path] = 1
+            try:
+                self.release(dataset_path)
+            except OSError:
+                pass
+
+    def stats(self):
+        datasets = glob.glob(os.path.join(glob.escape(self.directory), f"*{ARROW_SUFFIX}"))
+        return {
+            "directory": self.directory,
+            "datasets": len(datasets),
+            "bytes": sum(os.path.getsize(path) for path in datasets if os.path.exists(path)),
+            "held_by_this_process": len(self._local_refs),
+            "materialized": self.materialized,
+            "attached": self.attached,
+        }
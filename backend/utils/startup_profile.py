@@ -0,0 +1,74 @@
+"""
+Measures backend startup cost per subsystem.
+
+Runs `import backend.app` in a fresh interpreter with `python -X importtime`, reports the
+cumulative import time of each heavy dependency, then times the first use of the lazily
+initialized subsystems (Excel parser, chat agent).
+
+Usage (from the repository root):
+    python -m backend.utils.startup_profile
+"""
+import os
+import re
+import sys
+import json
+import subprocess
+
+# Top-level modules whose cumulative import time is reported
+SUBSYSTEM_MODULES = [
+    'pandas', 'numpy', 'pyarrow', 'flask', 'flask_cors', 'dotenv',
+    'langchain_core', 'pydantic', 'langchain', 'langchain_openai', 'openai', 'unstructured',
+    'backend.analysis.chatbot_service', 'backend.utils.file_parser', 'backend.app',
+]
+
+LAZY_INIT_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import backend.app
+app_import = time.perf_counter() - started
+from backend.utils.file_parser import partition_xlsx_loader
+from backend.analysis.chatbot_service import chat_agent_loader
+from backend.utils.lazy_loader import get_lazy_init_timings
+for loader in (partition_xlsx_loader, chat_agent_loader):
+    try:
+        loader.get()
+    except Exception as e:
+        print(json.dumps({"failed": loader.name, "error": str(e)}))
+print("LAZY_TIMINGS " + json.dumps({"app_import": app_import, **get_lazy_init_timings()}))
+"""
+
+
+def parse_importtime(stderr_output):
+    """Returns {module: cumulative seconds} from `python -X importtime` output."""
+    cumulative = {}
+    for line in stderr_output.splitlines():
+        match = re.match(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(.+)$", line)
+        if match:
+            module_name = match.group(3).strip()
+            # A module can appear once; keep the largest value if it shows up nested
+            cumulative[module_name] = max(cumulative.get(module_name, 0), int(match.group(2)) / 1e6)
+    return cumulative
+
+
+def profile_startup():
+    env = dict(os.environ)
+    importtime_run = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import backend.app'],
+                                    capture_output=True, text=True, env=env)
+    cumulative = parse_importtime(importtime_run.stderr)
+    eager_imports = {name: round(cumulative[name], 4) for name in SUBSYSTEM_MODULES if name in cumulative}
+
+    lazy_run = subprocess.run([sys.executable, '-c', LAZY_INIT_SCRIPT], capture_output=True, text=True, env=env)
+    lazy_timings = {}
+    for line in lazy_run.stdout.splitlines():
+        if line.startswith("LAZY_TIMINGS "):
+            lazy_timings = {name: round(value, 4) for name, value in json.loads(line[len("LAZY_TIMINGS "):]).items()}
+
+    return {
+        "eager_import_seconds": eager_imports,
+        "lazy_init_seconds": lazy_timings,
+        "not_imported_at_startup": [name for name in SUBSYSTEM_MODULES if name not in cumulative],
+    }
+
+
+if __name__ == '__main__':
+    print(json.dumps(profile_startup(), indent=2))
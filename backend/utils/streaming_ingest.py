@@ -0,0 +1,158 @@
+"""
+Streaming ingest for workbooks too large to parse in one piece.
+
+parse_excel holds the partitioned elements, their HTML, the wide frame, the melted frame and the
+pivot in memory together. Here the sheet is read with openpyxl in read-only mode, a batch of partner
+rows at a time; each batch goes through the usual transform_parsed_dataframe and is appended to the
+processed Arrow IPC (feather) file, so peak memory depends on the batch size, not the workbook size.
+(The upload still reads the finished file back once, in its compact dtypes, for the sidecars and
+the analysis it answers with; see ingest_workbook.)
+The sheet must have the standard layout: a two-row Metric / Date header, then one row per partner.
+"""
+import os
+import uuid
+import logging
+
+import pandas as pd
+import pyarrow as pa
+
+from backend.utils.data_transformer import transform_parsed_dataframe, clean_multiindex_header, METRIC_RENAME_MAP
+from backend.utils.metrics import time_stage
+from backend.utils.metric_dtypes import metric_narrowing, compact_metric_dtypes
+
+logger = logging.getLogger(__name__)
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def header_columns(level0_row, level1_row):
+    """
+    The two-level column header as parse_excel reads it: blank cells (the continuation of merged
+    metric cells, and the ID columns' top row) become 'Unnamed: N_level_0' / 'Unnamed: N_level_1'.
+    """
+    width = max(len(level0_row), len(level1_row))
+    level0_row = tuple(level0_row) + (None,) * (width - len(level0_row))
+    level1_row = tuple(level1_row) + (None,) * (width - len(level1_row))
+    return pd.MultiIndex.from_tuples([
+        (f'Unnamed: {i}_level_0' if _is_blank(level0) else level0,
+         f'Unnamed: {i}_level_1' if _is_blank(level1) else level1)
+        for i, (level0, level1) in enumerate(zip(level0_row, level1_row))
+    ])
+
+
+def iter_wide_batches(file_path, batch_rows):
+    """Yields the active sheet as wide DataFrames (two-level header) of at most batch_rows partner rows."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = []
+        for row in rows:
+            if not all(_is_blank(value) for value in row):
+                header.append(row)
+                if len(header) == 2:
+                    break
+        if len(header) < 2:
+            raise ValueError("The sheet has no two-row Metric / Date header")
+        columns = header_columns(*header)
+        width = len(columns)
+
+        batch = []
+        for row in rows:
+            if all(_is_blank(value) for value in row):
+                continue
+            batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+            if len(batch) >= batch_rows:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def _metric_columns(columns):
+    """Processed metric column names for a header, in the order the pivot in reshape_to_long gives them."""
+    cleaned = clean_multiindex_header(pd.DataFrame(columns=columns)).columns
+    metrics = sorted({str(metric) for metric in cleaned.get_level_values('Metric')[3:]})
+    return [METRIC_RENAME_MAP.get(metric, metric) for metric in metrics]
+
+
+def _compact_file(raw_path, output_path, narrowing):
+    """Rewrites the float64 Arrow IPC file raw_path into output_path with the metric columns narrowed, a record batch at a time."""
+    writer = None
+    try:
+        with pa.memory_map(raw_path) as source_file:
+            reader = pa.ipc.open_file(source_file)
+            for i in range(reader.num_record_batches):
+                df_batch = compact_metric_dtypes(reader.get_batch(i).to_pandas(), narrowing=narrowing)
+                if writer is None:
+                    schema = pa.Schema.from_pandas(df_batch, preserve_index=False)
+                    writer = pa.ipc.new_file(output_path, schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+                writer.write_table(pa.Table.from_pandas(df_batch, schema=schema, preserve_index=False))
+                del df_batch
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def stream_workbook_to_feather(file_path, output_path, source, batch_rows=2000):
+    """
+    Transforms a workbook batch by batch into the processed long format (plus DataSource) and
+    writes it to output_path as one Arrow IPC file. The schema is fixed by the header and the first
+    batch: every metric column is written as float64, even where a batch has no values for it, and
+    each batch is checked against METRIC_DTYPE_POLICY; the columns every batch can narrow are then
+    narrowed in a second pass over the written batches, so the stored file has the same dtypes as
+    a parsed workbook's without the whole frame ever being in memory. The file is written to
+    temporary paths and renamed, so a failure leaves nothing behind.
+    Returns the number of processed rows. Raises on a sheet without the standard layout.
+    """
+    temp_path = f"{output_path}.tmp-{uuid.uuid4().hex[:8]}"
+    raw_path = f"{temp_path}.raw"
+    writer = None
+    schema = None
+    narrowing = None
+    row_count = 0
+    batch_count = 0
+    try:
+        for wide in iter_wide_batches(file_path, batch_rows):
+            df_batch = transform_parsed_dataframe(wide)
+            df_batch['DataSource'] = source
+            if schema is None:
+                metrics = _metric_columns(wide.columns)
+                columns = ['Partner ID', 'Country', 'Region', 'Date', *metrics, 'DataSource']
+                df_batch = df_batch.reindex(columns=columns)
+                df_batch[metrics] = df_batch[metrics].astype('float64')
+                schema = pa.Schema.from_pandas(df_batch, preserve_index=False)
+                writer = pa.ipc.new_file(raw_path, schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+            df_batch = df_batch.reindex(columns=schema.names)
+            batch_narrowing = metric_narrowing(df_batch.astype({metric: 'float64' for metric in metrics}))
+            narrowing = batch_narrowing if narrowing is None else {
+                column: dtype for column, dtype in narrowing.items() if column in batch_narrowing}
+            with time_stage("feather_write"):
+                writer.write_table(pa.Table.from_pandas(df_batch, schema=schema, preserve_index=False))
+            row_count += len(df_batch)
+            batch_count += 1
+            del wide, df_batch
+        if writer is None:
+            raise ValueError("The sheet has no data rows")
+        writer.close()
+        writer = None
+        if narrowing:
+            with time_stage("feather_write"):
+                _compact_file(raw_path, temp_path, narrowing)
+            os.replace(temp_path, output_path)
+        else:
+            os.replace(raw_path, output_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        for path in (raw_path, temp_path):
+            if os.path.exists(path):
+                os.remove(path)
+    logger.info("Streamed %s into %d processed rows in %d batches of up to %d partners (narrowed: %s)",
+                file_path, row_count, batch_count, batch_rows, sorted(narrowing or {}))
+    return row_count
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextlib
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def _new_id():
+    return uuid.uuid4().hex[:16]
+
+
+class Trace:
+    """
+    One traced operation (e.g. a single chatbot answer): a root span plus child spans for each
+    LLM call and tool run. Spans are plain dicts so a trace serializes straight to JSON.
+    Spans may be added from other threads (the streaming agent runs on a worker thread).
+    """
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = _new_id()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.root = {"span_id": _new_id(), "parent_id": None, "name": name, "kind": "root",
+                     "start_offset_ms": 0.0, "duration_ms": None, "attributes": dict(attributes or {})}
+        self.spans = [self.root]
+        self._lock = threading.Lock()
+
+    def offset_ms(self):
+        return round((time.perf_counter() - self._started) * 1000, 2)
+
+    def start_span(self, name, kind, attributes=None, parent_id=None):
+        span = {"span_id": _new_id(), "parent_id": parent_id or self.root["span_id"], "name": name, "kind": kind,
+                "start_offset_ms": self.offset_ms(), "duration_ms": None, "attributes": dict(attributes or {})}
+        span["_started"] = time.perf_counter()
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def end_span(self, span, error=None, **attributes):
+        started = span.pop("_started", None)
+        if started is not None:
+            span["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        span["attributes"].update(attributes)
+        if error is not None:
+            span["error"] = str(error)
+
+    @contextlib.contextmanager
+    def span(self, name, kind, attributes=None):
+        span = self.start_span(name, kind, attributes)
+        try:
+            yield span
+        except Exception as e:
+            self.end_span(span, error=e)
+            raise
+        self.end_span(span)
+
+    def set_attributes(self, **attributes):
+        self.root["attributes"].update(attributes)
+
+    def finish(self, error=None):
+        self.root["duration_ms"] = self.offset_ms()
+        if error is not None:
+            self.root["error"] = str(error)
+
+    def summary(self):
+        """Totals per span kind, so slow traces can be attributed to LLM time vs tool time at a glance."""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans[1:])
+        for span in spans:
+            kind_totals = totals.setdefault(span["kind"], {"count": 0, "duration_ms": 0.0})
+            kind_totals["count"] += 1
+            kind_totals["duration_ms"] = round(kind_totals["duration_ms"] + (span["duration_ms"] or 0.0), 2)
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = [{key: value for key, value in span.items() if key != "_started"} for span in self.spans]
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root["name"],
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "duration_ms": self.root["duration_ms"],
+            "error": self.root.get("error"),
+            "attributes": self.root["attributes"],
+            "totals": self.summary(),
+            "spans": spans,
+        }
+
+
+class TraceStore:
+    """
+    Keeps the most recent finished traces in memory and appends each one to a JSONL file. When the
+    file reaches max_file_bytes it is renamed to rotated_path (replacing the previous one) and a new
+    file is started, so the exported traces never take more than about twice max_file_bytes.
+    """
+
+    def __init__(self, max_traces=200, export_path=None, max_file_bytes=10 * 1024 * 1024):
+        self.max_traces = max_traces
+        self.export_path = export_path
+        self.rotated_path = f"{export_path}.1" if export_path else None
+        self.max_file_bytes = max_file_bytes
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+        if export_path:
+            os.makedirs(os.path.dirname(export_path) or ".", exist_ok=True)
+
+    def record(self, trace):
+        trace_dict = trace.to_dict()
+        with self._lock:
+            self._traces.append(trace_dict)
+            if self.export_path:
+                try:
+                    with open(self.export_path, "a") as f:
+                        f.write(json.dumps(trace_dict, default=str) + "\n")
+                        size = f.tell()
+                    if self.max_file_bytes and size >= self.max_file_bytes:
+                        os.replace(self.export_path, self.rotated_path)
+                except OSError as e:
+                    logger.warning("Failed to export trace %s: %s", trace.trace_id, e)
+        return trace_dict
+
+    def list(self, limit=50):
+        """Most recent traces first, without their spans."""
+        with self._lock:
+            traces = list(self._traces)[-limit:]
+        return [{key: value for key, value in t.items() if key != "spans"} for t in reversed(traces)]
+
+    def get(self, trace_id):
+        with self._lock:
+            return next((t for t in self._traces if t["trace_id"] == trace_id), None)
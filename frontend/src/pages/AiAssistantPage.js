@@ -81,8 +81,11 @@ function AiAssistantPage() {
     setIsLoading(true);
     
     try {
-      // Get current messages to send as chat history (excluding the new user message we just added)
-      const currentMessages = [...messages]; 
+      // History is kept server-side per conversation; the full client history is only sent
+      // to seed a new conversation (e.g. messages restored from sessionStorage), or when the
+      // server no longer knows the conversation (restart, eviction, another worker)
+      const conversationId = sessionStorage.getItem('aiAssistantConversationId');
+      const currentMessages = conversationId ? [] : [...messages];
       
       // Send the message to the backend with chat history and data source
       // Include both file IDs when in combined mode
@@ -92,6 +95,9 @@ function AiAssistantPage() {
         chatHistory: currentMessages,
         source: dataSource,
       };
+      if (conversationId) {
+        payload.conversationId = conversationId;
+      }
       
       // Add both file IDs when in combined mode for comprehensive analysis
       if (dataSource === 'combined' && myAffiliateId && dynamicWorksId) {
@@ -100,7 +106,19 @@ function AiAssistantPage() {
         payload.combinedAnalysis = true;
       }
       
-      const response = await sendMessageToChatbot(currentFileId, input, currentMessages, dataSource, payload);
+      let response;
+      try {
+        response = await sendMessageToChatbot(currentFileId, input, currentMessages, dataSource, payload);
+      } catch (error) {
+        if (!error.response || error.response.status !== 409 || !error.response.data.conversationReset) {
+          throw error;
+        }
+        const history = [...messages];
+        response = await sendMessageToChatbot(currentFileId, input, history, dataSource, { ...payload, chatHistory: history });
+      }
+      if (response.data.conversationId) {
+        sessionStorage.setItem('aiAssistantConversationId', response.data.conversationId);
+      }
       const botMessage = { 
         sender: 'bot', 
         text: response.data.answer || "I couldn't process your request. Please try again."
@@ -123,6 +141,7 @@ function AiAssistantPage() {
   const clearConversation = () => {
     const confirmClear = window.confirm("Are you sure you want to clear the entire conversation?");
     if (confirmClear) {
+      sessionStorage.removeItem('aiAssistantConversationId');
       setMessages([{ 
         sender: 'bot', 
         text: 'Conversation cleared. How else can I help you with your data analysis?' 
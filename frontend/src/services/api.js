@@ -9,10 +9,16 @@ const apiClient = axios.create({
   },
 });
 
-export const uploadFile = (file, source) => {
+// With targetFileId, the workbook's rows are merged into that stored file (new months added,
+// overlapping partner-months replaced) instead of creating a new file.
+export const uploadFile = (file, source, targetFileId = null) => {
   const formData = new FormData();
   formData.append('file', file);
   formData.append('source', source);
+  if (targetFileId) {
+    formData.append('mode', 'append');
+    formData.append('targetFileId', targetFileId);
+  }
 
   return apiClient.post('/upload', formData, {
     headers: {
@@ -40,6 +46,29 @@ export const getTopPartner = (fileId, metric, year, month, source = null) => {
   return apiClient.post('/get-top-partner', payload);
 };
 
+// Top or bottom n partners by a metric; omit year/month for the whole file, region to rank across all regions
+export const getLeaderboard = (fileId, metric, { n = 10, direction = 'top', year = null, month = null, region = null } = {}) => {
+  const params = { metric, n, direction };
+  if (year && month) {
+    params.year = year;
+    params.month = month;
+  }
+  if (region) {
+    params.region = region;
+  }
+  return apiClient.get(`/leaderboard/${fileId}`, { params });
+};
+
+// Per-date metric history of one or more partners for side-by-side charts; metrics defaults to every metric
+export const getPartnerTimeseries = (fileId, partnerIds, metrics = null) => {
+  const ids = Array.isArray(partnerIds) ? partnerIds.join(',') : partnerIds;
+  const params = { fileId };
+  if (metrics && metrics.length) {
+    params.metrics = metrics.join(',');
+  }
+  return apiClient.get(`/partner/${encodeURIComponent(ids)}/timeseries`, { params });
+};
+
 export const getComparisonData = (metricsToCompare, timeframe = 'monthly') => {
   const myAffiliateId = sessionStorage.getItem('myAffiliateId');
   const dynamicWorksId = sessionStorage.getItem('dynamicWorksId');
@@ -56,6 +85,27 @@ export const getComparisonData = (metricsToCompare, timeframe = 'monthly') => {
   });
 };
 
+// view: 'myAffiliate', 'dynamicWorks', 'both' or 'difference' (myAffiliate - dynamicWorks)
+export const getSourceAnalysis = (view = 'both', startDate = null, endDate = null) => {
+  const payload = {
+    view,
+    myAffiliateId: sessionStorage.getItem('myAffiliateId'),
+    dynamicWorksId: sessionStorage.getItem('dynamicWorksId')
+  };
+  if (startDate && endDate) {
+    payload.startDate = startDate;
+    payload.endDate = endDate;
+  }
+  return apiClient.post('/get-source-analysis', payload);
+};
+
+// Declarative aggregation, e.g. { fileId, dimensions: ['Country', 'month'], metrics: [{ column: 'Deriv Revenue', agg: 'sum' }],
+// filters: [{ column: 'Region', op: 'in', value: ['Asia'] }], sort: [{ column: 'Deriv Revenue_sum', desc: true }], limit: 10 }.
+// Results are columnar: { columns, data: [[values of columns[0]], ...] }.
+export const runQuery = (query) => {
+  return apiClient.post('/query', query);
+};
+
 export const sendMessageToChatbot = (fileId, query, chatHistory = [], source = null, additionalParams = {}) => {
   // Base payload
   const payload = { 
@@ -78,6 +128,53 @@ export const sendMessageToChatbot = (fileId, query, chatHistory = [], source = n
   return apiClient.post('/chat', payload);
 };
 
+// Streams a chat answer from /chat/stream (server-sent events).
+// onEvent is called with (eventName, data) for 'tool_start', 'tool_end', 'token', 'done' and 'error'.
+// Pass the conversationId from a previous response to continue a server-side conversation. If the
+// server no longer knows it, the error thrown has conversationReset set: resend with the full chatHistory.
+export const streamMessageToChatbot = async (fileId, query, chatHistory = [], onEvent = () => {}, conversationId = null) => {
+  const payload = { fileId, query, chat_history: chatHistory };
+  if (conversationId) {
+    payload.conversationId = conversationId;
+  }
+  const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(payload),
+  });
+  if (response.status === 409) {
+    const body = await response.json();
+    if (body.conversationReset) {
+      const error = new Error(body.error);
+      error.conversationReset = true;
+      throw error;
+    }
+  }
+  if (!response.ok || !response.body) {
+    throw new Error(`Streaming chat request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split('\n\n');
+    buffer = events.pop();
+    events.forEach((rawEvent) => {
+      let eventName = 'message';
+      let data = '';
+      rawEvent.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) eventName = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      onEvent(eventName, data ? JSON.parse(data) : null);
+    });
+  }
+};
+
 export const getTeamRegions = (fileId) => {
   return apiClient.get(`/get-team-regions/${fileId}`);
 };